@@ -0,0 +1,120 @@
+"""
+Concurrent request latency through the API wrapper.
+
+Fires `--sessions` chat completions at once (one per session, so they land on
+different workers) and, while they run, probes `/v1/models` every `--probe-interval`
+seconds. With a bridge that blocks the event loop, the probes (and the other
+sessions) queue up behind each turn; with a non-blocking bridge they stay flat.
+
+The workflow is replaced by `fake_workflow.py`, so no API keys are needed:
+
+    python benchmarks/bridge_latency.py --sessions 8 --turn-seconds 1
+
+Point `--src` at another checkout's `src/` directory to compare revisions, e.g. the
+blocking bridge of the first commit:
+
+    git worktree add /tmp/before <commit>
+    python benchmarks/bridge_latency.py --src /tmp/before/src
+
+Checkouts without `ipc.py` read the workflow's stdout for colored replies and the `> `
+prompt; for them the fake workflow speaks that protocol, and runs as `workflows.py` in
+a scratch directory for the revisions that only start a script by that name. The
+response cache is turned off, so every turn reaches the workflow.
+"""
+import argparse
+import asyncio
+import importlib.util
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+import httpx
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def load_app(src_dir: str):
+    sys.path.insert(0, src_dir)
+    spec = importlib.util.spec_from_file_location("api_wrapper", os.path.join(src_dir, "api-wrapper.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module.app
+
+
+def summarize(name: str, latencies: list):
+    latencies = sorted(latencies)
+    p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+    print(f"{name:<18} n={len(latencies):<4} p50={statistics.median(latencies) * 1000:8.1f}ms "
+          f"p95={p95 * 1000:8.1f}ms max={latencies[-1] * 1000:8.1f}ms")
+
+
+def use_markers_protocol() -> str:
+    """Run the fake workflow as `workflows.py`, speaking the protocol from before `ipc.py`."""
+    os.environ["FAKE_PROTOCOL"] = "markers"
+    workdir = tempfile.mkdtemp(prefix="bridge-latency-")
+    script = os.path.join(workdir, "workflows.py")
+    with open(script, "w") as f:
+        f.write(f"import runpy\nrunpy.run_path({os.path.join(HERE, 'fake_workflow.py')!r}, run_name='__main__')\n")
+    os.chdir(workdir)
+    return script
+
+
+async def run(args):
+    src = os.path.abspath(args.src)
+    if os.path.exists(os.path.join(src, "ipc.py")):
+        os.environ["WORKFLOW_SCRIPT"] = os.path.join(HERE, "fake_workflow.py")
+    else:
+        os.environ["WORKFLOW_SCRIPT"] = use_markers_protocol()
+    os.environ["WORKFLOW_WORKERS"] = str(args.sessions)
+    os.environ["FAKE_TURN_SECONDS"] = str(args.turn_seconds)
+    os.environ["RESPONSE_CACHE_SIZE"] = "0"
+    app = load_app(src)
+
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            # one warm-up turn per session so the greeting is not part of the measurement
+            await asyncio.gather(*(chat(client, f"session-{i}") for i in range(args.sessions)))
+
+            done = asyncio.Event()
+            probes = []
+
+            async def probe():
+                while not done.is_set():
+                    start = time.perf_counter()
+                    await client.get("/v1/models")
+                    probes.append(time.perf_counter() - start)
+                    await asyncio.sleep(args.probe_interval)
+
+            probe_task = asyncio.create_task(probe())
+            start = time.perf_counter()
+            turns = await asyncio.gather(*(chat(client, f"session-{i}") for i in range(args.sessions)))
+            wall = time.perf_counter() - start
+            done.set()
+            await probe_task
+
+    print(f"{args.sessions} concurrent turns of {args.turn_seconds}s, wall time {wall:.2f}s")
+    summarize("chat turn", turns)
+    summarize("/v1/models probe", probes)
+
+
+async def chat(client: httpx.AsyncClient, session_id: str) -> float:
+    start = time.perf_counter()
+    response = await client.post(
+        "/v1/chat/completions",
+        json={"model": "gpt-4", "messages": [{"role": "user", "content": "Build me a Streamlit app on AWS"}]},
+        headers={"X-Session-ID": session_id, "Content-Type": "application/json"},
+    )
+    response.raise_for_status()
+    return time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--src", default=os.path.join(HERE, "..", "src"))
+    parser.add_argument("--sessions", type=int, default=8)
+    parser.add_argument("--turn-seconds", type=float, default=1.0)
+    parser.add_argument("--probe-interval", type=float, default=0.05)
+    asyncio.run(run(parser.parse_args()))
@@ -0,0 +1,83 @@
+"""
+Import cost of a generated diagram script: `from importall import *` against the
+explicit imports `importall.explicit_imports` rewrites it to.
+
+Takes a script like the one generated for the README's use case (or `--script`), and
+in a fresh interpreter per run times only its import statements, which is what every
+run of a generated script pays before it draws anything.
+
+    python benchmarks/diagram_imports.py --runs 10
+"""
+import argparse
+import ast
+import os
+import statistics
+import subprocess
+import sys
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+SRC = os.path.join(HERE, "..", "src")
+
+# what a generated script for the README's Streamlit/S3 use case looks like
+EXAMPLE = """\
+from diagrams import Diagram, Cluster, Edge
+from importall import *
+
+with Diagram("Streamlit ML application", show=False, filename="output_diagram"):
+    users = Users("500k daily users")
+    cdn = CloudFront("CloudFront")
+    lb = ELB("Application Load Balancer")
+    with Cluster("ECS cluster (r5.4xlarge, 80GB)"):
+        app = [ECS("streamlit-1"), ECS("streamlit-2")]
+    registry = EC2ContainerRegistry("ECR")
+    cache = ElastiCache("ElastiCache")
+    output = S3("output bucket")
+    logs = Cloudwatch("CloudWatch")
+
+    users >> cdn >> lb >> app
+    app >> Edge(label="writes") >> output
+    app >> cache
+    registry >> app
+    app >> logs
+"""
+
+TIMER = """\
+import sys, time
+start = time.perf_counter()
+exec(compile(sys.argv[1], "script", "exec"), {"__name__": "__script__"})
+print((time.perf_counter() - start) * 1000, sum(1 for m in sys.modules if m.startswith("diagrams.")))
+"""
+
+
+def import_statements(code: str) -> str:
+    tree = ast.parse(code)
+    return "\n".join(ast.unparse(node) for node in tree.body if isinstance(node, (ast.Import, ast.ImportFrom)))
+
+
+def measure(imports: str, runs: int) -> tuple:
+    times, modules = [], 0
+    for _ in range(runs):
+        result = subprocess.run([sys.executable, "-c", TIMER, imports], cwd=SRC, capture_output=True,
+                                text=True, check=True)
+        ms, modules = result.stdout.split()
+        times.append(float(ms))
+    return statistics.median(times), min(times), int(modules)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--script", help="a generated script to measure instead of the example")
+    parser.add_argument("--runs", type=int, default=10)
+    args = parser.parse_args()
+
+    code = open(args.script).read() if args.script else EXAMPLE
+    sys.path.insert(0, SRC)
+    from importall import explicit_imports
+
+    for name, variant in (("star import", code), ("explicit imports", explicit_imports(code))):
+        median, best, modules = measure(import_statements(variant), args.runs)
+        print(f"{name:<18} median {median:7.1f}ms  min {best:7.1f}ms  {modules:>3} diagrams modules loaded")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,41 @@
+"""
+Stand-in for `workflows.py` used by the benchmarks.
+
+It speaks the same protocol as the real workflow (see `src/ipc.py`) but replaces
+every LLM turn with a reply streamed word by word over FAKE_TURN_SECONDS. With
+FAKE_PROTOCOL=markers it speaks the protocol from before `ipc.py` instead: replies
+printed in magenta, then an `input("> ")` prompt.
+"""
+import os
+import sys
+import time
+
+TURN_SECONDS = float(os.environ.get("FAKE_TURN_SECONDS", "1.0"))
+GREETING = "Hello! I can help you design, diagram and price an AWS architecture."
+
+if os.environ.get("FAKE_PROTOCOL") == "markers":
+    def respond(text):
+        print("\x1b[35m" + text + "\x1b[0m", flush=True)
+
+    ask = input
+    stream = False
+else:
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+    import ipc
+
+    ipc.install_from_env()
+    respond, ask, stream = ipc.respond, ipc.ask, True
+
+respond(GREETING + ("\n" if stream else ""))
+while True:
+    try:
+        user_msg_str = ask("> ").strip()
+    except EOFError:
+        break
+    print(f"Orchestrator received request: {user_msg_str}", flush=True)
+    words = f"Here is the plan for: {user_msg_str}".split(" ")
+    for word in words:
+        time.sleep(TURN_SECONDS / len(words))
+        if stream:
+            respond(word + " ")
+    respond("\n" if stream else " ".join(words))
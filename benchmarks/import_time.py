@@ -0,0 +1,77 @@
+"""
+Cold-start import time of the workflow modules, from `python -X importtime`.
+
+Every worker the API wrapper spawns imports the workflow before it can answer, so its
+import time is paid on every spawn and every restart. This imports each module in a
+fresh interpreter `--runs` times and reports the median, and which top-level packages
+the time goes to (from the last run).
+
+    python benchmarks/import_time.py w2
+    python benchmarks/import_time.py w2 --budget-ms 4000
+
+With `--budget-ms`, it exits with status 1 when a module's median is over budget, so it
+can run in CI. Point `--src` at another checkout's `src/` directory to compare revisions.
+"""
+import argparse
+import collections
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def import_time(module: str, src_dir: str) -> tuple:
+    """Import `module` in a new interpreter; returns its total import time (µs) and µs per top-level package."""
+    env = {**os.environ, "PYTHONPATH": src_dir}
+    # some modules write files into the working directory on import
+    with tempfile.TemporaryDirectory() as cwd:
+        result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                                cwd=cwd, env=env, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{result.stderr[-2000:]}")
+
+    total = 0
+    packages = collections.Counter()
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        fields = [field.strip() for field in line[len("import time:"):].split("|")]
+        if not fields[0].isdigit():
+            continue  # the header
+        self_us, cumulative_us, name = int(fields[0]), int(fields[1]), fields[2]
+        packages[name.split(".")[0]] += self_us
+        if name == module:
+            total = cumulative_us
+    return total, packages
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("modules", nargs="*", default=["w2"])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10, help="packages to list per module")
+    parser.add_argument("--budget-ms", type=float, help="fail when a module takes longer")
+    parser.add_argument("--src", default=os.path.join(HERE, "..", "src"))
+    args = parser.parse_args()
+
+    over_budget = False
+    for module in args.modules:
+        totals = []
+        for _ in range(args.runs):
+            total, packages = import_time(module, os.path.abspath(args.src))
+            totals.append(total / 1000)
+        median = statistics.median(totals)
+        print(f"{module:<20} median {median:8.1f}ms  min {min(totals):8.1f}ms  max {max(totals):8.1f}ms")
+        for package, us in packages.most_common(args.top):
+            print(f"    {package:<30} {us / 1000:8.1f}ms")
+        if args.budget_ms is not None and median > args.budget_ms:
+            print(f"{module} is over the budget of {args.budget_ms:.0f}ms")
+            over_budget = True
+    sys.exit(1 if over_budget else 0)
+
+
+if __name__ == "__main__":
+    main()
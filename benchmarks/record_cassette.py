@@ -0,0 +1,210 @@
+"""
+Record the README's use case into a cassette for `workflow_overhead.py`.
+
+Runs `w2.py` through the Streamlit/S3 conversation in `TURNS` with
+LLM_CASSETTE_MODE=record. By default the LLM calls go to a scripted server started
+here, speaking both the OpenAI and the Anthropic API, so no API key is needed and the
+recording is the same every time. The scripted orchestrator routes each request the
+intent router leaves to it by its words (`ROUTES`). Every agent calls its own tool,
+then `done`, and everything else gets a short text. The diagram agent's tool asks
+the Anthropic model for `DIAGRAM_CODE` and renders it in the sandbox (with graphviz
+installed; without it the tool reports the error, and the agents carry on the same).
+
+    python benchmarks/record_cassette.py
+
+`--live` records against the real APIs instead (OPENAI_API_KEY and ANTHROPIC_API_KEY
+must be set), for timings of real LLM latencies to replay with
+LLM_CASSETTE_LATENCY=recorded.
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import sys
+import tempfile
+import threading
+import time
+import uuid
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+SRC = os.path.join(HERE, "..", "src")
+DEFAULT_CASSETTE = os.path.join(HERE, "cassettes", "streamlit_s3.jsonl")
+
+USE_CASE = (
+    "I need to deploy a machine learning Streamlit application. It writes its output to an S3 "
+    "bucket, needs 80GB of memory, the scripts run in Docker containers, and 500,000 people "
+    "will use it daily. Help me build an AWS system architecture."
+)
+TURNS = [
+    USE_CASE,
+    "Draw the architecture diagram for these requirements.",
+    "Look up the price of every service in the architecture.",
+    "Generate the report.",
+    "exit",
+]
+# the orchestrator tool the scripted model calls for a request containing a word;
+# anything else goes to the RAG agent
+ROUTES = (("diagram", "emit_text_to_diagram"), ("price", "emit_price_lookup"), ("report", "emit_report"))
+# the agent tools the scripted model calls, and the arguments it passes
+TOOL_ARGUMENTS = {"lookup_price": {"name": "Amazon S3"}, "search_rag": {"text": USE_CASE},
+                  "generate_diagram": {"text": USE_CASE}}
+# what the scripted Anthropic model writes for the diagram
+DIAGRAM_CODE = """\
+from diagrams import Diagram, Cluster, Edge
+from importall import *
+
+with Diagram("Streamlit ML application", show=False, filename="output_diagram"):
+    users = Users("500k daily users")
+    lb = ELB("Application Load Balancer")
+    with Cluster("ECS cluster (80GB)"):
+        app = [ECS("streamlit-1"), ECS("streamlit-2")]
+    output = S3("output bucket")
+
+    users >> lb >> app
+    app >> Edge(label="writes") >> output
+"""
+SCRIPTED_DELAY = 0.05
+
+
+def scripted_message(body: dict) -> dict:
+    """The assistant message the scripted model answers a chat completion request with."""
+    tools = [tool["function"]["name"] for tool in body.get("tools") or []]
+    messages = body["messages"]
+    last = messages[-1]
+    since_user = messages[max(i for i, m in enumerate(messages) if m["role"] == "user"):]
+    called = [call["function"]["name"] for m in since_user if m["role"] == "assistant"
+              for call in m.get("tool_calls") or []]
+    if "emit_text_to_rag" in tools:
+        # the orchestrator: route, then report back
+        if last["role"] == "user":
+            request = last["content"].lower()
+            return tool_call(next((tool for word, tool in ROUTES if word in request), "emit_text_to_rag"), {})
+        return {"role": "assistant", "content": "The agent is on it."}
+    own = [name for name in tools if name in TOOL_ARGUMENTS or name == "report"]
+    if "done" in tools:
+        # an agent: its own tool, then done, then a summary
+        if own and not called:
+            return tool_call(own[0], TOOL_ARGUMENTS.get(own[0], {}))
+        if "done" not in called:
+            return tool_call("done", {})
+        return {"role": "assistant", "content": "Done, anything else?"}
+    return {"role": "assistant",
+            "content": "Hello! I can take your requirements, search the knowledge base, draw the "
+                       "architecture diagram, look up prices and generate a report."}
+
+
+def tool_call(name: str, arguments: dict) -> dict:
+    return {"role": "assistant", "content": None,
+            "tool_calls": [{"id": f"call_{uuid.uuid4().hex[:12]}", "type": "function",
+                            "function": {"name": name, "arguments": json.dumps(arguments)}}]}
+
+
+def scripted_app():
+    from fastapi import FastAPI, Request
+    from fastapi.responses import JSONResponse, StreamingResponse
+
+    app = FastAPI()
+
+    @app.post("/v1/messages")
+    async def messages(request: Request):
+        # the Anthropic model, which only writes diagram code
+        body = await request.json()
+        await asyncio.sleep(SCRIPTED_DELAY)
+        return JSONResponse({"id": f"msg_{uuid.uuid4().hex[:12]}", "type": "message", "role": "assistant",
+                             "model": body["model"], "stop_reason": "end_turn", "stop_sequence": None,
+                             "content": [{"type": "text", "text": f"```python\n{DIAGRAM_CODE}```"}],
+                             "usage": {"input_tokens": 100, "output_tokens": 200}})
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        message = scripted_message(body)
+        await asyncio.sleep(SCRIPTED_DELAY)
+        common = {"id": f"chatcmpl-{uuid.uuid4().hex[:12]}", "created": int(time.time()), "model": body["model"]}
+        finish = "tool_calls" if message.get("tool_calls") else "stop"
+        if not body.get("stream"):
+            return JSONResponse({**common, "object": "chat.completion",
+                                 "choices": [{"index": 0, "message": message, "finish_reason": finish}],
+                                 "usage": {"prompt_tokens": 100, "completion_tokens": 20, "total_tokens": 120}})
+
+        def chunk(delta: dict, finish_reason=None) -> str:
+            data = {**common, "object": "chat.completion.chunk",
+                    "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]}
+            return f"data: {json.dumps(data)}\n\n"
+
+        def events():
+            if message.get("tool_calls"):
+                call = message["tool_calls"][0]
+                yield chunk({"role": "assistant", "tool_calls": [{"index": 0, **call}]})
+            else:
+                for word in message["content"].split(" "):
+                    yield chunk({"role": "assistant", "content": word + " "})
+            yield chunk({}, finish)
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    return app
+
+
+def start_scripted_server() -> str:
+    """Serve the scripted models on a free port in a background thread; returns its base URL."""
+    import uvicorn
+
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    server = uvicorn.Server(uvicorn.Config(scripted_app(), host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.01)
+    return f"http://127.0.0.1:{port}"
+
+
+class ScriptedInput:
+    """Types `TURNS` one after the other, and prints the replies."""
+
+    def __init__(self, turns):
+        self.turns = list(turns)
+
+    def respond(self, text: str):
+        print(text, end="", flush=True)
+
+    async def ask(self, prompt: str = "> ") -> str:
+        text = self.turns.pop(0)
+        print(f"\n{prompt}{text}")
+        return text
+
+
+async def record(args):
+    if os.path.exists(args.cassette):
+        os.remove(args.cassette)
+    os.environ.update({"LLM_CASSETTE": os.path.abspath(args.cassette), "LLM_CASSETTE_MODE": "record",
+                       "LLM_CACHE": "off"})
+    if not args.live:
+        url = start_scripted_server()
+        os.environ.update({"OPENAI_API_BASE": f"{url}/v1", "OPENAI_API_KEY": "scripted",
+                           "ANTHROPIC_BASE_URL": url, "ANTHROPIC_API_KEY": "scripted"})
+    sys.path.insert(0, SRC)
+    # the diagram step writes its code and the diagram into the working directory
+    os.chdir(tempfile.mkdtemp(prefix="record-cassette-"))
+    import cassette
+    import w2
+
+    workflow = w2.ConciergeWorkflow(timeout=300, verbose=False)
+    await workflow.run(input_provider=cassette.input_provider(ScriptedInput(TURNS)))
+    print(f"\nRecorded {sum(1 for _ in open(args.cassette))} interactions to {args.cassette}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--cassette", default=DEFAULT_CASSETTE)
+    parser.add_argument("--live", action="store_true", help="record against the real OpenAI and Anthropic APIs")
+    args = parser.parse_args()
+    args.cassette = os.path.abspath(args.cassette)
+    asyncio.run(record(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""
+Latency of one check of a generated diagram script: a fresh `python
+temp_generated_code.py` against a job on a warm `sandbox` worker.
+
+Runs the script `--runs` times each way and reports the median and the slowest run.
+The script is the Streamlit/S3 example from `diagram_imports.py`, or `--script`. Without
+the graphviz binaries installed, both ways fail at the same point (drawing the PNG),
+so they still time the same work.
+
+    python benchmarks/sandbox_latency.py --runs 20
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+SRC = os.path.join(HERE, "..", "src")
+
+
+def fresh_interpreter(code: str, workdir: str) -> float:
+    path = os.path.join(workdir, "temp_generated_code.py")
+    with open(path, "w") as f:
+        f.write(code)
+    start = time.perf_counter()
+    subprocess.run([sys.executable, path], cwd=workdir, capture_output=True,
+                   env={**os.environ, "PYTHONPATH": SRC})
+    return time.perf_counter() - start
+
+
+def report(name: str, seconds: list):
+    print(f"{name:<20} median {statistics.median(seconds) * 1000:8.1f}ms  max {max(seconds) * 1000:8.1f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--script", help="a generated script to run instead of the example")
+    parser.add_argument("--runs", type=int, default=10)
+    args = parser.parse_args()
+
+    sys.path.insert(0, SRC)
+    sys.path.insert(0, HERE)
+    from diagram_imports import EXAMPLE
+    import sandbox
+
+    code = open(args.script).read() if args.script else EXAMPLE
+    with tempfile.TemporaryDirectory() as workdir:
+        report("fresh interpreter", [fresh_interpreter(code, workdir) for _ in range(args.runs)])
+
+        pool = sandbox.SandboxPool(size=1, max_jobs=args.runs + 1)
+        pool.run("pass", workdir)  # wait for the worker to warm up
+        seconds = []
+        for _ in range(args.runs):
+            start = time.perf_counter()
+            result = pool.run(code, workdir)
+            seconds.append(time.perf_counter() - start)
+        pool.shutdown()
+        report("warm sandbox", seconds)
+        if not result.ok:
+            print(f"(the script failed both ways: {result.stderr.strip().splitlines()[-1]})")
+
+
+if __name__ == "__main__":
+    main()
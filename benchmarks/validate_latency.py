@@ -0,0 +1,63 @@
+"""
+Latency of `diagram_validator.validate` on a generated diagram script, against the
+warm `sandbox` run it stands in front of.
+
+Times building the `symbol_index` once, then `--runs` validations of the Streamlit/S3
+example from `diagram_imports.py` (or `--script`), and `--runs` sandbox runs of it.
+
+    python benchmarks/validate_latency.py --runs 200
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+SRC = os.path.join(HERE, "..", "src")
+
+
+def timed(fn, runs: int) -> list:
+    seconds = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn()
+        seconds.append(time.perf_counter() - start)
+    return seconds
+
+
+def report(name: str, seconds: list):
+    print(f"{name:<20} median {statistics.median(seconds) * 1e6:10.0f}us  max {max(seconds) * 1e6:10.0f}us")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--script", help="a generated script to check instead of the example")
+    parser.add_argument("--runs", type=int, default=100)
+    args = parser.parse_args()
+
+    sys.path.insert(0, SRC)
+    sys.path.insert(0, HERE)
+    from diagram_imports import EXAMPLE
+    import diagram_validator
+    import sandbox
+    import symbol_index
+
+    code = open(args.script).read() if args.script else EXAMPLE
+    report("build index", timed(symbol_index.build, 1))
+    symbol_index.load()
+    report("validate", timed(lambda: diagram_validator.validate(code), args.runs))
+    problems = diagram_validator.validate(code)
+    if problems:
+        print(diagram_validator.format_problems(problems))
+
+    with tempfile.TemporaryDirectory() as workdir:
+        pool = sandbox.SandboxPool(size=1, max_jobs=args.runs + 1)
+        pool.run("pass", workdir)  # wait for the worker to warm up
+        report("warm sandbox", timed(lambda: pool.run(code, workdir), args.runs))
+        pool.shutdown()
+
+
+if __name__ == "__main__":
+    main()
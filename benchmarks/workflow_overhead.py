@@ -0,0 +1,129 @@
+"""
+Framework overhead per workflow step, with the LLM calls replayed from a cassette.
+
+Replays the README's Streamlit/S3 conversation (recorded by `record_cassette.py`)
+through `w2.py` `--runs` times with tracing on, and reports for every step how long it
+took and how much of that was not spent waiting for an LLM: event dispatch, agent and
+memory bookkeeping, tool calls and the like. No API keys are needed.
+
+    python benchmarks/workflow_overhead.py --runs 5
+    python benchmarks/workflow_overhead.py --latency recorded
+
+`--latency` is LLM_CASSETTE_LATENCY: 0 (default) measures the overhead alone, "recorded"
+replays every call at the speed it was recorded.
+"""
+import argparse
+import asyncio
+import collections
+import contextlib
+import glob
+import io
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+SRC = os.path.join(HERE, "..", "src")
+DEFAULT_CASSETTE = os.path.join(HERE, "cassettes", "streamlit_s3.jsonl")
+
+
+def union_ms(intervals: list) -> float:
+    """Milliseconds covered by the (start, end) intervals, overlaps counted once."""
+    total, last_end = 0.0, None
+    for start, end in sorted(intervals):
+        if last_end is not None and start < last_end:
+            start = last_end
+        if end > start:
+            total += end - start
+            last_end = end if last_end is None else max(last_end, end)
+    return total * 1000
+
+
+def step_breakdown(spans: list) -> dict:
+    """Per step name: wall times, and LLM times of the LLM spans below each call."""
+    by_id = {span["id"]: span for span in spans}
+
+    def step_of(span):
+        parent = by_id.get(span["parent"])
+        while parent is not None and parent["kind"] != "step":
+            parent = by_id.get(parent["parent"])
+        return parent
+
+    llm = collections.defaultdict(list)
+    for span in spans:
+        if span["kind"] == "llm":
+            step = step_of(span)
+            if step is not None:
+                llm[step["id"]].append((span["start"], span["end"]))
+
+    steps = collections.defaultdict(lambda: {"wall": [], "llm": []})
+    for span in spans:
+        if span["kind"] == "step":
+            steps[span["name"]]["wall"].append(span["ms"])
+            steps[span["name"]]["llm"].append(union_ms(llm[span["id"]]))
+    return steps
+
+
+async def replay():
+    import cassette
+    import w2
+
+    cassette.reset()
+    workflow = w2.ConciergeWorkflow(timeout=300, verbose=False)
+    provider = cassette.input_provider()
+    start = time.perf_counter()
+    await workflow.run(input_provider=provider)
+    return time.perf_counter() - start, cassette.active().stats()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--cassette", default=DEFAULT_CASSETTE)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--latency", default="0", help='seconds per LLM call, or "recorded"')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="workflow-overhead-")
+    os.environ.update({
+        "LLM_CASSETTE": os.path.abspath(args.cassette),
+        "LLM_CASSETTE_MODE": "replay",
+        "LLM_CASSETTE_LATENCY": args.latency,
+        "LLM_CACHE": "off",
+        "TRACE_FILE": os.path.join(workdir, "trace-{pid}.jsonl"),
+        "OPENAI_API_KEY": os.environ.get("OPENAI_API_KEY", "replay"),
+        "ANTHROPIC_API_KEY": os.environ.get("ANTHROPIC_API_KEY", "replay"),
+    })
+    sys.path.insert(0, SRC)
+    # the diagram step writes its code and the diagram into the working directory
+    os.chdir(workdir)
+    with contextlib.redirect_stdout(io.StringIO()):
+        import tracing
+        import w2  # noqa: F401
+
+    tracing.install_from_env()
+    totals = []
+    for _ in range(args.runs):
+        # the workflow prints every step; keep the report readable
+        with contextlib.redirect_stdout(io.StringIO()):
+            seconds, stats = asyncio.run(replay())
+        totals.append(seconds)
+    tracing.shutdown()
+
+    spans = [json.loads(line) for path in glob.glob(os.path.join(workdir, "trace-*.jsonl")) for line in open(path)]
+    steps = step_breakdown(spans)
+    print(f"{args.runs} replays of {os.path.basename(args.cassette)} "
+          f"({stats['served']} LLM calls each, {stats['unmatched']} unmatched), latency {args.latency}")
+    print(f"{'step':<40} {'calls':>5} {'wall ms':>9} {'llm ms':>9} {'overhead ms':>12}")
+    for name, times in sorted(steps.items(), key=lambda item: -sum(item[1]["wall"])):
+        calls = len(times["wall"])
+        wall = sum(times["wall"]) / args.runs
+        llm = sum(times["llm"]) / args.runs
+        print(f"{name:<40} {calls // args.runs:>5} {wall:>9.1f} {llm:>9.1f} {wall - llm:>12.1f}")
+    print(f"run: median {statistics.median(totals) * 1000:.1f}ms, min {min(totals) * 1000:.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+"""
+Admission control for the chat endpoints.
+
+At most `max_inflight` turns run at once and at most `max_queue` more wait for a slot.
+Anything beyond that is rejected straight away with a Retry-After estimate instead of
+piling up behind the workflow. A waiting request gives up its place when its deadline
+passes, so work nobody is waiting for anymore is never started.
+"""
+import asyncio
+import math
+import os
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Optional
+
+
+class QueueFullError(Exception):
+    """Raised when a request arrives while the queue is full."""
+
+    def __init__(self, retry_after: int):
+        super().__init__(f"Too many requests in flight, retry in {retry_after}s")
+        self.retry_after = retry_after
+
+
+class DeadlineExceededError(Exception):
+    """Raised when a request's deadline passes while it is still queued."""
+
+
+def _percentile(values, q: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class AdmissionController:
+    """
+    A bounded queue in front of the workflow.
+
+    Use `slot()` around a turn, or `acquire()` / `release()` when the slot has to
+    outlive the handler (streaming responses).
+    """
+
+    def __init__(self, max_inflight: int = 32, max_queue: int = 64, deadline: Optional[float] = 60.0,
+                 window: int = 1000):
+        self.max_inflight = max(1, max_inflight)
+        self.max_queue = max(0, max_queue)
+        self.deadline = deadline
+        self._slots = asyncio.Semaphore(self.max_inflight)
+        self.waiting = 0
+        self.inflight = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.expired = 0
+        self.wait_times = deque(maxlen=window)
+        self.service_times = deque(maxlen=window)
+        self._started = {}
+
+    @classmethod
+    def from_env(cls) -> "AdmissionController":
+        deadline = float(os.environ.get("ADMISSION_DEADLINE", "60"))
+        return cls(
+            max_inflight=int(os.environ.get("ADMISSION_MAX_INFLIGHT", "32")),
+            max_queue=int(os.environ.get("ADMISSION_MAX_QUEUE", "64")),
+            deadline=deadline if deadline > 0 else None,
+        )
+
+    def retry_after(self) -> int:
+        """Seconds until a slot is likely free, from the queue depth and recent turn times."""
+        average = sum(self.service_times) / len(self.service_times) if self.service_times else 1.0
+        return max(1, math.ceil(average * (self.waiting + 1) / self.max_inflight))
+
+    async def acquire(self, timeout: Optional[float] = None) -> int:
+        """
+        Wait for a free slot.
+
+        Args:
+            timeout (float): Seconds the caller is willing to wait; defaults to the
+                controller's deadline.
+
+        Returns:
+            int: A ticket to pass to `release`.
+
+        Raises:
+            QueueFullError: The queue is full.
+            DeadlineExceededError: The deadline passed before a slot was free.
+        """
+        if self.inflight + self.waiting >= self.max_inflight + self.max_queue:
+            self.rejected += 1
+            raise QueueFullError(self.retry_after())
+
+        timeout = self.deadline if timeout is None else timeout
+        queued_at = time.monotonic()
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self._slots.acquire(), timeout)
+        except asyncio.TimeoutError:
+            self.expired += 1
+            raise DeadlineExceededError(f"Request expired after waiting {timeout}s for a slot")
+        finally:
+            self.waiting -= 1
+
+        started = time.monotonic()
+        self.wait_times.append(started - queued_at)
+        self.inflight += 1
+        self.admitted += 1
+        ticket = self.admitted
+        self._started[ticket] = started
+        return ticket
+
+    def release(self, ticket: int):
+        started = self._started.pop(ticket, None)
+        if started is None:
+            return
+        self.service_times.append(time.monotonic() - started)
+        self.inflight -= 1
+        self._slots.release()
+
+    @asynccontextmanager
+    async def slot(self, timeout: Optional[float] = None):
+        ticket = await self.acquire(timeout)
+        try:
+            yield
+        finally:
+            self.release(ticket)
+
+    def stats(self) -> dict:
+        return {
+            "max_inflight": self.max_inflight,
+            "max_queue": self.max_queue,
+            "inflight": self.inflight,
+            "depth": self.waiting,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "expired": self.expired,
+            "wait_p50": _percentile(self.wait_times, 0.5),
+            "wait_p95": _percentile(self.wait_times, 0.95),
+            "wait_max": max(self.wait_times, default=None),
+        }
@@ -0,0 +1,142 @@
+"""
+Bounded chat memory for the workflow's agents.
+
+Agents live for the whole session, and a plain `ChatMemoryBuffer` resends everything that
+fits the context window on every call. That includes architecture plans pasted several
+turns ago. `BoundedMemory` sends three things:
+
+- the current requirements, pinned as a system message, so they are never summarized away;
+- a running summary of the older turns;
+- the last `max_turns` turns verbatim, trimmed oldest first to `token_limit` tokens.
+
+Summarizing takes an LLM call. It happens in `acompact`, which the agent awaits after
+its reply has been sent, so it never runs inside an agent step.
+
+Settings:
+    AGENT_MEMORY_TURNS: Turns kept verbatim (default 6).
+    AGENT_MEMORY_TOKENS: Token budget of what is sent, pinned text and summary included
+        (default 4000).
+"""
+import logging
+import os
+from typing import Any, Callable, List, Optional
+
+from llama_index.core.llms import LLM, ChatMessage, MessageRole
+from llama_index.core.memory import ChatMemoryBuffer
+from pydantic import Field
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_PROMPT = """\
+Update the summary of a conversation between a user and an AWS architecture assistant.
+Keep decisions, constraints, chosen services, open questions and results such as prices
+or generated files. Leave out greetings and anything already in the summary twice.
+Answer with the updated summary only.
+
+Current summary:
+{summary}
+
+New messages:
+{conversation}
+"""
+
+
+def _turn_starts(messages: List[ChatMessage]) -> List[int]:
+    """Where each turn starts: a turn is a user message and everything up to the next one."""
+    return [i for i, message in enumerate(messages) if message.role == MessageRole.USER]
+
+
+class BoundedMemory(ChatMemoryBuffer):
+    """
+    Chat memory that keeps the last turns verbatim, summarizes the rest and pins the requirements.
+
+    Args:
+        max_turns (int): Turns kept verbatim.
+        token_limit (int): Token budget of what `get` returns.
+        llm (LLM): Writes the running summary; without one, older turns are reduced to
+            the user's requests.
+        pinned (Callable[[], str]): Returns the text to pin, e.g. the current requirements.
+    """
+
+    max_turns: int = 6
+    summary: str = ""
+    llm: Optional[LLM] = Field(default=None, exclude=True)
+    pinned: Optional[Callable[[], Optional[str]]] = Field(default=None, exclude=True)
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "BoundedMemory"
+
+    @classmethod
+    def from_env(cls, llm: Optional[LLM] = None, pinned: Optional[Callable[[], Optional[str]]] = None,
+                 **kwargs: Any) -> "BoundedMemory":
+        return cls(
+            max_turns=int(os.environ.get("AGENT_MEMORY_TURNS", "6")),
+            token_limit=int(os.environ.get("AGENT_MEMORY_TOKENS", "4000")),
+            llm=llm,
+            pinned=pinned,
+            **kwargs,
+        )
+
+    def context_messages(self) -> List[ChatMessage]:
+        """The pinned text and the summary, as system messages."""
+        messages = []
+        pinned = self.pinned() if self.pinned else None
+        if pinned:
+            messages.append(ChatMessage(role=MessageRole.SYSTEM, content=f"Current requirements:\n{pinned}"))
+        if self.summary:
+            messages.append(ChatMessage(role=MessageRole.SYSTEM,
+                                        content=f"Summary of the earlier conversation:\n{self.summary}"))
+        return messages
+
+    def get(self, input: Optional[str] = None, initial_token_count: int = 0, **kwargs: Any) -> List[ChatMessage]:
+        context = self.context_messages()
+        history = self.get_all()
+        starts = _turn_starts(history)
+        if len(starts) > self.max_turns:
+            history = history[starts[-self.max_turns]:]
+
+        # drop whole turns, oldest first, until it fits; the current turn always stays
+        budget = self.token_limit - initial_token_count - self._token_count_for_messages(context)
+        starts = _turn_starts(history)
+        while len(starts) > 1 and self._token_count_for_messages(history) > budget:
+            history = history[starts[1] - starts[0]:]
+            starts = _turn_starts(history)
+        return context + history
+
+    def token_count(self) -> int:
+        """Tokens of what `get` returns now."""
+        return self._token_count_for_messages(self.get())
+
+    async def acompact(self):
+        """Fold the turns `get` no longer sends verbatim into the summary and forget them."""
+        history = self.get_all()
+        starts = _turn_starts(history)
+        if len(starts) <= 1:
+            return
+        keep_from = starts[-self.max_turns] if len(starts) > self.max_turns else starts[0]
+        budget = self.token_limit - self._token_count_for_messages(self.context_messages())
+        later = [start for start in starts if start > keep_from]
+        while later and self._token_count_for_messages(history[keep_from:]) > budget:
+            keep_from = later.pop(0)
+        if keep_from == 0:
+            return
+
+        old = history[:keep_from]
+        self.summary = await self._summarize(old)
+        # messages may have been added meanwhile; keep everything after the summarized part
+        self.set(self.get_all()[keep_from:])
+
+    async def _summarize(self, messages: List[ChatMessage]) -> str:
+        conversation = "\n".join(
+            f"{message.role.value}: {message.content}" for message in messages if message.content
+        )
+        if self.llm is not None:
+            try:
+                prompt = SUMMARY_PROMPT.format(summary=self.summary or "(empty)", conversation=conversation)
+                return str(await self.llm.acomplete(prompt)).strip()
+            except Exception:
+                logger.exception("Summarizing the conversation failed; keeping the user's requests only")
+        requests = [f"- {message.content[:200]}" for message in messages
+                    if message.role == MessageRole.USER and message.content]
+        return "\n".join([*self.summary.splitlines(), *requests][-20:])
@@ -1,22 +1,31 @@
+import asyncio
 import requests
 import os
+from importall import explicit_imports
+from diagram_validator import fix_imports, validate, format_problems
 from prompts import txt_2_diagram_prompt_template
-from llama_index.llms.anthropic import Anthropic
+from llm_registry import get_llm, get_openai_client
+import sandbox
 
-import openai
 import re
+from typing import Optional
 
 
 from dotenv import load_dotenv
 load_dotenv()
 
 
-client = openai.OpenAI(
-  api_key=os.environ.get("TOGETHER_API_KEY"),
-  base_url="https://api.together.xyz/v1",
-)
+# shared diagram-writing LLM; built on first use, see llm_registry
+DIAGRAM_LLM = {"model": "claude-3-opus-20240229"}
+
+
+def together_client():
+    """The shared Together client (OpenAI-compatible), built on first use."""
+    return get_openai_client("https://api.together.xyz/v1", api_key_env="TOGETHER_API_KEY", name="Together")
+
+
 def get_code_completion(messages, max_tokens=512, model="codellama/CodeLlama-70b-Instruct-hf"):
-    chat_completion = client.chat.completions.create(
+    chat_completion = together_client().chat.completions.create(
         messages=messages,
         model=model,
         max_tokens=max_tokens,
@@ -56,12 +65,96 @@ def image_to_text(image_url: str) -> str:
     )
     return response.json()["text"]
 
-def text_to_diagram(requirements_plan: str) -> str:
+def extract_diagram_code(resp: str) -> str:
+    """Pull the Python code out of the LLM's answer."""
+    if resp.count("```")==2:
+        resp = extract_code(resp)
+    elif resp.count("```") > 0:
+        resp = re.sub(r'^.*resp\s*=\s*resp\.replace\("```python",\s*"".*\n?', '', resp, flags=re.MULTILINE)
+        resp = resp.replace("```", "")
+        
+    if isinstance(resp, list):
+        resp = resp[0] if len(resp) > 0 else ""
+    return resp
+
+
+def generate_diagram_code(requirements_plan: str, llm=None) -> str:
+    """
+    Ask the LLM for `diagrams` code drawing the architecture.
+
+    Args:
+        requirements_plan (str): A detailed description of the requirements for the AWS architecture.
+        llm (LLM): The LLM to use; the shared Anthropic one by default.
+
+    Returns:
+        str: The generated Python code.
+    """
+    llm = llm or get_llm("Anthropic", **DIAGRAM_LLM)
+    prompt = txt_2_diagram_prompt_template.format(architecture_plan=requirements_plan)
+    resp = str(llm.complete(prompt))
+    print(resp)
+    return extract_diagram_code(resp)
+
+
+async def agenerate_diagram_code(requirements_plan: str, llm=None) -> str:
+    """Async version of `generate_diagram_code`."""
+    llm = llm or get_llm("Anthropic", **DIAGRAM_LLM)
+    prompt = txt_2_diagram_prompt_template.format(architecture_plan=requirements_plan)
+    resp = str(await llm.acomplete(prompt))
+    print(resp)
+    return extract_diagram_code(resp)
+
+
+def render_diagram(code: str, workdir: Optional[str] = None) -> str:
+    """
+    Save the generated code to `temp_generated_code.py` and run it to draw the diagram.
+
+    The code's `from importall import *` is replaced by imports of the nodes it uses
+    (`importall.explicit_imports`), here and when the file is run again later, and
+    imports of misspelled or misplaced classes are corrected (`diagram_validator.fix_imports`).
+    The code is then checked with `diagram_validator` and only runs, in a warm `sandbox`
+    worker, if no problems were found.
+
+    Args:
+        code (str): Code from `generate_diagram_code`.
+        workdir (str): Where the code file and the diagram go; defaults to the current directory.
+
+    Returns:
+        If the diagram generation was successful or failure
+    """
+    if code:
+        code, fixes = fix_imports(explicit_imports(code))
+        if fixes:
+            print(f"Fixed imports:\n{format_problems(fixes)}")
+    workdir = workdir or os.getcwd()
+    os.makedirs(workdir, exist_ok=True)
+    try:
+        with open(os.path.join(workdir, "temp_generated_code.py"), "w+") as f:
+            f.write(code)
+
+        if code:
+            problems = validate(code)
+            if problems:
+                raise RuntimeError(format_problems(problems))
+            result = sandbox.run(code, workdir)
+            if not result.ok:
+                error = result.stderr.strip().splitlines()[-1] if result.stderr.strip() else f"exit code {result.returncode}"
+                raise RuntimeError(error)
+    except Exception as e:
+        print(f"Error generating diagram: {e}")
+        return f"Error generating diagram: {e}"
+
+    return "Diagram generated successfully."
+
+
+def text_to_diagram(requirements_plan: str, llm=None, workdir: Optional[str] = None) -> str:
     """
     Automatically generates AWS architecture code and a corresponding visual diagram using the Diagrams Python library.
     
     Args:
         requirements_plan (str): A detailed description of the requirements for the AWS architecture.
+        llm (LLM): The LLM to use; the shared Anthropic one by default.
+        workdir (str): Where the code file and the diagram go; defaults to the current directory.
     
     Returns:
         If the diagram generation was successful or failure
@@ -70,39 +163,14 @@ def text_to_diagram(requirements_plan: str) -> str:
     # llm = TogetherLLM(
     #     model="mistralai/Mixtral-8x7B-Instruct-v0.1"
     # )
-    llm = Anthropic(model="claude-3-opus-20240229")
-    
-    prompt = txt_2_diagram_prompt_template.format(architecture_plan=requirements_plan)
-    resp = str(llm.complete(prompt))
-    print(resp)
+    code = generate_diagram_code(requirements_plan, llm)
+    return render_diagram(code, workdir)
 
-    
-    if resp.count("```")==2:
-        resp = extract_code(resp)
-    elif resp.count("```") > 0:
-        resp = re.sub(r'^.*resp\s*=\s*resp\.replace\("```python",\s*"".*\n?', '', resp, flags=re.MULTILINE)
-        resp = resp.replace("```", "")
-        
-    if isinstance(resp, list):
-        if len(resp) >0:
-            resp = resp[0]
-    
-    with open("temp_generated_code.py", "w+") as f:
-        f.write(resp)
 
-    try:
-        if resp:
-            exec(resp)
-        else:
-            diagram_image = None
-            resp = None
-            diagram_name = None
-    except Exception as e:
-        print(f"Error generating diagram: {e}")
-        diagram_image = None
-        return "Error generating diagram: {e}"
-    
-    return "Diagram generated successfully."
+async def atext_to_diagram(requirements_plan: str, llm=None, workdir: Optional[str] = None) -> str:
+    """Async version of `text_to_diagram`; the LLM call is awaited and rendering runs in a thread."""
+    code = await agenerate_diagram_code(requirements_plan, llm)
+    return await asyncio.to_thread(render_diagram, code, workdir)
 
 
 if __name__ == "__main__":
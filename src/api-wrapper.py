@@ -1,31 +1,65 @@
-from fastapi import FastAPI, HTTPException, Request
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Request, Response
 from pydantic import BaseModel
+from starlette.background import BackgroundTask
 from enum import Enum
-from typing import List, Optional, Union
+from typing import AsyncIterator, List, Optional, Tuple, Union
 import fastapi
 import json
 import logging
-import subprocess
+import os
 import sys
 import time
 import uuid
 import uvicorn
 
+from admission import AdmissionController, DeadlineExceededError, QueueFullError
+import checkpoint
+from intent_router import router_stats
+from jobs import JobManager, JobQueueFullError
+import llm_cache
+import metrics
+from response_cache import KEY_FIELDS, ResponseCache, cache_key
+import tracing
+from worker_pool import SessionMovedError, WorkerPool, WorkerCrashedError
+
 logging.basicConfig(stream=sys.stdout, level=logging.DEBUG)
 logging.getLogger().name = __name__
 
-app = FastAPI()
+# LLM, step and tool metrics for /metrics; in subprocess mode the workers send theirs over IPC
+metrics.install()
+# spans of in-process sessions; workers write their own, see TRACE_FILE in tracing.py
+tracing.install_from_env()
+
+# WORKFLOW_MODE=inprocess runs the workflows inside this event loop; otherwise a pool of
+# processes running the workflows script, sized with WORKFLOW_WORKERS
+if os.environ.get("WORKFLOW_MODE") == "inprocess":
+    from inprocess import InProcessPool
+    pool = InProcessPool.from_env()
+else:
+    pool = WorkerPool.from_env()
+
+# Long-running estimations run as background jobs, see JOBS_* in jobs.py
+jobs = JobManager.from_env(pool)
+
+# Bounded queue in front of the workflow, see ADMISSION_* in admission.py
+admission = AdmissionController.from_env()
+
+# Finished replies to deterministic requests, off unless RESPONSE_CACHE_SIZE is set; see response_cache.py
+response_cache = ResponseCache.from_env()
+
+# Shared by /v1/batch requests so clients and diagram imports are set up once; see batch.py
+batch_runner = None
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await pool.start()
+    await jobs.start()
+    yield
+    await jobs.stop()
+    await pool.stop()
 
-# Start the subprocess that will run your workflows script
-proc = subprocess.Popen(
-    ['python', 'workflows.py'],
-    stdin=subprocess.PIPE,
-    stdout=subprocess.PIPE,
-    stderr=subprocess.PIPE,
-    text=True,
-    bufsize=1,
-    universal_newlines=True
-)
+app = FastAPI(lifespan=lifespan)
 
 class MessageRole(Enum):
     USER = 'user'
@@ -53,6 +87,14 @@ class ChatCompletionsRequest(BaseModel):
     user: Optional[str] = None
     stream: Optional[bool] = False
 
+class ResizeRequest(BaseModel):
+    size: int
+
+class JobRequest(BaseModel):
+    request: str
+    messages: Optional[List[str]] = None
+    webhook_url: Optional[str] = None
+
 class CustomStreamingResponse(fastapi.responses.StreamingResponse):
     def __init__(self, content, *args, **kwargs):
         super().__init__(content, *args, **kwargs)
@@ -65,30 +107,69 @@ class CustomStreamingResponse(fastapi.responses.StreamingResponse):
         self.headers["X-Request-ID"] = str(uuid.uuid4()).replace('-', '')  # Generate a unique ID for each request
         self.headers["Transfer-Encoding"] = "chunked"
 
-def filter_output_lines(lines):
-    magenta_start = '\x1b[35m'
-    magenta_reset = '\x1b[0m'
-    response_lines = []
-    debug_lines = []
-
-    # Process each line to determine if it is a response or debug
-    inside_magenta = False
-    for line in lines:
-        if magenta_start in line:
-            inside_magenta = True
-            # Start extracting from where the magenta code ends
-            clean_line = line.split(magenta_start)[1]  # Extract after magenta_start
-            response_lines.append(clean_line)
-        elif magenta_reset in line and inside_magenta:
-            # Stop extracting and remove the magenta reset code
-            clean_line = line.split(magenta_reset)[0]
-            response_lines.append(clean_line)
-            inside_magenta = False
-        elif inside_magenta:
-            # Keep appending lines until the magenta reset is found
-            response_lines.append(line)
-
-    return "".join(response_lines), "".join(debug_lines)
+def response_cache_key(request_data: ChatCompletionsRequest, request: Request, session_id: str) -> Optional[str]:
+    """
+    The cache key for a chat request, or None when its reply must not come from the cache.
+
+    Only requests that explicitly ask for temperature 0 and a single choice are cached,
+    and only for the session that made them.
+    """
+    if not response_cache.enabled or request.headers.get("Cache-Control") == "no-cache":
+        return None
+    if request_data.temperature != 0 or request_data.n != 1:
+        return None
+    return cache_key(
+        [(msg.role.value, msg.content) for msg in request_data.messages],
+        session_id=session_id,
+        **request_data.dict(include=set(KEY_FIELDS)),
+    )
+
+def session_id_for(request: Request, user: Optional[str] = None) -> str:
+    """Pick the session a request belongs to: the X-Session-ID header, then the user field, then the client address."""
+    return (
+        request.headers.get("X-Session-ID")
+        or user
+        or (request.client.host if request.client else "anonymous")
+    )
+
+async def admit(request: Request) -> int:
+    """Wait for an admission slot, honouring an X-Request-Timeout header (seconds) as the deadline."""
+    timeout = request.headers.get("X-Request-Timeout")
+    try:
+        return await admission.acquire(float(timeout) if timeout else None)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="X-Request-Timeout must be a number of seconds")
+    except QueueFullError as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+    except DeadlineExceededError as e:
+        raise HTTPException(status_code=504, detail=str(e))
+
+async def run_turn(request: Request, session_id: str, text: str) -> Tuple[str, str]:
+    """Send one turn to the worker pinned to the session and return its reply and debug output."""
+    ticket = await admit(request)
+    try:
+        while True:
+            # the session may be evicted (or its worker removed) while the turn waits
+            # for its lock; the turn then sends nothing and the lookup is repeated
+            try:
+                return await pool.worker_for(session_id).send_turn(text, session_id)
+            except SessionMovedError:
+                continue
+    except WorkerCrashedError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    finally:
+        admission.release(ticket)
+
+async def stream_turn(session_id: str, text: str) -> AsyncIterator[str]:
+    """Stream one turn from the worker pinned to the session, looked up once the turn may start."""
+    while True:
+        try:
+            async for content in pool.worker_for(session_id).stream_turn(text, session_id):
+                yield content
+            return
+        except SessionMovedError:
+            # raised before anything was sent, so nothing was yielded yet
+            continue
 
 @app.post("/v1/concierge")
 async def concierge(request: Request):
@@ -98,26 +179,15 @@ async def concierge(request: Request):
     if input_text is None:
         raise HTTPException(status_code=400, detail="Input text is required")
 
-    # Send input to the workflows subprocess
-    print(input_text, file=proc.stdin, flush=True)
-
-    # Read the response until the prompt appears
-    output = []
-    while True:
-        line = proc.stdout.readline()
-        if line.startswith("> "):
-            break
-        output.append(line)
-
-    # Filter and separate the output into response and debug
-    response_text, debug_text = filter_output_lines(output)
+    # Send input to the workflow worker that owns this session
+    response_text, debug_text = await run_turn(request, body.get("session_id") or session_id_for(request), input_text)
     return {
         "response": response_text,
         "debug": debug_text
     }
 
 @app.api_route('/v1/chat/completions', methods=['POST'])
-async def create_chat_completions(request_data: ChatCompletionsRequest, request: Request):
+async def create_chat_completions(request_data: ChatCompletionsRequest, request: Request, response: Response):
     if request.headers.get('Content-Type') != 'application/json':
         raise HTTPException(status_code=400, detail='Invalid Content-Type. Expected application/json.')
 
@@ -126,26 +196,42 @@ async def create_chat_completions(request_data: ChatCompletionsRequest, request:
     if not last_user_message:
         raise HTTPException(status_code=400, detail='No user message found')
 
-    # Send input to the workflows subprocess
-    print(last_user_message.content, file=proc.stdin, flush=True)
-
-    # Read the response until the prompt appears
-    output = []
-    while True:
-        line = proc.stdout.readline()
-        if line.startswith("> "):
-            break
-        output.append(line)
-
-    logging.debug('output:', output)
-
-    # Filter and separate the output into response and debug
-    response_text, debug_text = filter_output_lines(output)
-
+    session_id = session_id_for(request, request_data.user)
     message_id = f"msg-{int(time.time())}"
     created = int(time.time())
 
+    key = response_cache_key(request_data, request, session_id)
+    cached_text = response_cache.get(key) if key else None
+    cache_status = "BYPASS" if key is None else "HIT" if cached_text is not None else "MISS"
+
+    def make_chunk(content, finish_reason=None):
+        choice = {
+            'delta': {
+                'content': content,
+            },
+            'index': 0,
+            'finish_reason': finish_reason,
+        }
+        chunk_data = {
+            'id': message_id,
+            'model': request_data.model,
+            'created': created,
+            'object': 'chat.completion.chunk',
+            'choices': [choice],
+        }
+        return f'data: {json.dumps(chunk_data)}\n\n'
+
     if not request_data.stream:
+        response.headers["X-Cache"] = cache_status
+        if cached_text is not None:
+            response_text = cached_text
+        else:
+            # Send input to the workflow worker that owns this session
+            response_text, debug_text = await run_turn(request, session_id, last_user_message.content)
+            logging.debug('debug output: %s', debug_text)
+            if key:
+                response_cache.set(key, response_text)
+
         # Return the synchronous response
         return {
             'id': message_id,
@@ -164,31 +250,101 @@ async def create_chat_completions(request_data: ChatCompletionsRequest, request:
             ]
         }
 
+    elif cached_text is not None:
+        async def replay_cached():
+            yield make_chunk(cached_text)
+            yield make_chunk('', 'stop')
+
+        streaming_response = CustomStreamingResponse(replay_cached(), media_type='text/event-stream')
+        streaming_response.headers["X-Cache"] = cache_status
+        return streaming_response
+
     else:
-        # Handle streaming response
-        def generate_responses():
-            tokens = list(response_text)  # Assuming the response can be tokenized
-            for i, token in enumerate(tokens):
-                finish_reason = None if i < len(tokens) - 1 else 'stop'
-                choice = {
-                    'delta': {
-                        'content': f'{token}',
-                    },
-                    'index': 0,
-                    'finish_reason': finish_reason,
-                }
-                chunk_data = {
-                    'id': message_id,
-                    'model': request_data.model,
-                    'created': created,
-                    'object': 'chat.completion.chunk',
-                    'choices': [choice],
-                }
-                chunk = f'data: {json.dumps(chunk_data)}\n\n'
-                yield chunk
+        # Handle streaming response: forward the reply as the workflow generates it,
+        # one frame per RESPONSE message from the worker. The admission slot is held
+        # until the stream is finished.
+        ticket = await admit(request)
 
-        return CustomStreamingResponse(generate_responses(), media_type='text/event-stream')
+        async def generate_responses():
+            pieces = []
+            try:
+                async for content in stream_turn(session_id, last_user_message.content):
+                    pieces.append(content)
+                    yield make_chunk(content)
+                # only complete replies go into the cache
+                if key:
+                    response_cache.set(key, "".join(pieces))
+            except WorkerCrashedError:
+                logging.exception("Workflow worker crashed while streaming")
+            finally:
+                admission.release(ticket)
+            yield make_chunk('', 'stop')
 
+        # release the slot even if the client goes away before the stream starts
+        streaming_response = CustomStreamingResponse(generate_responses(), media_type='text/event-stream',
+                                                     background=BackgroundTask(admission.release, ticket))
+        streaming_response.headers["X-Cache"] = cache_status
+        return streaming_response
+
+
+@app.post("/v1/jobs", status_code=202)
+async def create_job(job_request: JobRequest):
+    try:
+        job = jobs.submit(job_request.request, job_request.messages, job_request.webhook_url)
+    except JobQueueFullError as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": "60"})
+    return job.to_dict()
+
+@app.get("/v1/jobs/{job_id}")
+def get_job(job_id: str):
+    job = jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job.to_dict()
+
+@app.get("/v1/jobs/{job_id}/artifacts/{name}")
+def get_job_artifact(job_id: str, name: str):
+    job = jobs.get(job_id)
+    path = jobs.artifact_path(job, name) if job else None
+    if path is None or not os.path.exists(path):
+        raise HTTPException(status_code=404, detail="Artifact not found")
+    return fastapi.responses.FileResponse(path)
+
+@app.post("/v1/batch")
+async def run_batch(request: Request, concurrency: int = 4):
+    """Estimate every use case in a JSONL body; one result line is streamed per finished item, then a summary."""
+    global batch_runner
+    import batch
+    if batch_runner is None:
+        batch_runner = batch.BatchRunner(output_dir=os.environ.get("BATCH_OUTPUT_DIR", "batch_output"))
+    items = batch.parse_items((await request.body()).decode().splitlines())
+    if not items:
+        raise HTTPException(status_code=400, detail="No use cases given")
+
+    async def results():
+        async for result in batch_runner.run(items, concurrency=max(1, concurrency)):
+            yield json.dumps(result) + "\n"
+
+    return fastapi.responses.StreamingResponse(results(), media_type="application/x-ndjson")
+
+@app.get("/metrics")
+def prometheus_metrics():
+    status = pool.status()
+    body = metrics.REGISTRY.render()
+    body += metrics.render_gauges("workflow_pool", {"sessions": status["sessions"], "workers": len(status["workers"])})
+    if "store" in status:
+        body += metrics.render_gauges("session_store", status["store"])
+    body += metrics.render_gauges("admission", admission.stats())
+    body += metrics.render_gauges("response_cache", response_cache.stats())
+    body += metrics.render_gauges("llm_cache", llm_cache.stats())
+    if checkpoint.stats() is not None:
+        body += metrics.render_gauges("checkpoints", checkpoint.stats())
+    # the workers' sandbox pools, as of their last turn in subprocess mode
+    if pool.sandbox_stats() is not None:
+        body += metrics.render_gauges("sandbox", pool.sandbox_stats())
+    body += metrics.render_gauges("jobs", jobs.stats())
+    body += metrics.render_gauges("intent_router", router_stats())
+    return fastapi.responses.PlainTextResponse(body, media_type="text/plain; version=0.0.4")
 
 @app.get("/v1/models")
 def list_models():
@@ -204,5 +360,24 @@ def list_models():
         ]
     }
 
+@app.get("/v1/workers")
+def list_workers():
+    return pool.status()
+
+@app.get("/v1/queue")
+def queue_status():
+    return admission.stats()
+
+@app.get("/v1/cache")
+def cache_stats():
+    return response_cache.stats()
+
+@app.post("/v1/workers")
+async def resize_workers(resize: ResizeRequest):
+    if resize.size < 1:
+        raise HTTPException(status_code=400, detail="Pool size must be at least 1")
+    await pool.resize(resize.size)
+    return pool.status()
+
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=3000)
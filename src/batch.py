@@ -0,0 +1,190 @@
+"""
+Bulk architecture and cost estimates for many use cases at once.
+
+Input is JSONL, one use case per line: {"id": "acme-1", "use_case": "..."}. Every item
+goes through the diagram and pricing pipeline without the interactive concierge:
+
+1. The LLM writes `diagrams` code for the use case.
+2. The code runs in a `sandbox` worker and draws the diagram into `<output_dir>/<id>/`.
+3. Every AWS service the code instantiates is priced through the AWS Price List API.
+
+Items run concurrently. One result line is written as each item finishes, followed by
+a summary with the throughput. The LLM client, the pricing client, the price lookups
+and the warm sandbox workers are shared across items.
+
+Usage:
+    python batch.py use_cases.jsonl -o results.jsonl --concurrency 8
+"""
+import argparse
+import asyncio
+import json
+import os
+import re
+import sys
+import time
+from typing import AsyncIterator, Dict, Iterable, List, Optional
+
+from agent_scripts import DIAGRAM_LLM, agenerate_diagram_code, render_diagram
+from llm_registry import get_llm
+from pricingAgent import get_price_for_service, service_codes_in_code
+import sandbox
+
+
+def parse_items(lines: Iterable[str]) -> List[dict]:
+    """
+    Read use cases from JSONL lines.
+
+    A line may also be a bare JSON string. The use case is taken from "use_case",
+    "request" or "text", and lines without an "id" are numbered from 1.
+    """
+    items = []
+    for number, line in enumerate(lines, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as e:
+            items.append({"id": str(number), "use_case": None, "error": f"Invalid JSON: {e}"})
+            continue
+        if isinstance(record, str):
+            record = {"use_case": record}
+        use_case = record.get("use_case") or record.get("request") or record.get("text")
+        items.append({
+            "id": str(record.get("id", number)),
+            "use_case": use_case,
+            "error": None if use_case else "No use_case given",
+        })
+    return items
+
+
+class BatchRunner:
+    """
+    Runs the diagram and pricing pipeline over many use cases.
+
+    Args:
+        output_dir (str): Each item's diagram and code go to `<output_dir>/<id>/`.
+        llm (LLM): Writes the diagram code; created on first use if not given.
+        pricing_client: A boto3 "pricing" client; created on first use if not given.
+    """
+
+    def __init__(self, output_dir: str = "batch_output", llm=None, pricing_client=None):
+        # absolute, because the sandbox workers run in another working directory
+        self.output_dir = os.path.abspath(output_dir)
+        self.llm = llm
+        self.pricing_client = pricing_client
+        self._prices: Dict[str, asyncio.Future] = {}
+
+    def warm_up(self):
+        """Create the clients and start the sandbox workers once, before the first item."""
+        if self.llm is None:
+            self.llm = get_llm("Anthropic", **DIAGRAM_LLM)
+        if self.pricing_client is None:
+            import boto3
+            self.pricing_client = boto3.client('pricing', region_name='us-east-1')
+        # start the sandbox workers, which import the diagrams modules meanwhile
+        sandbox.pool()
+
+    async def price(self, service_code: str) -> Optional[dict]:
+        """Look up a service's price once per runner; concurrent items share the lookup."""
+        if service_code not in self._prices:
+            self._prices[service_code] = asyncio.ensure_future(
+                asyncio.to_thread(get_price_for_service, service_code, self.pricing_client)
+            )
+        try:
+            return await asyncio.shield(self._prices[service_code])
+        except Exception as e:
+            return {"service": service_code, "error": str(e)}
+
+    async def run_item(self, item: dict) -> dict:
+        result = {"id": item["id"], "use_case": item["use_case"], "status": "error"}
+        if item.get("error"):
+            return {**result, "error": item["error"]}
+
+        start = time.perf_counter()
+        workdir = os.path.join(self.output_dir, re.sub(r"[^A-Za-z0-9_.-]", "_", item["id"]))
+        try:
+            code = await agenerate_diagram_code(item["use_case"], self.llm)
+            diagram_status = await asyncio.to_thread(render_diagram, code, workdir)
+            services = service_codes_in_code(code)
+            prices = await asyncio.gather(*(self.price(code) for code in services))
+        except Exception as e:
+            return {**result, "error": str(e), "seconds": round(time.perf_counter() - start, 2)}
+
+        return {
+            **result,
+            "status": "ok" if "successfully" in diagram_status.lower() else "diagram_failed",
+            "diagram": {
+                "status": diagram_status,
+                "dir": workdir,
+                "files": sorted(os.listdir(workdir)) if os.path.isdir(workdir) else [],
+            },
+            "services": services,
+            "prices": [p for p in prices if p],
+            "seconds": round(time.perf_counter() - start, 2),
+        }
+
+    async def run(self, items: List[dict], concurrency: int = 4) -> AsyncIterator[dict]:
+        """
+        Process `items` and yield each result as soon as it is ready, then a summary.
+
+        Args:
+            items (list[dict]): Items from `parse_items`.
+            concurrency (int): Items in flight at once.
+
+        Yields:
+            dict: One result per item, in completion order, then {"summary": {...}}.
+        """
+        await asyncio.to_thread(self.warm_up)
+        slots = asyncio.Semaphore(max(1, concurrency))
+        finished: asyncio.Queue = asyncio.Queue()
+
+        async def process(item):
+            async with slots:
+                await finished.put(await self.run_item(item))
+
+        start = time.perf_counter()
+        tasks = [asyncio.create_task(process(item)) for item in items]
+        counts = {}
+        try:
+            for _ in tasks:
+                result = await finished.get()
+                counts[result["status"]] = counts.get(result["status"], 0) + 1
+                yield result
+        finally:
+            for task in tasks:
+                task.cancel()
+
+        elapsed = time.perf_counter() - start
+        yield {"summary": {
+            "items": len(items),
+            "statuses": counts,
+            "seconds": round(elapsed, 2),
+            "items_per_minute": round(len(items) / elapsed * 60, 2) if elapsed else None,
+        }}
+
+
+async def main(args):
+    with (sys.stdin if args.input == "-" else open(args.input)) as f:
+        items = parse_items(f)
+    out = open(args.output, "w") if args.output else sys.stdout
+    runner = BatchRunner(output_dir=args.output_dir)
+    try:
+        async for result in runner.run(items, concurrency=args.concurrency):
+            if "summary" in result:
+                print(json.dumps(result["summary"]), file=sys.stderr)
+                continue
+            out.write(json.dumps(result) + "\n")
+            out.flush()
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Estimate architectures and costs for a JSONL file of use cases.")
+    parser.add_argument("input", help="JSONL file of use cases, or - for stdin")
+    parser.add_argument("-o", "--output", help="Where to write result lines (default: stdout)")
+    parser.add_argument("-c", "--concurrency", type=int, default=4, help="Use cases processed at once")
+    parser.add_argument("--output-dir", default="batch_output", help="Where diagrams and generated code go")
+    asyncio.run(main(parser.parse_args()))
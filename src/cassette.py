@@ -0,0 +1,391 @@
+"""
+Record and replay of LLM calls and user input, for running the workflow without API keys.
+
+In record mode every LLM call made through `llm_registry.get_llm` is appended to a
+cassette file with its response and duration. So is every message the user types
+(`input_provider`). In replay mode no provider is called: responses come from the
+cassette and the user's messages are typed back in the same order. Replaying a
+recording of a conversation takes the workflow through the same steps, so its own
+overhead can be measured without live latencies in the way (see
+`benchmarks/workflow_overhead.py`).
+
+A call is matched to a recorded one by the same key as `llm_cache` (LLM, parameters,
+messages, call arguments). When nothing matches, e.g. because a prompt contains a
+path or a date, the next unused recording of the same kind of call is served instead,
+in recorded order.
+
+Responses keep the SDK objects they carry, e.g. OpenAI tool calls, so function calling
+agents replay too. The cassette is JSONL: one call or user message per line, written as
+it happens.
+
+Settings:
+    LLM_CASSETTE: The cassette file; unset turns record and replay off.
+    LLM_CASSETTE_MODE: "record" or "replay" (default replay).
+    LLM_CASSETTE_LATENCY: Delay added to each replayed call: "0" (default), a number of
+        seconds, or "recorded" for the duration the call took when it was recorded.
+"""
+import asyncio
+import contextvars
+import enum
+import importlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Sequence
+
+from pydantic import BaseModel
+
+import llm_cache
+import tracing
+from input_provider import ConsoleInputProvider, InputProvider
+
+logger = logging.getLogger(__name__)
+
+
+class CassetteExhaustedError(RuntimeError):
+    """Raised in replay mode when the workflow asks for more than was recorded."""
+
+
+def encode(value: Any) -> Any:
+    """Turn a response into JSON, keeping the class of every pydantic object and enum in it."""
+    if isinstance(value, BaseModel):
+        cls = type(value)
+        return {"__model__": f"{cls.__module__}:{cls.__qualname__}",
+                "fields": {name: encode(getattr(value, name)) for name in cls.model_fields}}
+    if isinstance(value, enum.Enum):
+        cls = type(value)
+        return {"__enum__": f"{cls.__module__}:{cls.__qualname__}", "value": value.value}
+    if isinstance(value, dict):
+        return {str(k): encode(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [encode(item) for item in value]
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return value
+    return str(value)
+
+
+def _import(path: str):
+    module, qualname = path.split(":")
+    target = importlib.import_module(module)
+    for name in qualname.split("."):
+        target = getattr(target, name)
+    return target
+
+
+def decode(value: Any) -> Any:
+    """The inverse of `encode`."""
+    if isinstance(value, dict):
+        if "__model__" in value:
+            fields = {name: decode(v) for name, v in value["fields"].items()}
+            return _import(value["__model__"]).model_construct(**fields)
+        if "__enum__" in value:
+            return _import(value["__enum__"])(value["value"])
+        return {k: decode(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [decode(item) for item in value]
+    return value
+
+
+class Cassette:
+    """
+    A recording of LLM calls and user messages.
+
+    Args:
+        path (str): The JSONL file.
+        mode (str): "record" appends to it, "replay" serves it back.
+        latency (str | float): Replay delay per call; a number of seconds or "recorded".
+    """
+
+    def __init__(self, path: str, mode: str = "replay", latency: Any = 0):
+        if mode not in ("record", "replay"):
+            raise ValueError(f"Unknown cassette mode {mode!r}; expected 'record' or 'replay'")
+        self.path = os.path.abspath(path)
+        self.mode = mode
+        self.latency = latency if latency == "recorded" else float(latency)
+        self._lock = threading.Lock()
+        self.calls: List[dict] = []
+        self.inputs: Deque[str] = deque()
+        self._unused: Dict[str, Deque[int]] = {}
+        self.served = 0
+        self.unmatched = 0
+        if mode == "replay":
+            self._load()
+        else:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+
+    @classmethod
+    def from_env(cls) -> Optional["Cassette"]:
+        path = os.environ.get("LLM_CASSETTE")
+        if not path:
+            return None
+        return cls(path, mode=os.environ.get("LLM_CASSETTE_MODE", "replay"),
+                   latency=os.environ.get("LLM_CASSETTE_LATENCY", "0"))
+
+    def _load(self):
+        with open(self.path) as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                entry = json.loads(line)
+                if entry["kind"] == "input":
+                    self.inputs.append(entry["text"])
+                else:
+                    self._unused.setdefault(entry["key"], deque()).append(len(self.calls))
+                    self.calls.append(entry)
+        self._order = deque(range(len(self.calls)))
+
+    def _append(self, entry: dict):
+        with self._lock, open(self.path, "a") as f:
+            f.write(json.dumps(entry, separators=(",", ":")) + "\n")
+
+    def record_call(self, key: str, call: str, seconds: float, response: Any = None, chunks: Optional[list] = None):
+        entry = {"kind": "llm", "key": key, "call": call, "seconds": round(seconds, 4)}
+        if chunks is not None:
+            entry["chunks"] = [encode(chunk) for chunk in chunks]
+        else:
+            entry["response"] = encode(response)
+        self._append(entry)
+
+    def record_input(self, text: str):
+        self._append({"kind": "input", "text": text})
+
+    def next_call(self, key: str, call: str) -> dict:
+        """The recording to serve for this call: the first unused one with its key, else the next in order."""
+        with self._lock:
+            matches = self._unused.get(key)
+            if matches:
+                index = matches.popleft()
+            else:
+                index = next((i for i in self._order if self.calls[i]["call"] == call), None)
+                if index is None:
+                    raise CassetteExhaustedError(f"No recorded {call} call left in {self.path}")
+                self._unused[self.calls[index]["key"]].remove(index)
+                self.unmatched += 1
+                logger.warning("No recorded %s call matches; replaying the next one in order", call)
+            self._order.remove(index)
+            self.served += 1
+            return self.calls[index]
+
+    def next_input(self) -> str:
+        with self._lock:
+            if not self.inputs:
+                raise CassetteExhaustedError(f"No recorded user message left in {self.path}")
+            return self.inputs.popleft()
+
+    def delay(self, entry: dict) -> float:
+        return entry["seconds"] if self.latency == "recorded" else self.latency
+
+    def stats(self) -> dict:
+        return {"mode": self.mode, "calls": len(self.calls), "served": self.served,
+                "unmatched": self.unmatched, "inputs_left": len(self.inputs)}
+
+
+_cassette: Optional[Cassette] = None
+_loaded = False
+_classes: Dict[type, type] = {}
+# set while a recorded call runs, so a provider's `complete` that calls its own `chat`
+# is recorded once
+_inside = contextvars.ContextVar("cassette_inside", default=False)
+
+
+def active() -> Optional[Cassette]:
+    """The cassette configured in the environment, opened on first use; None when off."""
+    global _cassette, _loaded
+    if not _loaded:
+        _cassette = Cassette.from_env()
+        _loaded = True
+    return _cassette
+
+
+def reset():
+    """Forget the cassette and read the settings again on next use, e.g. between runs."""
+    global _cassette, _loaded
+    _cassette = None
+    _loaded = False
+
+
+def _chunk_text(chunks: list) -> str:
+    return "".join(getattr(chunk, "delta", None) or "" for chunk in chunks)
+
+
+class CassetteLLM:
+    """Mixin placed in front of a provider's LLM class; see `cassette_class`."""
+
+    async def _areplay(self, call: str, messages: Any, kwargs: Dict[str, Any]):
+        cassette = active()
+        entry = cassette.next_call(llm_cache.cache_key(self, call, messages, kwargs), call)
+        with tracing.span(f"{type(self).__name__}.{call}", kind="llm", cassette=True):
+            await asyncio.sleep(cassette.delay(entry))
+        return entry
+
+    def _replay(self, call: str, messages: Any, kwargs: Dict[str, Any]):
+        cassette = active()
+        entry = cassette.next_call(llm_cache.cache_key(self, call, messages, kwargs), call)
+        with tracing.span(f"{type(self).__name__}.{call}", kind="llm", cassette=True):
+            time.sleep(cassette.delay(entry))
+        return entry
+
+    def _recording(self) -> bool:
+        return not _inside.get() and active().mode == "record"
+
+    def chat(self, messages: Sequence, **kwargs: Any):
+        if _inside.get():
+            return super().chat(messages, **kwargs)
+        if active().mode == "replay":
+            return decode(self._replay("chat", messages, kwargs)["response"])
+        return self._record_sync("chat", super().chat, messages, kwargs)
+
+    def complete(self, prompt: str, formatted: bool = False, **kwargs: Any):
+        if _inside.get():
+            return super().complete(prompt, formatted=formatted, **kwargs)
+        kwargs = {"formatted": formatted, **kwargs}
+        if active().mode == "replay":
+            return decode(self._replay("complete", prompt, kwargs)["response"])
+        return self._record_sync("complete", super().complete, prompt, kwargs)
+
+    async def achat(self, messages: Sequence, **kwargs: Any):
+        if _inside.get():
+            return await super().achat(messages, **kwargs)
+        if active().mode == "replay":
+            return decode((await self._areplay("chat", messages, kwargs))["response"])
+        return await self._record_async("chat", super().achat, messages, kwargs)
+
+    async def acomplete(self, prompt: str, formatted: bool = False, **kwargs: Any):
+        if _inside.get():
+            return await super().acomplete(prompt, formatted=formatted, **kwargs)
+        kwargs = {"formatted": formatted, **kwargs}
+        if active().mode == "replay":
+            return decode((await self._areplay("complete", prompt, kwargs))["response"])
+        return await self._record_async("complete", super().acomplete, prompt, kwargs)
+
+    def _record_sync(self, call: str, method, messages: Any, kwargs: Dict[str, Any]):
+        start = time.perf_counter()
+        token = _inside.set(True)
+        try:
+            response = method(messages, **kwargs)
+        finally:
+            _inside.reset(token)
+        active().record_call(llm_cache.cache_key(self, call, messages, kwargs), call,
+                             time.perf_counter() - start, response=response)
+        return response
+
+    async def _record_async(self, call: str, method, messages: Any, kwargs: Dict[str, Any]):
+        start = time.perf_counter()
+        token = _inside.set(True)
+        try:
+            response = await method(messages, **kwargs)
+        finally:
+            _inside.reset(token)
+        active().record_call(llm_cache.cache_key(self, call, messages, kwargs), call,
+                             time.perf_counter() - start, response=response)
+        return response
+
+    def stream_chat(self, messages: Sequence, **kwargs: Any):
+        if _inside.get():
+            return super().stream_chat(messages, **kwargs)
+        cassette = active()
+        key = llm_cache.cache_key(self, "stream_chat", messages, kwargs)
+        if cassette.mode == "replay":
+            entry = self._replay("stream_chat", messages, kwargs)
+            return iter([decode(chunk) for chunk in entry["chunks"]])
+        start = time.perf_counter()
+        stream = super().stream_chat(messages, **kwargs)
+
+        def gen():
+            chunks = []
+            for chunk in stream:
+                chunks.append(chunk)
+                yield chunk
+            cassette.record_call(key, "stream_chat", time.perf_counter() - start, chunks=chunks)
+
+        return gen()
+
+    async def astream_chat(self, messages: Sequence, **kwargs: Any):
+        if _inside.get():
+            return await super().astream_chat(messages, **kwargs)
+        cassette = active()
+        key = llm_cache.cache_key(self, "stream_chat", messages, kwargs)
+        if cassette.mode == "replay":
+            entry = await self._areplay("stream_chat", messages, kwargs)
+            chunks = [decode(chunk) for chunk in entry["chunks"]]
+
+            async def replay():
+                for chunk in chunks:
+                    yield chunk
+
+            return replay()
+        start = time.perf_counter()
+        token = _inside.set(True)
+        try:
+            stream = await super().astream_chat(messages, **kwargs)
+        finally:
+            _inside.reset(token)
+
+        async def gen():
+            chunks = []
+            async for chunk in stream:
+                chunks.append(chunk)
+                yield chunk
+            cassette.record_call(key, "stream_chat", time.perf_counter() - start, chunks=chunks)
+
+        return gen()
+
+
+def cassette_class(llm_class: type) -> type:
+    """The subclass of `llm_class` whose calls are recorded or replayed; built once per class."""
+    if llm_class not in _classes:
+        _classes[llm_class] = type(f"Cassette{llm_class.__name__}", (CassetteLLM, llm_class),
+                                   {"__module__": __name__})
+    return _classes[llm_class]
+
+
+class RecordingInputProvider(InputProvider):
+    """Passes everything through to `inner` and records what the user types."""
+
+    def __init__(self, cassette: Cassette, inner: InputProvider):
+        self.cassette = cassette
+        self.inner = inner
+
+    def respond(self, text: str):
+        self.inner.respond(text)
+
+    async def ask(self, prompt: str = "> ") -> str:
+        text = await self.inner.ask(prompt)
+        self.cassette.record_input(text)
+        return text
+
+
+class ReplayInputProvider(InputProvider):
+    """Types the recorded user messages back in; keeps the replies in `replies`."""
+
+    def __init__(self, cassette: Cassette, echo: bool = False):
+        self.cassette = cassette
+        self.echo = echo
+        self.replies: List[str] = []
+
+    def respond(self, text: str):
+        self.replies.append(text)
+        if self.echo:
+            print(text, end="", flush=True)
+
+    async def ask(self, prompt: str = "> ") -> str:
+        return self.cassette.next_input()
+
+
+def input_provider(inner: Optional[InputProvider] = None) -> Optional[InputProvider]:
+    """
+    The input provider for a run under the active cassette.
+
+    Returns:
+        InputProvider: One that records what is typed into `inner` (the console by
+        default), or one that replays the recording; None without a cassette.
+    """
+    cassette = active()
+    if cassette is None:
+        return inner
+    if cassette.mode == "replay":
+        return ReplayInputProvider(cassette)
+    return RecordingInputProvider(cassette, inner or ConsoleInputProvider())
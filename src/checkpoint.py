@@ -0,0 +1,261 @@
+"""
+Checkpoints of a workflow run's conversation state, written after every step.
+
+A run opts in with `run(checkpoint_id=...)`. After each of its steps finishes, the
+conversation state (`session_store.SESSION_STATE_KEYS` of `ctx.data`, never agents or
+LLM clients) is written to `<directory>/<digest>.json`, together with the request the
+returned event is carrying, if any. A run that ends removes its checkpoint, whether a
+step returned the `StopEvent` or a tool sent it with `ctx.send_event`.
+
+A new run with the same id resumes from it: `resume` returns the saved state, which
+the concierge step restores like a spilled session. If a request was in flight, it
+becomes the `overall_request`, so it is routed again instead of the user having to
+repeat it; steps that had already finished are not run again. A request that was in
+flight for `max_resumes` resumes in a row is dropped, so a request that crashes the
+worker cannot crash it forever.
+
+A worker process under the API wrapper serves whichever session is pinned to it, so
+its checkpoints are keyed by the session of each message instead (`follow_session`).
+A restarted worker restores the checkpoint of the first session it hears from; when
+another session's message comes in, the outgoing session is saved and the incoming
+one restored, or started fresh.
+
+Settings:
+    WORKFLOW_CHECKPOINT_DIR: Where checkpoints are written; unset disables them.
+    WORKFLOW_CHECKPOINT_MAX_RESUMES: Resumes that may replay the same request (default 2).
+    WORKFLOW_CHECKPOINT_ID: The id `workflows.py` / `w2.py` run with from the console,
+        so a restarted console conversation picks up where it stopped.
+"""
+import copy
+import hashlib
+import inspect
+import json
+import logging
+import os
+import time
+from typing import Any, Optional
+
+from llama_index.core.instrumentation import get_dispatcher
+from llama_index.core.instrumentation.span.simple import SimpleSpan
+from llama_index.core.instrumentation.span_handlers import BaseSpanHandler
+from llama_index.core.workflow import Event, StopEvent
+
+import metrics
+from session_store import SESSION_STATE_KEYS, snapshot_state
+
+logger = logging.getLogger(__name__)
+
+
+class CheckpointStore:
+    """
+    One compact JSON file per run id, replaced atomically on every save.
+
+    Args:
+        directory (str): Where checkpoints are kept.
+        max_resumes (int): Resumes that may replay the same in-flight request.
+    """
+
+    def __init__(self, directory: str, max_resumes: int = 2):
+        self.directory = os.path.abspath(directory)
+        self.max_resumes = max_resumes
+        self.saves = 0
+        self.resumes = 0
+        self.dropped = 0
+        os.makedirs(self.directory, exist_ok=True)
+
+    @classmethod
+    def from_env(cls) -> Optional["CheckpointStore"]:
+        directory = os.environ.get("WORKFLOW_CHECKPOINT_DIR")
+        if not directory:
+            return None
+        return cls(directory, max_resumes=int(os.environ.get("WORKFLOW_CHECKPOINT_MAX_RESUMES", "2")))
+
+    def _path(self, run_id: str) -> str:
+        digest = hashlib.sha256(run_id.encode()).hexdigest()
+        return os.path.join(self.directory, f"{digest}.json")
+
+    def save(self, run_id: str, step: str, state: dict, pending: Optional[dict] = None):
+        """Write the state `step` left behind, and the request it passed on (`pending`)."""
+        previous = self.load(run_id) if pending else None
+        # count the resumes that replayed this same request
+        replays = previous.get("replays", 0) if previous and previous.get("pending") == pending else 0
+        checkpoint = {"run_id": run_id, "step": step, "saved_at": time.time(), "state": state,
+                      "pending": pending, "replays": replays}
+        self._write(run_id, checkpoint)
+        self.saves += 1
+
+    def _write(self, run_id: str, checkpoint: dict):
+        path = self._path(run_id)
+        with open(f"{path}.tmp", "w") as f:
+            json.dump(checkpoint, f, separators=(",", ":"), default=str)
+        os.replace(f"{path}.tmp", path)
+
+    def load(self, run_id: str) -> Optional[dict]:
+        try:
+            with open(self._path(run_id)) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+        except ValueError:
+            logger.warning("Discarding unreadable checkpoint for %s", run_id)
+            self.delete(run_id)
+            return None
+
+    def resume(self, run_id: str) -> Optional[dict]:
+        """
+        The state to restore for `run_id`, or None when there is no checkpoint.
+
+        The in-flight request, if any and not replayed `max_resumes` times already, is
+        put back as the `overall_request`.
+        """
+        checkpoint = self.load(run_id)
+        if checkpoint is None:
+            return None
+        state = dict(checkpoint["state"])
+        pending = checkpoint.get("pending")
+        if pending and checkpoint.get("replays", 0) < self.max_resumes:
+            state["overall_request"] = pending["request"]
+            checkpoint["replays"] = checkpoint.get("replays", 0) + 1
+            self._write(run_id, checkpoint)
+        elif pending:
+            logger.warning("Dropping request %r of %s after %s resumes", pending["request"], run_id,
+                           checkpoint["replays"])
+            self.dropped += 1
+        self.resumes += 1
+        logger.info("Resuming %s after step %s", run_id, checkpoint["step"])
+        return state
+
+    def delete(self, run_id: str):
+        try:
+            os.remove(self._path(run_id))
+        except FileNotFoundError:
+            pass
+
+    def stats(self) -> dict:
+        return {
+            "checkpoints": sum(1 for name in os.listdir(self.directory) if name.endswith(".json")),
+            "saves": self.saves,
+            "resumes": self.resumes,
+            "dropped": self.dropped,
+        }
+
+
+def pending_request(event: Any) -> Optional[dict]:
+    """The request an event returned by a step carries on, if it carries one."""
+    request = getattr(event, "request", None) if isinstance(event, Event) else None
+    if not request or not isinstance(request, str):
+        return None
+    return {"event": type(event).__name__, "request": request}
+
+
+def _run_id(ctx) -> Optional[str]:
+    if ctx is None or _store is None or "user" not in ctx.data:
+        return None
+    return ctx.data.get("checkpoint_id")
+
+
+class CheckpointSpanHandler(BaseSpanHandler[SimpleSpan]):
+    """
+    Saves a checkpoint to the installed store when a step of a run with a `checkpoint_id`
+    finishes, and removes it when the run is done.
+    """
+
+    def class_name(cls) -> str:
+        return "CheckpointSpanHandler"
+
+    def new_span(self, id_: str, bound_args: inspect.BoundArguments, instance: Optional[Any] = None,
+                 parent_span_id: Optional[str] = None, tags: Optional[dict] = None,
+                 **kwargs: Any) -> Optional[SimpleSpan]:
+        return None
+
+    def prepare_to_exit_span(self, id_: str, bound_args: inspect.BoundArguments, instance: Optional[Any] = None,
+                             result: Optional[Any] = None, **kwargs: Any) -> Optional[SimpleSpan]:
+        step = metrics.StepSpanHandler._step_name(id_, instance)
+        run_id = _run_id(bound_args.arguments.get("ctx")) if step else None
+        # a returned StopEvent is removed by the `_done` step it goes to
+        if not run_id or isinstance(result, StopEvent):
+            return None
+        try:
+            _store.save(run_id, step, snapshot_state(bound_args.arguments["ctx"].data), pending_request(result))
+        except Exception:
+            logger.exception("Writing the checkpoint of %s failed", run_id)
+        return None
+
+    def prepare_to_drop_span(self, id_: str, bound_args: inspect.BoundArguments, instance: Optional[Any] = None,
+                             err: Optional[BaseException] = None, **kwargs: Any) -> Optional[SimpleSpan]:
+        # every StopEvent, returned or sent, ends in the workflow's `_done` step, which
+        # finishes the run by raising WorkflowDone
+        if metrics.StepSpanHandler._step_name(id_, instance) != "_done":
+            return None
+        run_id = _run_id(bound_args.arguments.get("ctx"))
+        if run_id:
+            try:
+                _store.delete(run_id)
+            except Exception:
+                logger.exception("Removing the checkpoint of %s failed", run_id)
+        return None
+
+
+_store: Optional[CheckpointStore] = None
+
+
+def install(store: CheckpointStore) -> CheckpointStore:
+    """Save checkpoints of every run with a `checkpoint_id` to `store`; the first store installed wins."""
+    global _store
+    if _store is None:
+        _store = store
+        get_dispatcher().add_span_handler(CheckpointSpanHandler())
+    return _store
+
+
+def install_from_env() -> Optional[CheckpointStore]:
+    store = CheckpointStore.from_env()
+    return install(store) if store is not None else _store
+
+
+def resume(run_id: Optional[str]) -> Optional[dict]:
+    """The installed store's `resume(run_id)`; None without a run id or a store."""
+    if not run_id or _store is None:
+        return None
+    return _store.resume(run_id)
+
+
+def follow_session(data: dict, session_id: Optional[str]):
+    """
+    Key the checkpoints of the run owning `data` by the session of its latest message.
+
+    On the first message of a (re)started process the session's checkpoint is restored
+    into `data`. When the session changes, the outgoing session's state is saved and
+    the incoming session's checkpoint restored, or the state reset to what the run
+    started with; the cached agents, which hold the outgoing conversation, are dropped
+    and rebuilt on use. A restored in-flight request is not replayed: the wrapper
+    already failed that turn, and the message just received replaces it.
+
+    Args:
+        data (dict): The run's `ctx.data`.
+        session_id (str): `InputProvider.session_id`; None leaves the id as it is.
+    """
+    previous = data.get("checkpoint_id")
+    if not session_id or previous == session_id:
+        return
+    if previous is None:
+        # the state the run started with, for the sessions that follow
+        data["blank_state"] = copy.deepcopy(snapshot_state(data))
+    else:
+        if _store is not None:
+            _store.save(previous, "follow_session", snapshot_state(data))
+        for key in SESSION_STATE_KEYS:
+            data.pop(key, None)
+        data.update(copy.deepcopy(data.get("blank_state", {})))
+        for key in [key for key in data if key in ("concierge", "orchestrator") or key.endswith("_agent")]:
+            del data[key]
+    data["checkpoint_id"] = session_id
+    saved = _store.load(session_id) if _store is not None else None
+    if saved is not None:
+        data.update(saved["state"], overall_request=None)
+        _store.resumes += 1
+        logger.info("Resuming session %s after step %s", session_id, saved["step"])
+
+
+def stats() -> Optional[dict]:
+    return _store.stats() if _store is not None else None
@@ -0,0 +1,364 @@
+"""
+Static checks of generated diagram code, before it runs.
+
+Most generated scripts that fail do so for reasons visible in the source: a syntax
+error, a node class that does not exist or is imported from the wrong module, text
+passed to `Edge` as its node, a `Cluster` connected like a node. `validate` finds these
+with `ast` alone, in about a millisecond once the index is built. It returns one
+`Problem` per mistake, with its line and, where there is one, the fix, e.g. the module
+a class really lives in. So a script is only run, and the LLM only asked to fix it,
+when there is nothing left to find statically.
+
+Node classes are looked up in the `symbol_index` of the installed `diagrams` package.
+`fix_imports` uses it to correct the imports of a script before it is checked. A class
+the script uses without importing it is only imported when the script's provider (the
+one its imports come from, AWS by default) has it; a class of another provider is
+reported instead, because a queue or cache from another cloud is not a fix.
+
+The checks only report what is certainly wrong. Code they cannot follow, such as a
+star import from another package, is left to the run.
+"""
+import ast
+import builtins
+import difflib
+from collections import Counter
+from dataclasses import dataclass
+from typing import Iterable, List, Optional, Set, Tuple
+
+import importall
+import symbol_index
+
+DIRECTIONS = ("TB", "BT", "LR", "RL")
+CURVESTYLES = ("ortho", "curved")
+OUTFORMATS = ("png", "jpg", "svg", "pdf", "dot")
+CONNECTORS = (ast.RShift, ast.LShift, ast.Sub)
+
+
+@dataclass
+class Problem:
+    """A mistake in the code: where it is, what kind it is, and how to fix it if known."""
+
+    line: int
+    col: int
+    kind: str
+    message: str
+    hint: Optional[str] = None
+
+    def __str__(self) -> str:
+        text = f"line {self.line}: {self.message}"
+        return f"{text} ({self.hint})" if self.hint else text
+
+
+def _provider(module: str) -> Optional[str]:
+    """`diagrams.gcp` for `diagrams.gcp.compute`."""
+    parts = module.split(".")
+    return ".".join(parts[:2]) if len(parts) > 2 else None
+
+
+def _script_provider(tree: ast.Module, index: symbol_index.SymbolIndex) -> str:
+    """The provider most of the code's node imports come from; AWS, what `importall` imports, by default."""
+    providers = Counter(
+        _provider(node.module) for node in ast.walk(tree)
+        if isinstance(node, ast.ImportFrom) and node.module and not node.level
+    )
+    known = [(provider, count) for provider, count in providers.most_common()
+             if provider and any(module.startswith(provider + ".") for module in index.modules)]
+    return known[0][0] if known else "diagrams.aws"
+
+
+def _call_name(node: ast.AST) -> Optional[str]:
+    if isinstance(node, ast.Call):
+        func = node.func
+        if isinstance(func, ast.Name):
+            return func.id
+        if isinstance(func, ast.Attribute):
+            return func.attr
+    return None
+
+
+def _operands(node: ast.BinOp) -> Iterable[ast.AST]:
+    """The operands of a chain like `a >> Edge() >> [b, c]`."""
+    for side in (node.left, node.right):
+        if isinstance(side, ast.BinOp) and isinstance(side.op, CONNECTORS):
+            yield from _operands(side)
+        else:
+            yield side
+
+
+class _Checker(ast.NodeVisitor):
+    def __init__(self, index: symbol_index.SymbolIndex, defined: Set[str], diagram_names: Set[str],
+                 provider: str = "diagrams.aws"):
+        self.index = index
+        self.provider = provider
+        self.defined = defined
+        self.diagram_names = diagram_names
+        self.problems: List[Problem] = []
+        self.in_diagram = 0
+        self.in_function = 0
+
+    def problem(self, node: ast.AST, kind: str, message: str, hint: Optional[str] = None):
+        self.problems.append(Problem(getattr(node, "lineno", 0), getattr(node, "col_offset", 0), kind, message, hint))
+
+    def visit_ImportFrom(self, node: ast.ImportFrom):
+        module = node.module or ""
+        if node.level or not (module == "diagrams" or module.startswith("diagrams.")):
+            return
+        names = self.index.modules.get(module)
+        if names is None:
+            close = difflib.get_close_matches(module, self.index.modules, n=1)
+            self.problem(node, "import", f"there is no module {module}",
+                         f"did you mean {close[0]}?" if close else None)
+            return
+        for alias in node.names:
+            if alias.name == "*" or alias.name in names:
+                continue
+            symbol = self.index.resolve(alias.name, _provider(module))
+            self.problem(node, "import", f"{module} has no {alias.name}", f"use: {symbol.statement}" if symbol else None)
+
+    def visit_FunctionDef(self, node):
+        self.in_function += 1
+        self.generic_visit(node)
+        self.in_function -= 1
+
+    visit_AsyncFunctionDef = visit_FunctionDef
+    visit_Lambda = visit_FunctionDef
+
+    def visit_With(self, node: ast.With):
+        diagrams = 0
+        for item in node.items:
+            self.visit(item.context_expr)
+            expr = item.context_expr
+            if _call_name(expr) == "Diagram" or (isinstance(expr, ast.Name) and expr.id in self.diagram_names):
+                diagrams += 1
+            if item.optional_vars is not None:
+                self.visit(item.optional_vars)
+        self.in_diagram += diagrams
+        for statement in node.body:
+            self.visit(statement)
+        self.in_diagram -= diagrams
+
+    def visit_Name(self, node: ast.Name):
+        if not isinstance(node.ctx, ast.Load) or node.id in self.defined:
+            return
+        home = self.index.home(node.id, self.provider)
+        if home and self.index.provides(self.provider, node.id):
+            self.problem(node, "name", f"{node.id} is not imported", f"add: from {home} import {node.id}")
+            return
+        if home:
+            close = self.index.suggest(node.id, provider=self.provider)
+            alternatives = f"did you mean {', '.join(close)}? " if close else ""
+            self.problem(node, "name", f"{node.id} is not imported",
+                         f"{self.provider} has no {node.id}; {alternatives}{home} has one")
+            return
+        close = self.index.suggest(node.id) or difflib.get_close_matches(node.id, self.defined, n=3)
+        self.problem(node, "name", f"{node.id} is not defined",
+                     f"did you mean {', '.join(close)}?" if close else None)
+
+    def visit_Call(self, node: ast.Call):
+        name = _call_name(node)
+        if name == "Edge":
+            self._check_edge(node)
+        elif name in ("Diagram", "Cluster"):
+            self._check_choice(node, "direction", DIRECTIONS, str.upper)
+            if name == "Diagram":
+                self._check_choice(node, "curvestyle", CURVESTYLES, str.lower)
+                self._check_choice(node, "outformat", OUTFORMATS, str.lower)
+        elif name in self.index.classes and not self.in_diagram and not self.in_function:
+            self.problem(node, "diagram", f"{name}(...) is created outside of a diagram",
+                         "create nodes inside `with Diagram(...):`")
+        self.generic_visit(node)
+
+    def _check_edge(self, node: ast.Call):
+        if len(node.args) > 1:
+            self.problem(node, "edge", "Edge takes at most one positional argument, the node",
+                         "pass the rest as keywords, e.g. Edge(label=..., color=...)")
+        if node.args and isinstance(node.args[0], ast.Constant):
+            self.problem(node, "edge", "Edge's positional argument is the node it starts from, not text",
+                         f"use Edge(label={node.args[0].value!r})")
+
+    def _check_choice(self, node: ast.Call, keyword: str, choices: tuple, normalize):
+        for kw in node.keywords:
+            if kw.arg == keyword and isinstance(kw.value, ast.Constant) and isinstance(kw.value.value, str):
+                if normalize(kw.value.value) not in choices:
+                    self.problem(kw.value, "diagram", f"{keyword} must be one of {', '.join(choices)}",
+                                 f"not {kw.value.value!r}")
+
+    def visit_BinOp(self, node: ast.BinOp):
+        if isinstance(node.op, CONNECTORS):
+            operands = list(_operands(node))
+            if any(_call_name(o) in ("Cluster", "Diagram") for o in operands):
+                self.problem(node, "cluster", "a Cluster or Diagram cannot be connected",
+                             "connect the nodes inside it; use `with Cluster(...):` to group them")
+            if any(isinstance(o, ast.Name) and o.id == "Edge" for o in operands):
+                self.problem(node, "edge", "Edge is connected without being called", "use Edge(label=...)")
+            for operand in operands:
+                if isinstance(operand, (ast.Constant, ast.JoinedStr)):
+                    self.problem(operand, "connection", "only nodes, lists of nodes and Edges can be connected",
+                                 "wrap text in a node or pass it as Edge(label=...)")
+            for left, right in zip(operands, operands[1:]):
+                if isinstance(left, ast.List) and isinstance(right, ast.List):
+                    self.problem(node, "connection", "a list of nodes cannot be connected to another list",
+                                 "connect them in a loop, or through a single node")
+            # the rest of the chain was checked with this node
+            for operand in operands:
+                self.visit(operand)
+            return
+        self.generic_visit(node)
+
+
+def _defined_names(tree: ast.Module) -> Tuple[Optional[Set[str]], Set[str]]:
+    """
+    Every name the code binds anywhere, or None if a star import makes that unknowable,
+    and the names bound to a `Diagram(...)`.
+    """
+    defined = set(dir(builtins)) | {"__file__", "__name__"}
+    diagram_names = set()
+    followed = True
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Name) and not isinstance(node.ctx, ast.Load):
+            defined.add(node.id)
+        elif isinstance(node, ast.Assign) and _call_name(node.value) == "Diagram":
+            diagram_names.update(target.id for target in node.targets if isinstance(target, ast.Name))
+        elif isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            defined.add(node.name)
+            args = node.args if not isinstance(node, ast.ClassDef) else None
+            if args is not None:
+                defined.update(a.arg for a in [*args.posonlyargs, *args.args, *args.kwonlyargs])
+                defined.update(a.arg for a in (args.vararg, args.kwarg) if a is not None)
+        elif isinstance(node, ast.Lambda):
+            defined.update(a.arg for a in [*node.args.args, *node.args.kwonlyargs])
+        elif isinstance(node, ast.ExceptHandler) and node.name:
+            defined.add(node.name)
+        elif isinstance(node, (ast.Global, ast.Nonlocal)):
+            defined.update(node.names)
+        elif isinstance(node, ast.Import):
+            defined.update((alias.asname or alias.name).split(".")[0] for alias in node.names)
+        elif isinstance(node, ast.ImportFrom):
+            for alias in node.names:
+                if alias.name != "*":
+                    defined.add(alias.asname or alias.name)
+                elif node.module == "importall":
+                    defined.update(importall._TABLE)
+                elif node.module and node.module.startswith("diagrams"):
+                    defined.update(symbol_index.load().modules.get(node.module, ()))
+                else:
+                    followed = False
+        elif isinstance(node, (ast.MatchAs, ast.MatchStar)) and node.name:
+            defined.add(node.name)
+    return (defined if followed else None), diagram_names
+
+
+def validate(code: str) -> List[Problem]:
+    """
+    Check generated diagram code without running it.
+
+    Returns:
+        list[Problem]: The mistakes found, in line order; empty when none were.
+    """
+    try:
+        tree = ast.parse(code)
+    except SyntaxError as e:
+        return [Problem(e.lineno or 0, (e.offset or 1) - 1, "syntax", e.msg, (e.text or "").strip() or None)]
+    defined, diagram_names = _defined_names(tree)
+    index = symbol_index.load()
+    checker = _Checker(index, defined or set(), diagram_names, _script_provider(tree, index))
+    if defined is None:
+        # names may come from a star import we cannot follow; skip the name check
+        checker.visit_Name = lambda node: None
+    checker.visit(tree)
+    return sorted(checker.problems, key=lambda p: (p.line, p.col))
+
+
+def format_problems(problems: List[Problem]) -> str:
+    return "\n".join(str(problem) for problem in problems)
+
+
+def _import_text(imports: List[Tuple[str, str, Optional[str]]]) -> str:
+    """`from m import a, b as c; from n import d` for (module, name, asname) triples."""
+    by_module = {}
+    for module, name, asname in imports:
+        by_module.setdefault(module, []).append(f"{name} as {asname}" if asname else name)
+    return "; ".join(f"from {module} import {', '.join(names)}" for module, names in by_module.items())
+
+
+def _splice(lines: List[str], node: ast.stmt, text: str):
+    """Replace the statement `node` in `lines` by `text`, keeping the number of lines."""
+    first = lines[node.lineno - 1].encode()
+    last = lines[node.end_lineno - 1].encode()
+    text = first[:node.col_offset].decode() + text + last[node.end_col_offset:].decode()
+    span = node.end_lineno - node.lineno + 1
+    text += "\n" * (span - text.count("\n") - 1) if text.endswith("\n") else "\n" * (span - text.count("\n"))
+    lines[node.lineno - 1:node.end_lineno] = [text]
+
+
+def fix_imports(code: str) -> Tuple[str, List[Problem]]:
+    """
+    Correct the `diagrams` imports of generated code with the `symbol_index`.
+
+    A class imported from the wrong module, or misspelled, is imported as the class
+    meant under the name the code uses (`from diagrams.aws.network import ELB as
+    ElasticLoadBalancer`), so the rest of the code stays as it is. A node class that is
+    called but never imported gets an import on the line of the last import, if the
+    script's provider has it. Line numbers are kept, unless the code had no imports at all.
+
+    Returns:
+        tuple[str, list[Problem]]: The code, and one Problem per import fixed, with the
+            fix as its hint.
+    """
+    try:
+        tree = ast.parse(code)
+    except SyntaxError:
+        return code, []
+    index = symbol_index.load()
+    fixes: List[Problem] = []
+    edits = {}
+    imports = [node for node in tree.body if isinstance(node, (ast.Import, ast.ImportFrom))]
+
+    def fixed(node: ast.AST, message: str, module: str, name: str, asname: Optional[str]):
+        fixes.append(Problem(node.lineno, node.col_offset, "import", message,
+                             f"now: {_import_text([(module, name, asname)])}"))
+
+    for node in imports:
+        module = getattr(node, "module", None) or ""
+        if not isinstance(node, ast.ImportFrom) or node.level or not (module == "diagrams" or module.startswith("diagrams.")):
+            continue
+        names = index.modules.get(module)
+        rewritten = []
+        for alias in node.names:
+            symbol = None
+            if alias.name != "*" and (names is None or alias.name not in names):
+                symbol = index.resolve(alias.name, _provider(module))
+            if symbol is None:
+                rewritten.append((module, alias.name, alias.asname))
+                continue
+            asname = alias.asname or (alias.name if symbol.name != alias.name else None)
+            rewritten.append((symbol.module, symbol.name, asname))
+            fixed(node, f"{module} has no {alias.name}", symbol.module, symbol.name, asname)
+        if rewritten != [(module, alias.name, alias.asname) for alias in node.names]:
+            edits[node] = _import_text(rewritten)
+
+    defined, _ = _defined_names(tree)
+    provider = _script_provider(tree, index)
+    missing = []
+    if defined is not None:
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Call) and isinstance(node.func, ast.Name):
+                name = node.func.id
+                if name[0].isupper() and name not in defined and name not in {m[2] or m[1] for m in missing}:
+                    # other providers' classes are left for `validate` to report
+                    symbol = index.resolve(name, provider, strict=True)
+                    if symbol is not None:
+                        asname = name if symbol.name != name else None
+                        missing.append((symbol.module, symbol.name, asname))
+                        fixed(node.func, f"{name} is not imported", symbol.module, symbol.name, asname)
+
+    lines = code.splitlines(keepends=True)
+    if missing and not imports:
+        lines.insert(0, _import_text(missing) + "\n")
+        missing = []
+    if missing:
+        last = imports[-1]
+        edits[last] = (edits.get(last) or ast.get_source_segment(code, last)) + "; " + _import_text(missing)
+    for node in sorted(edits, key=lambda n: n.lineno, reverse=True):
+        _splice(lines, node, edits[node])
+    return "".join(lines), sorted(fixes, key=lambda p: (p.line, p.col))
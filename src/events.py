@@ -32,3 +32,30 @@ class FixImportEvent(Event):
 
 class ArchitectureCheckEvent(Event):
     request: str
+
+# Full estimate: fan out to the RAG, diagram and pricing branches, then join before the report
+class EstimateEvent(Event):
+    requirements: str
+
+class RAGSearchEvent(Event):
+    requirements: str
+
+class DiagramDraftEvent(Event):
+    requirements: str
+
+class PriceEstimateEvent(Event):
+    requirements: str
+
+class BranchResultEvent(Event):
+    branch: str
+    result: str
+    ok: bool = True
+
+class RAGResultEvent(BranchResultEvent):
+    pass
+
+class DiagramResultEvent(BranchResultEvent):
+    pass
+
+class PriceResultEvent(BranchResultEvent):
+    pass
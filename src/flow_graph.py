@@ -0,0 +1,87 @@
+"""
+Rendering of a workflow's flow graph, on request and only when the workflow changed.
+
+The graph (`llama_index.utils.workflow.draw_all_possible_flows`) used to be drawn into
+`concierge_flows.html` whenever `workflows.py` or `w2.py` was imported, which pulled in
+pyvis and wrote the file on every worker start. It is drawn by this command instead:
+
+    python flow_graph.py w2 --out ../docs/concierge_flows.html
+
+The file ends with a hash of the workflow's step signatures (the events each step
+accepts and returns). When the file on disk carries the current hash, drawing it again
+is skipped; `--force` draws it anyway.
+"""
+import argparse
+import hashlib
+import importlib
+import inspect
+import os
+import re
+import sys
+from typing import Optional
+
+from llama_index.core.workflow.utils import get_steps_from_class
+
+MARKER = "<!-- workflow-steps: {} -->"
+
+
+def steps_hash(workflow_cls: type) -> str:
+    """Hash of the names and signatures of a workflow class's steps."""
+    steps = get_steps_from_class(workflow_cls)
+    signature = [f"{name}{inspect.signature(fn)}" for name, fn in sorted(steps.items())]
+    return hashlib.sha256("\n".join(signature).encode()).hexdigest()
+
+
+def rendered_hash(filename: str) -> Optional[str]:
+    """The steps hash a previously drawn file was drawn for, if any."""
+    try:
+        with open(filename) as f:
+            match = re.search(MARKER.format(r"([0-9a-f]{64})"), f.read())
+    except FileNotFoundError:
+        return None
+    return match.group(1) if match else None
+
+
+def draw(workflow_cls: type, filename: str = "concierge_flows.html", force: bool = False) -> bool:
+    """
+    Draw the flow graph of `workflow_cls` into `filename`, unless it is up to date.
+
+    Returns:
+        bool: Whether the file was drawn.
+    """
+    digest = steps_hash(workflow_cls)
+    if not force and rendered_hash(filename) == digest:
+        return False
+    from llama_index.utils.workflow import draw_all_possible_flows
+
+    # pyvis copies the scripts the page loads into lib/ of the working directory, so
+    # draw from the page's directory to keep them together
+    directory, name = os.path.split(os.path.abspath(filename))
+    cwd = os.getcwd()
+    os.makedirs(directory, exist_ok=True)
+    os.chdir(directory)
+    try:
+        draw_all_possible_flows(workflow_cls, filename=name)
+    finally:
+        os.chdir(cwd)
+    with open(filename, "a") as f:
+        f.write("\n" + MARKER.format(digest) + "\n")
+    return True
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Draw a workflow's flow graph.")
+    parser.add_argument("module", help="the module defining the workflow, e.g. w2")
+    parser.add_argument("--workflow", default="ConciergeWorkflow", help="the workflow class")
+    parser.add_argument("--out", default="concierge_flows.html")
+    parser.add_argument("--force", action="store_true", help="draw even if the file is up to date")
+    args = parser.parse_args(argv)
+    workflow_cls = getattr(importlib.import_module(args.module), args.workflow)
+    if draw(workflow_cls, args.out, force=args.force):
+        print(f"Drew {args.out}", file=sys.stderr)
+    else:
+        print(f"{args.out} is up to date", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,27 +1,298 @@
-from diagrams import Diagram
-from diagrams.aws.analytics import *
-from diagrams.aws.ar import *
-from diagrams.aws.blockchain import *
-from diagrams.aws.business import *
-from diagrams.aws.compute import *
-from diagrams.aws.cost import *
-from diagrams.aws.database import *
-from diagrams.aws.devtools import *
-from diagrams.aws.enablement import *
-from diagrams.aws.enduser import *
-from diagrams.aws.engagement import *
-from diagrams.aws.game import *
-from diagrams.aws.general import *
-from diagrams.aws.integration import *
-from diagrams.aws.iot import *
-from diagrams.aws.management import *
-from diagrams.aws.media import *
-from diagrams.aws.migration import *
-from diagrams.aws.ml import *
-from diagrams.aws.mobile import *
-from diagrams.aws.network import *
-from diagrams.aws.quantum import *
-from diagrams.aws.robotics import *
-from diagrams.aws.satellite import *
-from diagrams.aws.security import *
-from diagrams.aws.storage import *
\ No newline at end of file
+"""
+Every AWS node of the diagrams library under one name, imported when first used.
+
+Generated diagram scripts start with `from importall import *`. That used to import all
+27 `diagrams.aws` modules, and their hundreds of node classes, on every run. Now the
+names are looked up in `MODULES`, and a node's module is imported the first time the
+node is used (`importall.EC2`).
+
+A star import still works, but has to import every module, because it copies every
+name. `explicit_imports` rewrites a script's star import into imports of only the nodes
+the script uses. `agent_scripts.render_diagram` rewrites every script it writes, so the
+script only imports what it draws, whether it is run in-process or in a subprocess.
+
+`MODULES` lists the public names of each module, in the order the old star imports
+ran, so a name in two modules resolves to the same class as before. `python importall.py`
+prints the modules and names the installed diagrams version has that `MODULES` lacks.
+"""
+import ast
+import importlib
+import sys
+from typing import Dict, List
+
+# the public names of each diagrams.aws module
+MODULES = {
+    "diagrams.aws.analytics": (
+        "AmazonOpensearchService", "Analytics", "Athena", "CloudsearchSearchDocuments", "Cloudsearch",
+        "DataLakeResource", "DataPipeline", "ElasticsearchService", "EMRCluster", "EMREngineMaprM3",
+        "EMREngineMaprM5", "EMREngineMaprM7", "EMREngine", "EMRHdfsCluster", "EMR", "GlueCrawlers",
+        "GlueDataCatalog", "Glue", "KinesisDataAnalytics", "KinesisDataFirehose", "KinesisDataStreams",
+        "KinesisVideoStreams", "Kinesis", "LakeFormation", "ManagedStreamingForKafka", "Quicksight",
+        "RedshiftDenseComputeNode", "RedshiftDenseStorageNode", "Redshift", "ES",
+    ),
+    "diagrams.aws.ar": (
+        "ArVr", "Sumerian",
+    ),
+    "diagrams.aws.blockchain": (
+        "BlockchainResource", "Blockchain", "ManagedBlockchain", "QuantumLedgerDatabaseQldb", "QLDB",
+    ),
+    "diagrams.aws.business": (
+        "AlexaForBusiness", "BusinessApplications", "Chime", "Workmail", "A4B",
+    ),
+    "diagrams.aws.compute": (
+        "AppRunner", "ApplicationAutoScaling", "Batch", "ComputeOptimizer", "Compute", "EC2Ami",
+        "EC2AutoScaling", "EC2ContainerRegistryImage", "EC2ContainerRegistryRegistry",
+        "EC2ContainerRegistry", "EC2ElasticIpAddress", "EC2ImageBuilder", "EC2Instance", "EC2Instances",
+        "EC2Rescue", "EC2SpotInstance", "EC2", "ElasticBeanstalkApplication",
+        "ElasticBeanstalkDeployment", "ElasticBeanstalk", "ElasticContainerServiceContainer",
+        "ElasticContainerServiceServiceConnect", "ElasticContainerServiceService",
+        "ElasticContainerServiceTask", "ElasticContainerService", "ElasticKubernetesService", "Fargate",
+        "LambdaFunction", "Lambda", "Lightsail", "LocalZones", "Outposts",
+        "ServerlessApplicationRepository", "ThinkboxDeadline", "ThinkboxDraft", "ThinkboxFrost",
+        "ThinkboxKrakatoa", "ThinkboxSequoia", "ThinkboxStoke", "ThinkboxXmesh", "VmwareCloudOnAWS",
+        "Wavelength", "AutoScaling", "AMI", "ECR", "EB", "ECS", "EKS", "SAR",
+    ),
+    "diagrams.aws.cost": (
+        "Budgets", "CostAndUsageReport", "CostExplorer", "CostManagement", "ReservedInstanceReporting",
+        "SavingsPlans",
+    ),
+    "diagrams.aws.database": (
+        "AuroraInstance", "Aurora", "DatabaseMigrationServiceDatabaseMigrationWorkflow",
+        "DatabaseMigrationService", "Database", "DocumentdbMongodbCompatibility", "DynamodbAttribute",
+        "DynamodbAttributes", "DynamodbDax", "DynamodbGlobalSecondaryIndex", "DynamodbItem",
+        "DynamodbItems", "DynamodbStreams", "DynamodbTable", "Dynamodb", "ElasticacheCacheNode",
+        "ElasticacheForMemcached", "ElasticacheForRedis", "Elasticache",
+        "KeyspacesManagedApacheCassandraService", "Neptune", "QuantumLedgerDatabaseQldb", "RDSInstance",
+        "RDSMariadbInstance", "RDSMysqlInstance", "RDSOnVmware", "RDSOracleInstance",
+        "RDSPostgresqlInstance", "RDSSqlServerInstance", "RDS", "RedshiftDenseComputeNode",
+        "RedshiftDenseStorageNode", "Redshift", "Timestream", "DMS", "DocumentDB", "DAX", "DynamodbGSI",
+        "DB", "DDB", "ElastiCache", "QLDB",
+    ),
+    "diagrams.aws.devtools": (
+        "CloudDevelopmentKit", "Cloud9Resource", "Cloud9", "Cloudshell", "Codeartifact", "Codebuild",
+        "Codecommit", "Codedeploy", "Codepipeline", "Codestar", "CommandLineInterface",
+        "DeveloperTools", "ToolsAndSdks", "XRay", "CLI", "DevTools",
+    ),
+    "diagrams.aws.enablement": (
+        "CustomerEnablement", "Iq", "ManagedServices", "ProfessionalServices", "Support",
+    ),
+    "diagrams.aws.enduser": (
+        "Appstream20", "DesktopAndAppStreaming", "Workdocs", "Worklink", "Workspaces",
+    ),
+    "diagrams.aws.engagement": (
+        "Connect", "CustomerEngagement", "Pinpoint", "SimpleEmailServiceSesEmail",
+        "SimpleEmailServiceSes", "SES",
+    ),
+    "diagrams.aws.game": (
+        "GameTech", "Gamelift",
+    ),
+    "diagrams.aws.general": (
+        "Client", "Disk", "Forums", "General", "GenericDatabase", "GenericFirewall",
+        "GenericOfficeBuilding", "GenericSamlToken", "GenericSDK", "InternetAlt1", "InternetAlt2",
+        "InternetGateway", "Marketplace", "MobileClient", "Multimedia", "OfficeBuilding", "SamlToken",
+        "SDK", "SslPadlock", "TapeStorage", "Toolkit", "TraditionalServer", "User", "Users",
+    ),
+    "diagrams.aws.integration": (
+        "ApplicationIntegration", "Appsync", "ConsoleMobileApplication", "EventResource",
+        "EventbridgeCustomEventBusResource", "EventbridgeDefaultEventBusResource", "EventbridgeEvent",
+        "EventbridgePipes", "EventbridgeRule", "EventbridgeSaasPartnerEventBusResource",
+        "EventbridgeScheduler", "EventbridgeSchema", "Eventbridge", "ExpressWorkflows", "MQ",
+        "SimpleNotificationServiceSnsEmailNotification", "SimpleNotificationServiceSnsHttpNotification",
+        "SimpleNotificationServiceSnsTopic", "SimpleNotificationServiceSns",
+        "SimpleQueueServiceSqsMessage", "SimpleQueueServiceSqsQueue", "SimpleQueueServiceSqs",
+        "StepFunctions", "SNS", "SQS", "SF",
+    ),
+    "diagrams.aws.iot": (
+        "Freertos", "InternetOfThings", "Iot1Click", "IotAction", "IotActuator", "IotAlexaEcho",
+        "IotAlexaEnabledDevice", "IotAlexaSkill", "IotAlexaVoiceService", "IotAnalyticsChannel",
+        "IotAnalyticsDataSet", "IotAnalyticsDataStore", "IotAnalyticsNotebook", "IotAnalyticsPipeline",
+        "IotAnalytics", "IotBank", "IotBicycle", "IotButton", "IotCamera", "IotCar", "IotCart",
+        "IotCertificate", "IotCoffeePot", "IotCore", "IotDesiredState", "IotDeviceDefender",
+        "IotDeviceGateway", "IotDeviceManagement", "IotDoorLock", "IotEvents", "IotFactory",
+        "IotFireTvStick", "IotFireTv", "IotGeneric", "IotGreengrassConnector", "IotGreengrass",
+        "IotHardwareBoard", "IotHouse", "IotHttp", "IotHttp2", "IotJobs", "IotLambda", "IotLightbulb",
+        "IotMedicalEmergency", "IotMqtt", "IotOverTheAirUpdate", "IotPolicyEmergency", "IotPolicy",
+        "IotReportedState", "IotRule", "IotSensor", "IotServo", "IotShadow", "IotSimulator",
+        "IotSitewise", "IotThermostat", "IotThingsGraph", "IotTopic", "IotTravel", "IotUtility",
+        "IotWindfarm", "FreeRTOS", "IotBoard",
+    ),
+    "diagrams.aws.management": (
+        "AmazonDevopsGuru", "AmazonManagedGrafana", "AmazonManagedPrometheus",
+        "AmazonManagedWorkflowsApacheAirflow", "AutoScaling", "Chatbot", "CloudformationChangeSet",
+        "CloudformationStack", "CloudformationTemplate", "Cloudformation", "Cloudtrail",
+        "CloudwatchAlarm", "CloudwatchEventEventBased", "CloudwatchEventTimeBased", "CloudwatchLogs",
+        "CloudwatchRule", "Cloudwatch", "Codeguru", "CommandLineInterface", "Config", "ControlTower",
+        "LicenseManager", "ManagedServices", "ManagementAndGovernance", "ManagementConsole",
+        "OpsworksApps", "OpsworksDeployments", "OpsworksInstances", "OpsworksLayers",
+        "OpsworksMonitoring", "OpsworksPermissions", "OpsworksResources", "OpsworksStack", "Opsworks",
+        "OrganizationsAccount", "OrganizationsOrganizationalUnit", "Organizations",
+        "PersonalHealthDashboard", "Proton", "ServiceCatalog", "SystemsManagerAppConfig",
+        "SystemsManagerAutomation", "SystemsManagerDocuments", "SystemsManagerInventory",
+        "SystemsManagerMaintenanceWindows", "SystemsManagerOpscenter", "SystemsManagerParameterStore",
+        "SystemsManagerPatchManager", "SystemsManagerRunCommand", "SystemsManagerStateManager",
+        "SystemsManager", "TrustedAdvisorChecklistCost", "TrustedAdvisorChecklistFaultTolerant",
+        "TrustedAdvisorChecklistPerformance", "TrustedAdvisorChecklistSecurity",
+        "TrustedAdvisorChecklist", "TrustedAdvisor", "UserNotifications", "WellArchitectedTool", "SSM",
+        "ParameterStore",
+    ),
+    "diagrams.aws.media": (
+        "ElasticTranscoder", "ElementalConductor", "ElementalDelta", "ElementalLive",
+        "ElementalMediaconnect", "ElementalMediaconvert", "ElementalMedialive", "ElementalMediapackage",
+        "ElementalMediastore", "ElementalMediatailor", "ElementalServer", "KinesisVideoStreams",
+        "MediaServices",
+    ),
+    "diagrams.aws.migration": (
+        "ApplicationDiscoveryService", "CloudendureMigration", "DatabaseMigrationService",
+        "DatasyncAgent", "Datasync", "MigrationAndTransfer", "MigrationHub", "ServerMigrationService",
+        "SnowballEdge", "Snowball", "Snowmobile", "TransferForSftp", "ADS", "CEM", "DMS", "MAT", "SMS",
+    ),
+    "diagrams.aws.ml": (
+        "ApacheMxnetOnAWS", "AugmentedAi", "Bedrock", "Comprehend", "DeepLearningAmis",
+        "DeepLearningContainers", "Deepcomposer", "Deeplens", "Deepracer", "ElasticInference",
+        "Forecast", "FraudDetector", "Kendra", "Lex", "MachineLearning", "Personalize", "Polly", "Q",
+        "RekognitionImage", "RekognitionVideo", "Rekognition", "SagemakerGroundTruth", "SagemakerModel",
+        "SagemakerNotebook", "SagemakerTrainingJob", "Sagemaker", "TensorflowOnAWS", "Textract",
+        "Transcribe", "Transform", "Translate", "DLC",
+    ),
+    "diagrams.aws.mobile": (
+        "Amplify", "APIGatewayEndpoint", "APIGateway", "Appsync", "DeviceFarm", "Mobile", "Pinpoint",
+    ),
+    "diagrams.aws.network": (
+        "APIGatewayEndpoint", "APIGateway", "AppMesh", "ClientVpn", "CloudMap",
+        "CloudFrontDownloadDistribution", "CloudFrontEdgeLocation", "CloudFrontStreamingDistribution",
+        "CloudFront", "DirectConnect", "ElasticLoadBalancing", "ElbApplicationLoadBalancer",
+        "ElbClassicLoadBalancer", "ElbNetworkLoadBalancer", "Endpoint", "GlobalAccelerator",
+        "InternetGateway", "Nacl", "NATGateway", "NetworkFirewall", "NetworkingAndContentDelivery",
+        "PrivateSubnet", "Privatelink", "PublicSubnet", "Route53HostedZone", "Route53", "RouteTable",
+        "SiteToSiteVpn", "TransitGatewayAttachment", "TransitGateway", "VPCCustomerGateway",
+        "VPCElasticNetworkAdapter", "VPCElasticNetworkInterface", "VPCFlowLogs", "VPCPeering",
+        "VPCRouter", "VPCTrafficMirroring", "VPC", "VpnConnection", "VpnGateway", "CF", "ELB", "ALB",
+        "CLB", "NLB", "GAX", "IGW", "TGW", "TGWAttach",
+    ),
+    "diagrams.aws.quantum": (
+        "Braket", "QuantumTechnologies",
+    ),
+    "diagrams.aws.robotics": (
+        "RobomakerCloudExtensionRos", "RobomakerDevelopmentEnvironment", "RobomakerFleetManagement",
+        "RobomakerSimulator", "Robomaker", "Robotics",
+    ),
+    "diagrams.aws.satellite": (
+        "GroundStation", "Satellite",
+    ),
+    "diagrams.aws.security": (
+        "AdConnector", "Artifact", "CertificateAuthority", "CertificateManager", "CloudDirectory",
+        "Cloudhsm", "Cognito", "Detective", "DirectoryService", "FirewallManager", "Guardduty",
+        "IdentityAndAccessManagementIamAccessAnalyzer", "IdentityAndAccessManagementIamAddOn",
+        "IdentityAndAccessManagementIamAWSStsAlternate", "IdentityAndAccessManagementIamAWSSts",
+        "IdentityAndAccessManagementIamDataEncryptionKey",
+        "IdentityAndAccessManagementIamEncryptedData",
+        "IdentityAndAccessManagementIamLongTermSecurityCredential",
+        "IdentityAndAccessManagementIamMfaToken", "IdentityAndAccessManagementIamPermissions",
+        "IdentityAndAccessManagementIamRole",
+        "IdentityAndAccessManagementIamTemporarySecurityCredential", "IdentityAndAccessManagementIam",
+        "InspectorAgent", "Inspector", "KeyManagementService", "Macie", "ManagedMicrosoftAd",
+        "ResourceAccessManager", "SecretsManager", "SecurityHubFinding", "SecurityHub",
+        "SecurityIdentityAndCompliance", "SecurityLake", "ShieldAdvanced", "Shield", "SimpleAd",
+        "SingleSignOn", "WAFFilteringRule", "WAF", "ACM", "CloudHSM", "DS", "FMS", "IAMAccessAnalyzer",
+        "IAMAWSSts", "IAMPermissions", "IAMRole", "IAM", "KMS", "RAM",
+    ),
+    "diagrams.aws.storage": (
+        "Backup", "CloudendureDisasterRecovery", "EFSInfrequentaccessPrimaryBg", "EFSStandardPrimaryBg",
+        "ElasticBlockStoreEBSSnapshot", "ElasticBlockStoreEBSVolume", "ElasticBlockStoreEBS",
+        "ElasticFileSystemEFSFileSystem", "ElasticFileSystemEFS", "FsxForLustre",
+        "FsxForWindowsFileServer", "Fsx", "MultipleVolumesResource", "S3AccessPoints",
+        "S3GlacierArchive", "S3GlacierVault", "S3Glacier", "S3ObjectLambdaAccessPoints",
+        "SimpleStorageServiceS3BucketWithObjects", "SimpleStorageServiceS3Bucket",
+        "SimpleStorageServiceS3Object", "SimpleStorageServiceS3", "SnowFamilySnowballImportExport",
+        "SnowballEdge", "Snowball", "Snowmobile", "StorageGatewayCachedVolume",
+        "StorageGatewayNonCachedVolume", "StorageGatewayVirtualTapeLibrary", "StorageGateway",
+        "Storage", "CDR", "EBS", "EFS", "FSx", "S3",
+    ),
+}
+
+# a name in several modules resolves to the last one, like the star imports did
+_TABLE: Dict[str, str] = {"Diagram": "diagrams"}
+for _module, _names in MODULES.items():
+    _TABLE.update(dict.fromkeys(_names, _module))
+
+# what `from importall import *` copies; each name is resolved by `__getattr__`
+__all__ = list(_TABLE)
+
+
+def __getattr__(name: str):
+    module = _TABLE.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(module), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__() -> List[str]:
+    return sorted({*globals(), *_TABLE})
+
+
+def _is_star_import(node: ast.stmt) -> bool:
+    return (isinstance(node, ast.ImportFrom) and node.module == __name__ and node.level == 0
+            and [alias.name for alias in node.names] == ["*"])
+
+
+def explicit_imports(code: str) -> str:
+    """
+    Replace `from importall import *` in a script with imports of the nodes it uses.
+
+    Names the script assigns or imports itself are left alone. Code that does not parse
+    is returned unchanged, with its star import, which still works.
+    """
+    try:
+        tree = ast.parse(code)
+    except SyntaxError:
+        return code
+    star_imports = [node for node in tree.body if _is_star_import(node)]
+    if not star_imports:
+        return code
+
+    defined = set()
+    used = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Name):
+            (used if isinstance(node.ctx, ast.Load) else defined).add(node.id)
+        elif isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            defined.add(node.name)
+        elif isinstance(node, (ast.Import, ast.ImportFrom)) and not _is_star_import(node):
+            defined.update((alias.asname or alias.name).split(".")[0] for alias in node.names)
+    by_module: Dict[str, List[str]] = {}
+    for name in sorted(used - defined):
+        if name in _TABLE:
+            by_module.setdefault(_TABLE[name], []).append(name)
+    imports = "".join(f"from {module} import {', '.join(names)}\n" for module, names in sorted(by_module.items()))
+
+    lines = code.splitlines(keepends=True)
+    first = star_imports[0]
+    for node in reversed(star_imports):
+        replacement = imports.replace("\n", "; ").rstrip("; ") if node is first else ""
+        # replace only the statement, not other statements sharing its line; offsets are in bytes
+        before = lines[node.lineno - 1].encode()[:node.col_offset].decode()
+        after = lines[node.end_lineno - 1].encode()[node.end_col_offset:].decode()
+        if not replacement and (before.strip() or after.strip("; \t\r\n")):
+            replacement = "pass"
+        # keep the line numbers of the rest of the script, so tracebacks still match
+        span = node.end_lineno - node.lineno
+        lines[node.lineno - 1:node.end_lineno] = [before + replacement + (after or "\n")] + ["\n"] * span
+    return "".join(lines)
+
+
+def main():
+    missing = {}
+    for module, names in MODULES.items():
+        public = [name for name in vars(importlib.import_module(module)) if not name.startswith("_")]
+        new = sorted(set(public) - set(names))
+        if new:
+            missing[module] = new
+    for module, names in missing.items():
+        print(f"{module}: {', '.join(names)}")
+    sys.exit(1 if missing else 0)
+
+
+if __name__ == "__main__":
+    main()
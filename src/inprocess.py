@@ -0,0 +1,229 @@
+"""
+Run `ConciergeWorkflow` inside the API server's event loop instead of in a child process.
+
+Every session gets its own workflow run. Human input comes from a `QueueInputProvider`
+passed in with `run(input_provider=...)`, so waiting for the next message is an awaited
+queue read and one process can serve many conversations at once. Sessions live in a
+`SessionStore`, which bounds how many runs stay resident.
+"""
+import asyncio
+import importlib
+import logging
+import os
+import time
+from typing import AsyncIterator, Optional, Tuple
+
+import checkpoint
+import sandbox
+from input_provider import QueueInputProvider, TurnEnd, WorkflowDone
+from session_store import SessionStore, snapshot_state
+from worker_pool import SessionMovedError, WorkerCrashedError
+
+logger = logging.getLogger(__name__)
+
+
+class WorkflowSession:
+    """
+    One conversation with a `ConciergeWorkflow` running in this process.
+
+    Offers the same `send_turn` / `stream_turn` interface as `WorkflowWorker`; their
+    `session_id` is ignored, the run is this session's own. When the workflow finishes
+    (the user said goodbye) the next turn starts a new run. `state` is conversation
+    state spilled by the session store; the first run picks it up.
+    """
+
+    def __init__(self, session_id: str, workflow_cls, state: Optional[dict] = None):
+        self.session_id = session_id
+        self.workflow_cls = workflow_cls
+        self.state = state
+        self.provider: Optional[QueueInputProvider] = None
+        self.handler = None
+        self.lock = asyncio.Lock()
+        self.runs = 0
+        self.turns = 0
+        self.started_at: Optional[float] = None
+        self.last_used = time.time()
+        # set by the session store when it evicts this session
+        self.closed = False
+
+    def start(self):
+        self.provider = QueueInputProvider()
+        workflow = self.workflow_cls(timeout=None, verbose=False)
+        self.handler = workflow.run(input_provider=self.provider, session_state=self.state,
+                                    checkpoint_id=self.session_id)
+        self.handler.add_done_callback(self._on_done)
+        self.runs += 1
+        self.started_at = time.time()
+
+    def _on_done(self, handler):
+        if handler.cancelled():
+            done = WorkflowDone(error=asyncio.CancelledError())
+        elif handler.exception() is not None:
+            done = WorkflowDone(error=handler.exception())
+        else:
+            done = WorkflowDone(result=handler.result())
+        self.provider.outbox.put_nowait(done)
+
+    async def stop(self):
+        if self.is_alive():
+            # cancel the step tasks (they are waiting on the inbox); the run itself then
+            # stops without resolving the handler
+            tasks = list(self.handler.ctx._tasks) if self.handler.ctx else []
+            for task in tasks:
+                task.cancel()
+            if not tasks:
+                self.handler.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+        self.handler = None
+
+    def snapshot(self) -> Optional[dict]:
+        """The conversation state to spill when this session is evicted."""
+        ctx = self.handler.ctx if self.handler is not None else None
+        if ctx is not None and "user" in ctx.data:
+            return snapshot_state(ctx.data)
+        return self.state
+
+    def is_alive(self) -> bool:
+        return self.handler is not None and not self.handler.done()
+
+    async def _read_turn(self) -> AsyncIterator[str]:
+        """Yield the reply as it is generated until the workflow asks for input or finishes."""
+        while True:
+            item = await self.provider.outbox.get()
+            if isinstance(item, TurnEnd):
+                return
+            if isinstance(item, WorkflowDone):
+                self.handler = None
+                self.state = None
+                if item.error is not None:
+                    raise WorkerCrashedError(
+                        f"Workflow for session {self.session_id} failed: {item.error!r}"
+                    ) from item.error
+                return
+            yield item
+
+    async def _ensure_ready(self):
+        if not self.is_alive():
+            self.start()
+            greeting = "".join([text async for text in self._read_turn()])
+            logger.debug("Session %s greeting: %s", self.session_id, greeting)
+
+    async def send_turn(self, text: str, session_id: Optional[str] = None) -> Tuple[str, str]:
+        """
+        Send one user message to the workflow and wait for the whole reply.
+
+        Args:
+            text (str): The user message.
+
+        Returns:
+            tuple[str, str]: The reply and an empty debug string; in-process runs log
+                through `logging` instead.
+
+        Raises:
+            SessionMovedError: The store evicted this session while the turn waited for it.
+        """
+        async with self.lock:
+            if self.closed:
+                raise SessionMovedError(f"Session {self.session_id} was evicted")
+            await self._ensure_ready()
+            self.provider.inbox.put_nowait(text)
+            response = "".join([chunk async for chunk in self._read_turn()])
+            self.turns += 1
+            self.last_used = time.time()
+            return response, ""
+
+    async def stream_turn(self, text: str, session_id: Optional[str] = None) -> AsyncIterator[str]:
+        """
+        Send one user message to the workflow and yield the reply as it is generated.
+
+        Args:
+            text (str): The user message.
+
+        Yields:
+            str: Pieces of the reply, in order.
+
+        Raises:
+            SessionMovedError: The store evicted this session while the turn waited for it.
+        """
+        async with self.lock:
+            if self.closed:
+                raise SessionMovedError(f"Session {self.session_id} was evicted")
+            await self._ensure_ready()
+            self.provider.inbox.put_nowait(text)
+            turn = self._read_turn()
+            try:
+                async for chunk in turn:
+                    yield chunk
+            finally:
+                async for _ in turn:
+                    pass
+                self.turns += 1
+                self.last_used = time.time()
+
+    def status(self) -> dict:
+        return {
+            "id": self.session_id,
+            "alive": self.is_alive(),
+            "busy": self.lock.locked(),
+            "runs": self.runs,
+            "turns": self.turns,
+            "uptime": round(time.time() - self.started_at, 1) if self.started_at else None,
+        }
+
+
+class InProcessPool:
+    """
+    Serves every session from workflow runs in the current event loop.
+
+    A drop-in for `WorkerPool` in `api-wrapper.py`: `worker_for` hands out the
+    session's `WorkflowSession` instead of a process.
+    """
+
+    def __init__(self, workflow_cls):
+        self.workflow_cls = workflow_cls
+        self.sessions = SessionStore(self._new_session)
+
+    @classmethod
+    def from_env(cls) -> "InProcessPool":
+        script = os.environ.get("WORKFLOW_SCRIPT", "workflows.py")
+        module = importlib.import_module(os.path.splitext(os.path.basename(script))[0])
+        checkpoint.install_from_env()
+        pool = cls(module.ConciergeWorkflow)
+        pool.sessions = SessionStore.from_env(pool._new_session)
+        return pool
+
+    def _new_session(self, session_id: str, state: Optional[dict]) -> WorkflowSession:
+        return WorkflowSession(session_id, self.workflow_cls, state)
+
+    async def start(self):
+        await self.sessions.start()
+
+    async def stop(self):
+        await self.sessions.stop()
+
+    def worker_for(self, session_id: str) -> WorkflowSession:
+        return self.sessions.get(session_id)
+
+    async def open_session(self, session_id: str) -> WorkflowSession:
+        """A run of its own for `session_id` that the session store neither holds nor evicts."""
+        return WorkflowSession(session_id, self.workflow_cls)
+
+    async def close_session(self, session: WorkflowSession):
+        session.closed = True
+        async with session.lock:
+            await session.stop()
+
+    def sandbox_stats(self) -> Optional[dict]:
+        """In-process runs share this process's sandbox pool."""
+        return sandbox.stats()
+
+    async def resize(self, size: int):
+        """Nothing to resize: in-process runs share the server's event loop."""
+
+    def status(self) -> dict:
+        return {
+            "mode": "inprocess",
+            "sessions": len(self.sessions),
+            "store": self.sessions.stats(),
+            "workers": [s.status() for s in self.sessions.sessions.values()],
+        }
@@ -0,0 +1,84 @@
+"""
+Where the workflow gets human input from and sends its replies to.
+
+`ConciergeWorkflow` reads the provider from `ctx.data["input_provider"]`; it is passed
+in through `run(input_provider=...)` and defaults to the console.
+"""
+import asyncio
+from typing import Any, Optional
+
+import ipc
+import metrics
+import sandbox
+
+
+class InputProvider:
+    """The interface the workflow steps use to talk to the human."""
+
+    # the session the last message came from, when one process serves several
+    session_id: Optional[str] = None
+
+    def respond(self, text: str):
+        """Send a piece of the assistant reply."""
+        raise NotImplementedError
+
+    async def ask(self, prompt: str = "> ") -> str:
+        """Wait for the next user message."""
+        raise NotImplementedError
+
+
+class ConsoleInputProvider(InputProvider):
+    """
+    Talks to stdin/stdout, or to the API wrapper when the process runs under it.
+
+    `input()` blocks, so it runs in a thread and the event loop stays free. Under the
+    wrapper, the metrics collected during the turn and the sandbox pool's stats are
+    sent along before the prompt.
+    """
+
+    def respond(self, text: str):
+        ipc.respond(text)
+
+    async def ask(self, prompt: str = "> ") -> str:
+        if ipc.channel is not None:
+            ipc.channel.send(ipc.METRICS, metrics=metrics.REGISTRY.snapshot(), sandbox=sandbox.stats())
+        return await asyncio.to_thread(ipc.ask, prompt)
+
+    @property
+    def session_id(self) -> Optional[str]:
+        return ipc.channel.session_id if ipc.channel is not None else None
+
+
+class TurnEnd:
+    """Put on the outbox when the workflow is waiting for input."""
+
+    def __init__(self, prompt: str):
+        self.prompt = prompt
+
+
+class WorkflowDone:
+    """Put on the outbox when the workflow run has finished."""
+
+    def __init__(self, result: Any = None, error: BaseException = None):
+        self.result = result
+        self.error = error
+
+
+class QueueInputProvider(InputProvider):
+    """
+    Exchanges messages with a workflow running in the same event loop.
+
+    Reply pieces (str), `TurnEnd` and `WorkflowDone` markers go on `outbox`; the
+    workflow waits on `inbox` for the next user message.
+    """
+
+    def __init__(self):
+        self.inbox: asyncio.Queue = asyncio.Queue()
+        self.outbox: asyncio.Queue = asyncio.Queue()
+
+    def respond(self, text: str):
+        self.outbox.put_nowait(text)
+
+    async def ask(self, prompt: str = "> ") -> str:
+        self.outbox.put_nowait(TurnEnd(prompt))
+        return await self.inbox.get()
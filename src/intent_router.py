@@ -0,0 +1,248 @@
+"""
+Local intent routing in front of the orchestrator LLM.
+
+Most turns are plain requests like "draw the diagram" or "how much will this cost". The
+orchestrator answers those with a full tool-calling LLM round trip just to choose an
+`emit_*` tool. The router tries two cheap tiers first:
+
+1. Keyword rules (`RULES`), mostly requests that open by telling the assistant what to
+   do, so that requirements which only mention prices or a knowledge base don't match.
+   Exactly one intent has to match, and nothing in `DEFER`.
+2. A TF-IDF nearest-route classifier over each tool's description and a few example
+   requests (`EXAMPLES`).
+
+A request is dispatched locally only when a tier is confident about it. Everything else,
+including anything that looks like several intents, still goes to the LLM. Some routes
+are held to more: stopping ends the conversation, so only the exact rule for it counts
+(`RULE_ONLY`), and routes that act on the requirements are only taken locally once the
+user has confirmed them (`NEEDS_CONFIRMED`, see `confirms`).
+
+Decisions and their latency are recorded in `intent_router_decisions_total` and
+`intent_router_seconds`. `router_stats` turns those into a hit rate and an estimate of
+the LLM time saved.
+
+Settings:
+    INTENT_ROUTER: "off" sends every request to the LLM.
+    INTENT_ROUTER_THRESHOLD: Minimum classifier similarity to dispatch (default 0.3).
+    INTENT_ROUTER_MARGIN: Minimum lead over the runner-up route (default 0.1).
+"""
+import math
+import os
+import re
+import time
+from collections import Counter as TermCounts
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+import metrics
+
+# Requests matching one of these go straight to the intent; checked before the classifier
+RULES: Dict[str, List[str]] = {
+    "stop": [r"^\W*(exit|quit|stop|bye|goodbye)\W*$"],
+    "report": [r"^\W*(please )?(generate|create|make|write|produce|give me)\b[^.?!]*\breport\b",
+               r"^\W*report\W*$"],
+    "price_lookup": [r"^\W*(please )?(look up|lookup|check|get|find|show|compare)\b[^.?!]*\b(price|prices|pricing|costs?)\b",
+                     r"^\W*how much (will|would|does|do|is|are)\b[^.?!]*\b(cost|costs|pay|charge|bill)\b"],
+    "text_to_diagram": [r"\b(draw|diagram|diagrams)\b"],
+    "text_to_rag": [r"^\W*(please )?(search|query|check|ask)\b[^.?!]*\b(knowledge base|rag)\b",
+                    r"^\W*(please )?look for the best\b"],
+    "estimate": [r"\b(full|complete|whole) (estimate|estimation)\b", r"\bestimate everything\b"],
+}
+
+# Routes only their rules may choose; the classifier would end conversations on "stop using X"
+RULE_ONLY = frozenset({"stop"})
+
+# Routes that act on the requirements; before the user confirmed them, "go ahead" or
+# "draw it" is part of the conversation about them, which the LLM follows
+NEEDS_CONFIRMED = frozenset({"estimate", "text_to_diagram"})
+
+# Requests about something no local route handles (fixing generated code), or about
+# doing something later or not at all, always go to the LLM
+DEFER = re.compile(r"\b(fix|fixes|error|errors|import|imports|syntax|debug|later|afterwards|not yet|don't|do not)\b",
+                   re.IGNORECASE)
+
+# Replies that approve the requirements the assistant gathered
+CONFIRM = re.compile(r"^\W*(yes|yeah|yep|sure|ok|okay|confirmed|approved|looks good|sounds good|go ahead|proceed)\b",
+                     re.IGNORECASE)
+
+# Extra training text for the classifier, next to each emit_* tool's description
+EXAMPLES: Dict[str, List[str]] = {
+    "report": ["summarize the final architecture in a document", "export the estimate"],
+    "price_lookup": ["what will the monthly bill be", "estimate the spend for these services",
+                     "how expensive is an EC2 instance"],
+    "text_to_diagram": ["sketch the architecture", "visualize the system as a picture",
+                        "render the AWS architecture"],
+    "text_to_rag": ["which AWS services fit these requirements", "find the recommended services",
+                    "retrieve best practices for this design"],
+    "estimate": ["the requirements are confirmed, do everything", "go ahead with the whole thing"],
+}
+
+STOPWORDS = frozenset(
+    "a an and are as at be call can do for from how i if in is it me my of on or please "
+    "that the this to user wants we what with you your".split()
+)
+
+ROUTER_DECISIONS = metrics.REGISTRY.counter(
+    "intent_router_decisions_total", "Orchestrator turns by how the route was chosen", ["source", "route"])
+ROUTER_SECONDS = metrics.REGISTRY.histogram(
+    "intent_router_seconds", "Time to choose a route", ["source"],
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 2.5, 5, 10, 30))
+
+
+class Route(NamedTuple):
+    intent: str
+    confidence: float
+    source: str
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase word stems without stopwords: 'Drawing diagrams' -> ['draw', 'diagram']."""
+    tokens = []
+    for word in re.findall(r"[a-z0-9]+", text.lower()):
+        if word in STOPWORDS:
+            continue
+        for suffix in ("ing", "ed", "es", "s"):
+            if len(word) > len(suffix) + 3 and word.endswith(suffix):
+                word = word[:-len(suffix)]
+                break
+        tokens.append(word)
+    return tokens
+
+
+class IntentRouter:
+    """
+    Picks an orchestrator route without the LLM when the request is unambiguous.
+
+    Args:
+        descriptions (dict[str, str]): Route name -> description, usually the docstring of
+            its `emit_*` tool.
+        threshold (float): Minimum cosine similarity for the classifier to dispatch.
+        margin (float): Minimum lead of the best route over the runner-up.
+        enabled (bool): When False, `route` always returns None.
+    """
+
+    def __init__(self, descriptions: Dict[str, str], threshold: float = 0.3, margin: float = 0.1,
+                 enabled: bool = True):
+        self.threshold = threshold
+        self.margin = margin
+        self.enabled = enabled
+        self.rules = {
+            intent: [re.compile(pattern, re.IGNORECASE) for pattern in RULES.get(intent, [])]
+            for intent in descriptions
+        }
+        documents = {
+            intent: tokenize(" ".join([description, *EXAMPLES.get(intent, [])]))
+            for intent, description in descriptions.items() if intent not in RULE_ONLY
+        }
+        frequency = TermCounts(term for tokens in documents.values() for term in set(tokens))
+        self.idf = {term: math.log((1 + len(documents)) / (1 + count)) + 1 for term, count in frequency.items()}
+        self.vectors = {intent: self._vector(tokens) for intent, tokens in documents.items()}
+
+    @classmethod
+    def from_tools(cls, tools: Iterable, prefix: str = "emit_", exclude: Iterable[str] = ()) -> "IntentRouter":
+        """
+        Build a router over `FunctionTool`s named `<prefix><route>`; read settings from the environment.
+
+        Args:
+            tools (list[FunctionTool]): The orchestrator's tools.
+            prefix (str): Stripped from tool names to get the route names.
+            exclude (list[str]): Routes that must always go through the LLM.
+        """
+        descriptions = {}
+        for tool in tools:
+            name = tool.metadata.name
+            if name.startswith(prefix) and name[len(prefix):] not in exclude:
+                # the description starts with the signature; keep the docstring part
+                descriptions[name[len(prefix):]] = tool.metadata.description.split("\n", 1)[-1]
+        return cls(
+            descriptions,
+            threshold=float(os.environ.get("INTENT_ROUTER_THRESHOLD", "0.3")),
+            margin=float(os.environ.get("INTENT_ROUTER_MARGIN", "0.1")),
+            enabled=os.environ.get("INTENT_ROUTER", "on").lower() not in ("off", "0", "false"),
+        )
+
+    def _vector(self, tokens: List[str]) -> Dict[str, float]:
+        weights = {term: count * self.idf.get(term, 0) for term, count in TermCounts(tokens).items()}
+        norm = math.sqrt(sum(w * w for w in weights.values()))
+        return {term: w / norm for term, w in weights.items() if w} if norm else {}
+
+    def match_rules(self, text: str) -> Optional[str]:
+        """The one intent whose rules match `text`, or None when none or several do."""
+        matched = [intent for intent, patterns in self.rules.items() if any(p.search(text) for p in patterns)]
+        return matched[0] if len(matched) == 1 else None
+
+    def scores(self, text: str) -> List[Tuple[str, float]]:
+        """Cosine similarity of `text` to every route, best first."""
+        query = self._vector(tokenize(text))
+        ranked = [
+            (intent, sum(weight * vector.get(term, 0) for term, weight in query.items()))
+            for intent, vector in self.vectors.items()
+        ]
+        return sorted(ranked, key=lambda pair: pair[1], reverse=True)
+
+    def classify(self, text: str) -> Optional[Route]:
+        ranked = self.scores(text)
+        if not ranked:
+            return None
+        best, score = ranked[0]
+        runner_up = ranked[1][1] if len(ranked) > 1 else 0
+        if score >= self.threshold and score - runner_up >= self.margin:
+            return Route(best, round(score, 3), "classifier")
+        return None
+
+    def confirms(self, text: str) -> bool:
+        """Whether `text` approves the requirements, e.g. "yes, go ahead"; negations don't."""
+        return bool(CONFIRM.search(text)) and not DEFER.search(text)
+
+    def route(self, text: str, confirmed: bool = False) -> Optional[Route]:
+        """
+        Choose a route for `text` locally.
+
+        Args:
+            text (str): The user's request.
+            confirmed (bool): Whether the user has confirmed the requirements; until then
+                the `NEEDS_CONFIRMED` routes are left to the LLM.
+
+        Returns:
+            Route: The intent, the confidence and the tier that chose it; None means
+            "ask the LLM". Call `record_llm` once it has answered.
+        """
+        if not self.enabled or not text.strip() or DEFER.search(text):
+            return None
+        start = time.perf_counter()
+        intent = self.match_rules(text)
+        route = Route(intent, 1.0, "rule") if intent else self.classify(text)
+        if route and route.intent in NEEDS_CONFIRMED and not confirmed:
+            route = None
+        if route:
+            ROUTER_DECISIONS.inc(source=route.source, route=route.intent)
+            ROUTER_SECONDS.observe(time.perf_counter() - start, source=route.source)
+        return route
+
+    def record_llm(self, seconds: float):
+        """Record a turn the LLM had to route, and how long that took."""
+        ROUTER_DECISIONS.inc(source="llm", route="")
+        ROUTER_SECONDS.observe(seconds, source="llm")
+
+
+def router_stats(registry: metrics.Registry = metrics.REGISTRY) -> dict:
+    """
+    Hit rate of the local tiers and the LLM routing time they saved.
+
+    The saving is the number of local decisions times the mean time of an LLM-routed turn.
+    """
+    decisions = registry.metrics["intent_router_decisions_total"]
+    seconds = registry.metrics["intent_router_seconds"]
+    by_source = {"rule": 0, "classifier": 0, "llm": 0}
+    for (source, _), count in decisions.values.items():
+        by_source[source] = by_source.get(source, 0) + count
+    total = sum(by_source.values())
+    hits = by_source["rule"] + by_source["classifier"]
+    llm = seconds.values.get(("llm",))
+    llm_mean = llm[-1] / sum(llm[:-1]) if llm and sum(llm[:-1]) else 0
+    local = [seconds.values.get((source,)) for source in ("rule", "classifier")]
+    local_seconds = sum(counts[-1] for counts in local if counts)
+    return {
+        "decisions": by_source,
+        "hit_rate": round(hits / total, 3) if total else 0,
+        "seconds_saved": round(max(0.0, hits * llm_mean - local_seconds), 3),
+    }
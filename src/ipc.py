@@ -0,0 +1,161 @@
+"""
+Framed message protocol between a workflow process and `api-wrapper.py`.
+
+Every message is a 5-byte header (channel id, payload length) followed by a UTF-8
+JSON object. The channel lives in the header, so a reader can route or skip a frame
+without parsing its payload, and the cost of finding a turn boundary no longer
+depends on how much the workflow logs.
+
+Channels:
+    RESPONSE  workflow -> wrapper  {"text": ...}    a piece of the assistant reply
+    DEBUG     workflow -> wrapper  {"text": ...}    anything the workflow prints
+    TURN      workflow -> wrapper  {"prompt": ...}  the workflow is waiting for input
+    INPUT     wrapper -> workflow  {"text": ..., "session_id": ...}
+                                                    the next user message and whose it is
+    METRICS   workflow -> wrapper  {"metrics": ..., "sandbox": ...}
+                                                    a `metrics.REGISTRY` snapshot and the
+                                                    `sandbox.stats()`, sent before TURN
+
+A workflow opts in by calling `install_from_env()`; it only switches to framed I/O
+when started with RAGFORMATION_IPC=1, so it still runs as a console program.
+"""
+import io
+import json
+import os
+import struct
+import sys
+import threading
+from typing import BinaryIO, Optional, Tuple
+
+from colorama import Fore, Style
+
+RESPONSE = 1
+DEBUG = 2
+TURN = 3
+INPUT = 4
+METRICS = 5
+
+HEADER = struct.Struct(">BI")
+ENV_FLAG = "RAGFORMATION_IPC"
+
+
+def encode_frame(channel: int, **payload) -> bytes:
+    body = json.dumps(payload).encode()
+    return HEADER.pack(channel, len(body)) + body
+
+
+def decode_payload(body: bytes) -> dict:
+    return json.loads(body)
+
+
+def read_frame(stream: BinaryIO) -> Optional[Tuple[int, bytes]]:
+    """Read one frame from a blocking binary stream; returns None at end of stream."""
+    header = _read_exactly(stream, HEADER.size)
+    if header is None:
+        return None
+    channel, length = HEADER.unpack(header)
+    body = _read_exactly(stream, length)
+    if body is None:
+        return None
+    return channel, body
+
+
+def _read_exactly(stream: BinaryIO, size: int) -> Optional[bytes]:
+    data = b""
+    while len(data) < size:
+        chunk = stream.read(size - len(data))
+        if not chunk:
+            return None
+        data += chunk
+    return data
+
+
+async def read_frame_async(reader) -> Tuple[int, bytes]:
+    """Read one frame from an asyncio StreamReader; raises asyncio.IncompleteReadError at end of stream."""
+    channel, length = HEADER.unpack(await reader.readexactly(HEADER.size))
+    return channel, await reader.readexactly(length)
+
+
+class IPCChannel:
+    """The workflow side of the protocol."""
+
+    def __init__(self, out: BinaryIO, inp: BinaryIO):
+        self.out = out
+        self.inp = inp
+        self._lock = threading.Lock()
+        # the session the last user message came from
+        self.session_id: Optional[str] = None
+
+    def send(self, channel: int, **payload):
+        frame = encode_frame(channel, **payload)
+        with self._lock:
+            self.out.write(frame)
+            self.out.flush()
+
+    def respond(self, text: str):
+        self.send(RESPONSE, text=text)
+
+    def ask(self, prompt: str) -> str:
+        self.send(TURN, prompt=prompt)
+        frame = read_frame(self.inp)
+        if frame is None:
+            raise EOFError("The wrapper closed the input channel")
+        channel, body = frame
+        if channel != INPUT:
+            raise ValueError(f"Expected an input frame, got channel {channel}")
+        payload = decode_payload(body)
+        self.session_id = payload.get("session_id")
+        return payload["text"]
+
+
+class DebugWriter(io.TextIOBase):
+    """A stand-in for sys.stdout that sends everything printed as DEBUG frames."""
+
+    def __init__(self, channel: IPCChannel):
+        self.channel = channel
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, text: str) -> int:
+        if text:
+            self.channel.send(DEBUG, text=text)
+        return len(text)
+
+
+channel: Optional[IPCChannel] = None
+
+
+def install_from_env() -> Optional[IPCChannel]:
+    """
+    Switch this process to framed I/O if it was started by the API wrapper.
+
+    The original stdout descriptor is kept for frames; file descriptor 1 is pointed at
+    stderr so that writes bypassing sys.stdout can't corrupt the stream, and
+    `print()` output becomes DEBUG frames.
+    """
+    global channel
+    if channel is not None or os.environ.get(ENV_FLAG) != "1":
+        return channel
+
+    sys.stdout.flush()
+    out = os.fdopen(os.dup(1), "wb", buffering=0)
+    os.dup2(2, 1)
+    channel = IPCChannel(out, sys.stdin.buffer)
+    sys.stdout = DebugWriter(channel)
+    return channel
+
+
+def respond(text: str):
+    """Send part of the assistant reply to whoever is on the other end."""
+    if channel is not None:
+        channel.respond(text)
+    else:
+        print(Fore.MAGENTA + text + Style.RESET_ALL, end="", flush=True)
+
+
+def ask(prompt: str = "> ") -> str:
+    """Wait for the next user message."""
+    if channel is not None:
+        return channel.ask(prompt)
+    return input(prompt)
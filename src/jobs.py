@@ -0,0 +1,276 @@
+"""
+Background jobs for full architecture estimations.
+
+A job is a scripted conversation: its messages are sent one turn at a time to a
+workflow session of its own, on a fixed number of background workers. Each job gets a
+fresh conversation from the pool's `open_session` (a worker process of its own in
+subprocess mode), so it never shares one with the chat sessions. The HTTP request
+that created it returns immediately. Progress, partial replies and artifacts can then
+be polled. If a webhook URL was given, the finished job is POSTed there.
+
+Settings:
+    JOBS_CONCURRENCY: Jobs running at the same time (default 2).
+    JOBS_MAX_QUEUE: Jobs waiting to run before submissions are refused (default 100).
+    JOBS_MAX_KEPT: Finished jobs kept for polling (default 1000).
+    JOBS_DIR: Where each job's artifacts are copied (default "jobs").
+    WORKFLOW_SCRIPT: The workflow whose orchestrator tools pick the `ESTIMATION_STEPS`.
+"""
+import ast
+import asyncio
+import logging
+import os
+import shutil
+import time
+import uuid
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+import httpx
+
+from worker_pool import WorkerCrashedError
+
+logger = logging.getLogger(__name__)
+
+# The turns of a full run after the requirements (RAG -> diagram -> pricing -> report),
+# by the orchestrator tool each one is meant for
+ESTIMATION_STEPS = {
+    "emit_text_to_rag": "Search the knowledge base for the best services for these requirements.",
+    "emit_text_to_diagram": "Draw the architecture diagram for these requirements.",
+    "emit_price_lookup": "Look up the price of every service in the architecture.",
+    "emit_report": "Generate the report.",
+}
+
+QUEUED, RUNNING, SUCCEEDED, FAILED = "queued", "running", "succeeded", "failed"
+
+
+def estimation_steps(script: str) -> List[str]:
+    """
+    The `ESTIMATION_STEPS` the orchestrator of the workflow in `script` has a tool for.
+
+    The script is parsed, not imported, so the server doesn't load the workflow's
+    dependencies; all steps are returned when it can't be read.
+    """
+    try:
+        with open(script) as f:
+            tree = ast.parse(f.read())
+    except (OSError, SyntaxError) as e:
+        logger.warning("Cannot read the orchestrator tools of %s: %s", script, e)
+        return list(ESTIMATION_STEPS.values())
+    functions = {node.name for node in ast.walk(tree) if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef))}
+    return [message for tool, message in ESTIMATION_STEPS.items() if tool in functions]
+
+
+class JobQueueFullError(Exception):
+    """Raised when a job is submitted while the queue is full."""
+
+
+class Job:
+    def __init__(self, messages: List[str], webhook_url: Optional[str] = None):
+        self.id = uuid.uuid4().hex
+        self.messages = messages
+        self.webhook_url = webhook_url
+        self.status = QUEUED
+        self.results: List[dict] = []
+        self.artifacts: List[dict] = []
+        self.error: Optional[str] = None
+        self.webhook_status: Optional[str] = None
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+
+    @property
+    def session_id(self) -> str:
+        return f"job-{self.id}"
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "status": self.status,
+            "progress": {"completed": len(self.results), "total": len(self.messages)},
+            "results": self.results,
+            "artifacts": self.artifacts,
+            "error": self.error,
+            "webhook_status": self.webhook_status,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+
+
+class JobManager:
+    """
+    Runs jobs on `concurrency` background workers against a worker pool.
+
+    Args:
+        pool: The `WorkerPool` or `InProcessPool` the chat endpoints use; each job runs
+            in a session from its `open_session`.
+        steps (list[str]): The turns after the requirements when a job gives none;
+            defaults to every `ESTIMATION_STEPS` message.
+        concurrency (int): Jobs running at the same time.
+        max_queue (int): Jobs waiting to run before submissions are refused.
+        max_jobs (int): Finished jobs kept for polling; the oldest are forgotten first.
+        jobs_dir (str): Where each job's artifacts are copied.
+        workdir (str): The directory the workflow writes its files to.
+    """
+
+    def __init__(self, pool, steps: Optional[List[str]] = None, concurrency: int = 2, max_queue: int = 100,
+                 max_jobs: int = 1000, jobs_dir: str = "jobs", workdir: Optional[str] = None,
+                 webhook_retries: int = 3):
+        self.pool = pool
+        self.steps = list(ESTIMATION_STEPS.values()) if steps is None else steps
+        self.concurrency = max(1, concurrency)
+        self.max_queue = max_queue
+        self.max_jobs = max_jobs
+        self.jobs_dir = jobs_dir
+        self.workdir = workdir or getattr(pool, "cwd", None) or os.getcwd()
+        self.webhook_retries = webhook_retries
+        self.jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self.queue: Optional[asyncio.Queue] = None
+        self._workers: List[asyncio.Task] = []
+
+    @classmethod
+    def from_env(cls, pool) -> "JobManager":
+        return cls(
+            pool,
+            steps=estimation_steps(os.environ.get("WORKFLOW_SCRIPT", "workflows.py")),
+            concurrency=int(os.environ.get("JOBS_CONCURRENCY", "2")),
+            max_queue=int(os.environ.get("JOBS_MAX_QUEUE", "100")),
+            max_jobs=int(os.environ.get("JOBS_MAX_KEPT", "1000")),
+            jobs_dir=os.environ.get("JOBS_DIR", "jobs"),
+        )
+
+    async def start(self):
+        self.queue = asyncio.Queue(maxsize=self.max_queue)
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(self.concurrency)]
+
+    async def stop(self):
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    def submit(self, request: str, messages: Optional[List[str]] = None,
+               webhook_url: Optional[str] = None) -> Job:
+        """
+        Queue a job.
+
+        Args:
+            request (str): The requirements; the first message of the conversation.
+            messages (list[str]): The turns after it; defaults to the manager's `steps`.
+            webhook_url (str): Where to POST the job when it finishes.
+
+        Returns:
+            Job: The queued job.
+
+        Raises:
+            JobQueueFullError: Too many jobs are waiting already.
+        """
+        job = Job([request, *(self.steps if messages is None else messages)], webhook_url)
+        try:
+            self.queue.put_nowait(job)
+        except asyncio.QueueFull:
+            raise JobQueueFullError(f"{self.queue.qsize()} jobs are already waiting")
+        self.jobs[job.id] = job
+        self._forget_finished()
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        return self.jobs.get(job_id)
+
+    def artifact_path(self, job: Job, name: str) -> Optional[str]:
+        if not any(artifact["name"] == name for artifact in job.artifacts):
+            return None
+        return os.path.join(self.jobs_dir, job.id, name)
+
+    def _forget_finished(self):
+        for job_id in list(self.jobs):
+            if len(self.jobs) <= self.max_jobs:
+                return
+            if self.jobs[job_id].status in (SUCCEEDED, FAILED):
+                del self.jobs[job_id]
+                shutil.rmtree(os.path.join(self.jobs_dir, job_id), ignore_errors=True)
+
+    async def _worker(self):
+        while True:
+            job = await self.queue.get()
+            try:
+                await self.run(job)
+            except Exception:
+                logger.exception("Job %s crashed", job.id)
+            finally:
+                self.queue.task_done()
+
+    async def run(self, job: Job):
+        job.status = RUNNING
+        job.started_at = time.time()
+        before = self._snapshot_files()
+        worker = None
+        try:
+            worker = await self.pool.open_session(job.session_id)
+            for message in job.messages:
+                response, _ = await worker.send_turn(message, job.session_id)
+                job.results.append({"request": message, "response": response, "finished_at": time.time()})
+            job.status = SUCCEEDED
+        except WorkerCrashedError as e:
+            job.status = FAILED
+            job.error = str(e)
+        except Exception as e:
+            logger.exception("Job %s failed", job.id)
+            job.status = FAILED
+            job.error = repr(e)
+        finally:
+            if worker is not None:
+                await self.pool.close_session(worker)
+            job.finished_at = time.time()
+            job.artifacts = self._collect_artifacts(job, before)
+
+        if job.webhook_url:
+            await self._notify(job)
+
+    def _snapshot_files(self) -> Dict[str, float]:
+        files = {}
+        for entry in os.scandir(self.workdir):
+            if entry.is_file():
+                files[entry.name] = entry.stat().st_mtime
+        return files
+
+    def _collect_artifacts(self, job: Job, before: Dict[str, float]) -> List[dict]:
+        """
+        Copy the files the workflow wrote during the job into the job's directory.
+
+        Jobs share the workflow's working directory, so a file written by another job
+        running at the same time may be picked up as well.
+        """
+        changed = [name for name, mtime in self._snapshot_files().items() if before.get(name) != mtime]
+        if not changed:
+            return []
+        target = os.path.join(self.jobs_dir, job.id)
+        os.makedirs(target, exist_ok=True)
+        artifacts = []
+        for name in sorted(changed):
+            shutil.copy2(os.path.join(self.workdir, name), os.path.join(target, name))
+            artifacts.append({
+                "name": name,
+                "size": os.path.getsize(os.path.join(target, name)),
+                "url": f"/v1/jobs/{job.id}/artifacts/{name}",
+            })
+        return artifacts
+
+    async def _notify(self, job: Job):
+        async with httpx.AsyncClient(timeout=10) as client:
+            for attempt in range(self.webhook_retries):
+                try:
+                    response = await client.post(job.webhook_url, json=job.to_dict())
+                    job.webhook_status = str(response.status_code)
+                    if response.is_success:
+                        return
+                except httpx.HTTPError as e:
+                    job.webhook_status = f"error: {e}"
+                await asyncio.sleep(2 ** attempt)
+        logger.warning("Webhook for job %s failed: %s", job.id, job.webhook_status)
+
+    def stats(self) -> dict:
+        counts = {QUEUED: 0, RUNNING: 0, SUCCEEDED: 0, FAILED: 0}
+        for job in self.jobs.values():
+            counts[job.status] += 1
+        return {"concurrency": self.concurrency, "jobs": counts}
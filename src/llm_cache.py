@@ -0,0 +1,243 @@
+"""
+Persistent cache of LLM completions, shared by every LLM that `llm_registry.get_llm` builds.
+
+The same prompts come back again and again: the diagram template formatted with the same
+plan, the fix template with the same error, the concierge's greeting. With the cache on,
+`get_llm` builds a subclass of the provider's LLM class. Its `chat`, `achat`, `complete`,
+`acomplete`, `stream_chat` and `astream_chat` look the call up first. The subclass keeps
+`isinstance` checks and `class_name` working.
+
+The key is a hash of the LLM class, its model and sampling parameters, the messages (or
+prompt) and the call's keyword arguments, tool definitions included. Only plain text
+replies are stored. Replies that call tools pass through, because the tool call objects
+do not survive a round trip through JSON. A hit makes no provider call. It therefore
+shows up in neither `llm_calls_total` nor the token counters.
+
+Entries are JSON files, bounded by `LLM_CACHE_SIZE` and evicted least recently used
+first (`response_cache.DiskBackend`).
+
+The cache is opt-in: agents retry a failed step by asking again, and an exact cache
+would hand a sampled call the same failed answer every time.
+
+Settings:
+    LLM_CACHE: "off" (default) disables the cache. "temperature0" caches only
+        deterministic calls: temperature 0 and a single choice, whether set on the LLM,
+        in its `additional_kwargs` or on the call. "exact" caches every call.
+    LLM_CACHE_DIR: Where entries are kept (default .llm_cache).
+    LLM_CACHE_SIZE: Most entries kept (default 2048).
+"""
+import contextvars
+import hashlib
+import json
+import os
+import threading
+from typing import Any, Dict, Optional, Sequence
+
+from llama_index.core.base.llms.types import ChatMessage, ChatResponse, CompletionResponse, MessageRole
+
+from response_cache import ResponseCache
+
+MODES = ("off", "exact", "temperature0")
+
+# LLM attributes that change the answer, besides the messages
+PARAM_FIELDS = ("model", "temperature", "max_tokens", "top_p", "top_k", "stop", "additional_kwargs",
+                "system_prompt", "context_window")
+
+_lock = threading.Lock()
+_store: Optional[ResponseCache] = None
+_mode: Optional[str] = None
+_classes: Dict[type, type] = {}
+# set while a cached method runs, so a provider's `complete` that calls its own `chat`
+# is looked up once, not twice
+_inside = contextvars.ContextVar("llm_cache_inside", default=False)
+
+
+def mode() -> str:
+    global _mode
+    if _mode is None:
+        value = os.environ.get("LLM_CACHE", "off").lower()
+        _mode = value if value in MODES else "off"
+    return _mode
+
+
+def store() -> ResponseCache:
+    """The process's cache store, opened on first use."""
+    global _store
+    with _lock:
+        if _store is None:
+            size = int(os.environ.get("LLM_CACHE_SIZE", "2048")) if mode() != "off" else 0
+            _store = ResponseCache(max_entries=size, directory=os.environ.get("LLM_CACHE_DIR", ".llm_cache"))
+        return _store
+
+
+def _params(llm) -> Dict[str, Any]:
+    return {field: getattr(llm, field, None) for field in PARAM_FIELDS}
+
+
+def cache_key(llm, call: str, messages: Any, kwargs: Dict[str, Any]) -> str:
+    """
+    Hash an LLM call.
+
+    Args:
+        llm (LLM): The LLM being called; its class and `PARAM_FIELDS` go into the key.
+        call (str): "chat" or "complete"; streamed and plain calls share entries.
+        messages: The chat messages, or the prompt of a completion.
+        kwargs (dict): The call's keyword arguments.
+    """
+    if isinstance(messages, str):
+        content = messages
+    else:
+        content = [[m.role.value, m.content, m.additional_kwargs] for m in messages]
+    payload = {
+        "llm": llm.class_name(),
+        "params": _params(llm),
+        "call": call,
+        "messages": content,
+        "kwargs": kwargs,
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def deterministic(llm, kwargs: Dict[str, Any]) -> bool:
+    """Whether a call samples at temperature 0 for a single choice; the call's kwargs win over the LLM's."""
+    settings = {"temperature": getattr(llm, "temperature", None),
+                **(getattr(llm, "additional_kwargs", None) or {}), **kwargs}
+    return settings["temperature"] == 0 and settings.get("n", 1) == 1
+
+
+def _key(llm, call: str, messages: Any, kwargs: Dict[str, Any]) -> Optional[str]:
+    """The key of a cacheable call, or None when this call must go to the provider."""
+    if _inside.get() or not store().enabled:
+        return None
+    if mode() == "temperature0" and not deterministic(llm, kwargs):
+        return None
+    return cache_key(llm, call, messages, kwargs)
+
+
+def _storable(message: ChatMessage) -> bool:
+    return bool(message.content) and not message.additional_kwargs.get("tool_calls")
+
+
+def _chat_response(text: str, delta: Optional[str] = None) -> ChatResponse:
+    return ChatResponse(message=ChatMessage(role=MessageRole.ASSISTANT, content=text), delta=delta,
+                        additional_kwargs={"cached": True})
+
+
+class CachedLLM:
+    """Mixin placed in front of a provider's LLM class; see `cached_class`."""
+
+    def chat(self, messages: Sequence[ChatMessage], **kwargs: Any) -> ChatResponse:
+        key = _key(self, "chat", messages, kwargs)
+        text = store().get(key) if key else None
+        if text is not None:
+            return _chat_response(text)
+        token = _inside.set(True)
+        try:
+            response = super().chat(messages, **kwargs)
+        finally:
+            _inside.reset(token)
+        if key and _storable(response.message):
+            store().set(key, response.message.content)
+        return response
+
+    async def achat(self, messages: Sequence[ChatMessage], **kwargs: Any) -> ChatResponse:
+        key = _key(self, "chat", messages, kwargs)
+        text = store().get(key) if key else None
+        if text is not None:
+            return _chat_response(text)
+        token = _inside.set(True)
+        try:
+            response = await super().achat(messages, **kwargs)
+        finally:
+            _inside.reset(token)
+        if key and _storable(response.message):
+            store().set(key, response.message.content)
+        return response
+
+    def complete(self, prompt: str, formatted: bool = False, **kwargs: Any) -> CompletionResponse:
+        key = _key(self, "complete", prompt, {"formatted": formatted, **kwargs})
+        text = store().get(key) if key else None
+        if text is not None:
+            return CompletionResponse(text=text, additional_kwargs={"cached": True})
+        token = _inside.set(True)
+        try:
+            response = super().complete(prompt, formatted=formatted, **kwargs)
+        finally:
+            _inside.reset(token)
+        if key and response.text:
+            store().set(key, response.text)
+        return response
+
+    async def acomplete(self, prompt: str, formatted: bool = False, **kwargs: Any) -> CompletionResponse:
+        key = _key(self, "complete", prompt, {"formatted": formatted, **kwargs})
+        text = store().get(key) if key else None
+        if text is not None:
+            return CompletionResponse(text=text, additional_kwargs={"cached": True})
+        token = _inside.set(True)
+        try:
+            response = await super().acomplete(prompt, formatted=formatted, **kwargs)
+        finally:
+            _inside.reset(token)
+        if key and response.text:
+            store().set(key, response.text)
+        return response
+
+    def stream_chat(self, messages: Sequence[ChatMessage], **kwargs: Any):
+        key = _key(self, "chat", messages, kwargs)
+        text = store().get(key) if key else None
+        if text is not None:
+            return iter([_chat_response(text, delta=text)])
+        stream = super().stream_chat(messages, **kwargs)
+
+        def gen():
+            last = None
+            for last in stream:
+                yield last
+            if key and last is not None and _storable(last.message):
+                store().set(key, last.message.content)
+
+        return gen()
+
+    async def astream_chat(self, messages: Sequence[ChatMessage], **kwargs: Any):
+        key = _key(self, "chat", messages, kwargs)
+        text = store().get(key) if key else None
+        if text is not None:
+            async def replay():
+                yield _chat_response(text, delta=text)
+
+            return replay()
+        stream = await super().astream_chat(messages, **kwargs)
+
+        async def gen():
+            last = None
+            async for last in stream:
+                yield last
+            if key and last is not None and _storable(last.message):
+                store().set(key, last.message.content)
+
+        return gen()
+
+
+def cached_class(llm_class: type) -> type:
+    """The subclass of `llm_class` whose calls go through the cache; built once per class."""
+    with _lock:
+        if llm_class not in _classes:
+            _classes[llm_class] = type(f"Cached{llm_class.__name__}", (CachedLLM, llm_class),
+                                       {"__module__": __name__})
+        return _classes[llm_class]
+
+
+def enabled() -> bool:
+    return mode() != "off"
+
+
+def stats() -> dict:
+    return {"mode": mode(), **store().stats()}
+
+
+def reset():
+    """Close the store and read the settings again on next use, e.g. between tests."""
+    global _store, _mode
+    with _lock:
+        _store = None
+        _mode = None
@@ -0,0 +1,166 @@
+"""
+One LLM client per provider, model and settings for the whole process.
+
+Building a llama-index LLM builds an SDK client. Each SDK client opens its own HTTP
+connections, so a client built per call pays for a new TLS handshake every time.
+`get_llm` builds each distinct LLM once, on first use, and then returns the same
+instance.
+With the completion cache on (see `llm_cache`), that instance looks every call up first.
+With a cassette (see `cassette`), its calls are recorded or replayed, in front of the cache.
+
+LLMs of the same provider share one pooled httpx client (sync and async), whatever
+their model or settings. Connections are kept alive between calls. The pool size also
+caps how many requests run against a provider at once; more wait for a free connection.
+
+Settings:
+    LLM_MAX_CONNECTIONS: Connections per provider (default 20).
+    LLM_MAX_CONNECTIONS_<PROVIDER>: Override for one provider, e.g. LLM_MAX_CONNECTIONS_ANTHROPIC=4.
+    LLM_KEEPALIVE_EXPIRY: Seconds an idle connection is kept open (default 60).
+"""
+import importlib
+import os
+import threading
+from typing import Any, Dict, Optional, Tuple
+
+import httpx
+
+import cassette
+import llm_cache
+
+# provider -> (module, class, how its HTTP client is passed in)
+PROVIDERS: Dict[str, Tuple[str, str, str]] = {
+    "OpenAI": ("llama_index.llms.openai", "OpenAI", "openai"),
+    "AzureOpenAI": ("llama_index.llms.azure_openai", "AzureOpenAI", "openai"),
+    "Groq": ("llama_index.llms.groq", "Groq", "openai"),
+    "Anthropic": ("llama_index.llms.anthropic", "Anthropic", "anthropic"),
+    "Ollama": ("llama_index.llms.ollama", "Ollama", None),
+}
+
+_lock = threading.Lock()
+_llms: Dict[Tuple, Any] = {}
+_http: Dict[str, Tuple[httpx.Client, httpx.AsyncClient]] = {}
+_sdk_clients: Dict[Tuple, Any] = {}
+_stats = {"hits": 0, "builds": 0}
+
+
+def _limits(provider: str) -> httpx.Limits:
+    size = int(os.environ.get(f"LLM_MAX_CONNECTIONS_{provider.upper()}",
+                              os.environ.get("LLM_MAX_CONNECTIONS", "20")))
+    return httpx.Limits(
+        max_connections=size,
+        max_keepalive_connections=size,
+        keepalive_expiry=float(os.environ.get("LLM_KEEPALIVE_EXPIRY", "60")),
+    )
+
+
+def http_clients(provider: str) -> Tuple[httpx.Client, httpx.AsyncClient]:
+    """The pooled (sync, async) httpx clients shared by every LLM of `provider`."""
+    with _lock:
+        if provider not in _http:
+            limits = _limits(provider)
+            # the SDKs pass their own per-request timeouts; this only bounds the pool wait
+            timeout = httpx.Timeout(600, connect=10)
+            _http[provider] = (
+                httpx.Client(limits=limits, timeout=timeout),
+                httpx.AsyncClient(limits=limits, timeout=timeout),
+            )
+        return _http[provider]
+
+
+def _key(provider: str, params: Dict[str, Any]) -> Tuple:
+    return (provider, tuple(sorted((name, repr(value)) for name, value in params.items())))
+
+
+def _build(provider: str, params: Dict[str, Any]):
+    module, class_name, client_kind = PROVIDERS[provider]
+    llm_class = getattr(importlib.import_module(module), class_name)
+    if llm_cache.enabled():
+        llm_class = llm_cache.cached_class(llm_class)
+    if cassette.active() is not None:
+        llm_class = cassette.cassette_class(llm_class)
+    http_client, async_http_client = http_clients(provider)
+    if client_kind == "openai":
+        llm = llm_class(http_client=http_client, async_http_client=async_http_client, **params)
+    else:
+        llm = llm_class(**params)
+    if client_kind == "anthropic" and not any(params.get(k) for k in ("region", "project_id", "aws_region")):
+        # llama-index builds its own Anthropic clients and takes no http_client; swap in
+        # clients with the shared pool and the same settings
+        import anthropic
+        settings = {
+            "api_key": params.get("api_key"),
+            "base_url": params.get("base_url"),
+            "max_retries": params.get("max_retries", 10),
+            "default_headers": params.get("default_headers"),
+            "timeout": params.get("timeout"),
+        }
+        llm._client = anthropic.Anthropic(http_client=http_client, **settings)
+        llm._aclient = anthropic.AsyncAnthropic(http_client=async_http_client, **settings)
+    return llm
+
+
+def get_llm(provider: str, **params):
+    """
+    The shared LLM for `provider` with these constructor arguments, built on first use.
+
+    Args:
+        provider (str): A key of `PROVIDERS`, e.g. "Anthropic".
+        **params: Constructor arguments of the llama-index class, e.g. model="gpt-4o".
+
+    Returns:
+        LLM: The same instance for the same provider and arguments.
+
+    Raises:
+        ValueError: `provider` is not in `PROVIDERS`.
+    """
+    if provider not in PROVIDERS:
+        raise ValueError(f"Unknown LLM provider {provider!r}; expected one of {', '.join(PROVIDERS)}")
+    key = _key(provider, params)
+    with _lock:
+        llm = _llms.get(key)
+        if llm is not None:
+            _stats["hits"] += 1
+            return llm
+    llm = _build(provider, params)
+    with _lock:
+        # another thread may have built it meanwhile; keep the first
+        llm = _llms.setdefault(key, llm)
+        _stats["builds"] += 1
+    return llm
+
+
+def get_openai_client(base_url: Optional[str] = None, api_key_env: str = "OPENAI_API_KEY", name: str = "OpenAI"):
+    """
+    A shared raw `openai.OpenAI` client, e.g. for OpenAI-compatible APIs like Together.
+
+    Args:
+        base_url (str): The API's base URL; OpenAI's by default.
+        api_key_env (str): The environment variable holding the API key.
+        name (str): Which connection pool to use (see `http_clients`).
+    """
+    key = (name, base_url, api_key_env)
+    with _lock:
+        client = _sdk_clients.get(key)
+    if client is None:
+        import openai
+        client = openai.OpenAI(api_key=os.environ.get(api_key_env), base_url=base_url,
+                               http_client=http_clients(name)[0])
+        with _lock:
+            client = _sdk_clients.setdefault(key, client)
+    return client
+
+
+def stats() -> dict:
+    with _lock:
+        return {"llms": len(_llms), "pools": len(_http), **_stats}
+
+
+def reset():
+    """Forget every client and close the pools, e.g. between tests or after a fork."""
+    with _lock:
+        pools = list(_http.values())
+        _llms.clear()
+        _http.clear()
+        _sdk_clients.clear()
+    for client, _ in pools:
+        client.close()
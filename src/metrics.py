@@ -0,0 +1,365 @@
+"""
+Prometheus metrics for the workflow and the API wrapper, without extra dependencies.
+
+What is measured:
+- `workflow_step_seconds`: time spent in each `@step` of the workflow. Steps that wait
+  for the user include that wait.
+- `agent_tool_seconds`: time spent in each tool a `ConciergeAgent` calls.
+- `llm_calls_total`, `llm_call_seconds`, `llm_prompt_tokens_total`,
+  `llm_completion_tokens_total`: LLM usage per provider. These come from llama-index's
+  instrumentation events.
+- `llm_retries_total`: retries logged by the provider SDKs.
+- `agent_turn_prompt_tokens`: prompt tokens the LLM reported during one agent turn
+  (see `agent_turn`).
+- `agent_memory_tokens`: size of the history an agent sends, measured after each turn.
+- `intent_router_decisions_total`, `intent_router_seconds`: how orchestrator turns were
+  routed. They are defined in intent_router.py.
+
+The workflow runs in child processes in the default server mode. Each child sends a
+snapshot of its registry over the IPC channel at the end of every turn. The wrapper
+adds the difference since the previous snapshot to its own registry.
+"""
+import bisect
+import contextlib
+import contextvars
+import functools
+import inspect
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from llama_index.core.instrumentation import get_dispatcher
+from llama_index.core.instrumentation.event_handlers import BaseEventHandler
+from llama_index.core.instrumentation.events.llm import (
+    LLMChatEndEvent,
+    LLMChatStartEvent,
+    LLMCompletionEndEvent,
+    LLMCompletionStartEvent,
+)
+from llama_index.core.instrumentation.span.simple import SimpleSpan
+from llama_index.core.instrumentation.span_handlers import BaseSpanHandler
+from llama_index.core.workflow import Workflow
+
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, Any]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def get(self, **labels) -> float:
+        return self.values.get(self._key(labels), 0)
+
+    def snapshot(self) -> List:
+        return [[list(key), value] for key, value in self.values.items()]
+
+    def merge(self, series: List, previous: Optional[List] = None):
+        before = {tuple(key): value for key, value in previous or []}
+        with self._lock:
+            for key, value in series:
+                key = tuple(key)
+                self.values[key] = self.values.get(key, 0) + value - before.get(key, 0)
+
+    def render(self) -> List[str]:
+        return [
+            f"{self.name}{_format_labels(self.labelnames, key)} {value}"
+            for key, value in sorted(self.values.items())
+        ]
+
+
+class Histogram(Counter):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+        # per label set: a count per bucket plus +Inf, then the sum
+        self.values: Dict[Tuple[str, ...], List[float]] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts = self.values.setdefault(key, [0] * (len(self.buckets) + 2))
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            counts[-1] += value
+
+    def count(self, **labels) -> int:
+        counts = self.values.get(self._key(labels))
+        return int(sum(counts[:-1])) if counts else 0
+
+    def merge(self, series: List, previous: Optional[List] = None):
+        before = {tuple(key): value for key, value in previous or []}
+        with self._lock:
+            for key, counts in series:
+                key = tuple(key)
+                old = before.get(key, [0] * len(counts))
+                current = self.values.setdefault(key, [0] * len(counts))
+                for i, (new, prior) in enumerate(zip(counts, old)):
+                    current[i] += new - prior
+
+    def render(self) -> List[str]:
+        lines = []
+        for key, counts in sorted(self.values.items()):
+            cumulative = 0
+            for bound, count in zip(list(self.buckets) + ["+Inf"], counts[:-1]):
+                cumulative += count
+                le = f'le="{bound}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {counts[-1]}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics: Dict[str, Counter] = {}
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.metrics.setdefault(name, Counter(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self.metrics.setdefault(name, Histogram(name, documentation, labelnames, buckets))
+
+    def snapshot(self) -> Dict[str, List]:
+        return {name: metric.snapshot() for name, metric in self.metrics.items() if metric.values}
+
+    def merge(self, snapshot: Dict[str, List], previous: Optional[Dict[str, List]] = None):
+        """Add what changed between `previous` and `snapshot` (both from `snapshot()`) to this registry."""
+        previous = previous or {}
+        for name, series in snapshot.items():
+            if name in self.metrics:
+                self.metrics[name].merge(series, previous.get(name))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+def render_gauges(prefix: str, stats: Dict[str, Any]) -> str:
+    """Render the numeric values of a `stats()` dict as gauges; nested dicts become a label."""
+    lines = []
+    for name, value in stats.items():
+        metric = f"{prefix}_{name}"
+        if isinstance(value, dict):
+            values = [(f'{{kind="{_escape(k)}"}}', v) for k, v in value.items()]
+        else:
+            values = [("", value)]
+        values = [(labels, v) for labels, v in values if isinstance(v, (int, float)) and not isinstance(v, bool)]
+        if values:
+            lines.append(f"# TYPE {metric} gauge")
+            lines.extend(f"{metric}{labels} {v}" for labels, v in values)
+    return "\n".join(lines) + "\n" if lines else ""
+
+
+REGISTRY = Registry()
+
+STEP_SECONDS = REGISTRY.histogram("workflow_step_seconds", "Time spent in a workflow step", ["step"])
+STEP_ERRORS = REGISTRY.counter("workflow_step_errors_total", "Workflow steps that raised", ["step"])
+TOOL_SECONDS = REGISTRY.histogram("agent_tool_seconds", "Time spent in an agent tool call", ["agent", "tool"])
+LLM_CALLS = REGISTRY.counter("llm_calls_total", "LLM chat and completion calls", ["provider"])
+LLM_SECONDS = REGISTRY.histogram("llm_call_seconds", "Latency of LLM chat and completion calls", ["provider"])
+PROMPT_TOKENS = REGISTRY.counter("llm_prompt_tokens_total", "Prompt tokens reported by the LLM", ["provider"])
+COMPLETION_TOKENS = REGISTRY.counter("llm_completion_tokens_total", "Completion tokens reported by the LLM",
+                                     ["provider"])
+LLM_RETRIES = REGISTRY.counter("llm_retries_total", "Requests retried by the provider SDK", ["provider"])
+TOKEN_BUCKETS = (250, 500, 1000, 2000, 4000, 8000, 16000, 32000, 64000, 128000)
+TURN_PROMPT_TOKENS = REGISTRY.histogram("agent_turn_prompt_tokens", "Prompt tokens sent during one agent turn",
+                                        ["agent"], buckets=TOKEN_BUCKETS)
+MEMORY_TOKENS = REGISTRY.histogram("agent_memory_tokens", "Tokens of chat history an agent sends",
+                                   ["agent"], buckets=TOKEN_BUCKETS)
+
+# token usage of the agent turn running in the current task, see agent_turn
+_turn_usage: contextvars.ContextVar = contextvars.ContextVar("turn_usage", default=None)
+
+
+@contextlib.contextmanager
+def agent_turn(agent: str):
+    """
+    Add up the tokens of every LLM call made inside the block, as one turn of `agent`.
+
+    Yields:
+        dict: {"calls", "prompt_tokens", "completion_tokens"}, filled in as calls finish.
+    """
+    usage = {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0}
+    token = _turn_usage.set(usage)
+    try:
+        yield usage
+    finally:
+        _turn_usage.reset(token)
+        TURN_PROMPT_TOKENS.observe(usage["prompt_tokens"], agent=agent)
+
+
+def timed_tool(fn: Callable, agent: str) -> Callable:
+    """Wrap an agent tool so every call is recorded in `agent_tool_seconds`; the signature is kept for FunctionTool."""
+    if inspect.iscoroutinefunction(fn):
+        @functools.wraps(fn)
+        async def async_wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return await fn(*args, **kwargs)
+            finally:
+                TOOL_SECONDS.observe(time.perf_counter() - start, agent=agent, tool=fn.__name__)
+        return async_wrapper
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            TOOL_SECONDS.observe(time.perf_counter() - start, agent=agent, tool=fn.__name__)
+    return wrapper
+
+
+def provider_name(model_dict: Dict[str, Any]) -> str:
+    """'openai_llm' -> 'openai', 'Anthropic_LLM' -> 'anthropic', 'azure_openai_llm' -> 'azure_openai'."""
+    name = str(model_dict.get("class_name", "unknown")).lower()
+    return name[:-len("_llm")] if name.endswith("_llm") else name
+
+
+def token_usage(response: Any) -> Tuple[int, int]:
+    """The (prompt, completion) token counts of a ChatResponse or CompletionResponse, 0 when unknown."""
+    raw = getattr(response, "raw", None)
+    usage = raw.get("usage") if isinstance(raw, dict) else getattr(raw, "usage", None)
+    if usage is None:
+        usage = getattr(response, "additional_kwargs", None) or {}
+
+    def field(*names):
+        for name in names:
+            value = usage.get(name) if isinstance(usage, dict) else getattr(usage, name, None)
+            if isinstance(value, (int, float)):
+                return int(value)
+        return 0
+
+    return field("prompt_tokens", "input_tokens"), field("completion_tokens", "output_tokens")
+
+
+class StepSpanHandler(BaseSpanHandler[SimpleSpan]):
+    """Times the spans llama-index opens around every workflow step."""
+
+    def class_name(cls) -> str:
+        return "StepSpanHandler"
+
+    @staticmethod
+    def _step_name(id_: str, instance: Any) -> Optional[str]:
+        if not isinstance(instance, Workflow):
+            return None
+        name = id_.rsplit("-", 5)[0].rsplit(".", 1)[-1]
+        return None if name == "run" else name
+
+    def new_span(self, id_: str, bound_args: inspect.BoundArguments, instance: Optional[Any] = None,
+                 parent_span_id: Optional[str] = None, tags: Optional[Dict[str, Any]] = None,
+                 **kwargs: Any) -> Optional[SimpleSpan]:
+        if self._step_name(id_, instance) is None:
+            return None
+        return SimpleSpan(id_=id_, parent_id=parent_span_id, tags=tags or {})
+
+    def prepare_to_exit_span(self, id_: str, bound_args: inspect.BoundArguments, instance: Optional[Any] = None,
+                             result: Optional[Any] = None, **kwargs: Any) -> Optional[SimpleSpan]:
+        span = self.open_spans.get(id_)
+        if span is not None:
+            STEP_SECONDS.observe((time.time() - span.start_time.timestamp()), step=self._step_name(id_, instance))
+        return span
+
+    def prepare_to_drop_span(self, id_: str, bound_args: inspect.BoundArguments, instance: Optional[Any] = None,
+                             err: Optional[BaseException] = None, **kwargs: Any) -> Optional[SimpleSpan]:
+        span = self.open_spans.get(id_)
+        if span is not None:
+            step = self._step_name(id_, instance)
+            STEP_SECONDS.observe((time.time() - span.start_time.timestamp()), step=step)
+            STEP_ERRORS.inc(step=step)
+        return span
+
+
+class LLMEventHandler(BaseEventHandler):
+    """Counts LLM calls and tokens from llama-index's instrumentation events."""
+
+    started: Dict[str, Tuple[str, float]] = {}
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "LLMEventHandler"
+
+    def handle(self, event, **kwargs) -> Any:
+        if isinstance(event, (LLMChatStartEvent, LLMCompletionStartEvent)):
+            provider = provider_name(event.model_dict)
+            self.started[event.span_id] = (provider, time.perf_counter())
+            # a streamed reply can end in another span; don't let unmatched starts pile up
+            while len(self.started) > 1000:
+                self.started.pop(next(iter(self.started)))
+            LLM_CALLS.inc(provider=provider)
+        elif isinstance(event, (LLMChatEndEvent, LLMCompletionEndEvent)):
+            provider, start = self.started.pop(event.span_id, ("unknown", None))
+            if start is not None:
+                LLM_SECONDS.observe(time.perf_counter() - start, provider=provider)
+            prompt, completion = token_usage(event.response)
+            PROMPT_TOKENS.inc(prompt, provider=provider)
+            COMPLETION_TOKENS.inc(completion, provider=provider)
+            usage = _turn_usage.get()
+            if usage is not None:
+                usage["calls"] += 1
+                usage["prompt_tokens"] += prompt
+                usage["completion_tokens"] += completion
+
+
+class RetryLogHandler(logging.Handler):
+    """Counts the "Retrying request to ..." messages the openai, anthropic and groq SDKs log."""
+
+    def emit(self, record: logging.LogRecord):
+        if record.getMessage().startswith("Retrying request"):
+            LLM_RETRIES.inc(provider=record.name.split(".")[0])
+
+
+RETRY_LOGGERS = ("openai._base_client", "anthropic._base_client", "groq._base_client")
+
+_installed = False
+
+
+def install():
+    """Hook the collectors into llama-index and the provider SDK loggers; safe to call more than once."""
+    global _installed
+    if _installed:
+        return
+    _installed = True
+    dispatcher = get_dispatcher()
+    dispatcher.add_span_handler(StepSpanHandler())
+    dispatcher.add_event_handler(LLMEventHandler())
+    handler = RetryLogHandler()
+    for name in RETRY_LOGGERS:
+        logger = logging.getLogger(name)
+        logger.addHandler(handler)
+        if logger.getEffectiveLevel() > logging.INFO:
+            # the SDKs log retries at INFO; without this they are filtered out before any handler
+            logger.setLevel(logging.INFO)
@@ -1,9 +1,87 @@
 import boto3
 import json
+import re
 
+# AWS Price List service codes for the diagrams node classes the generated code uses;
+# a node matches the longest name it starts with (EC2Instance -> EC2)
+SERVICE_CODES = {
+    "EC2": "AmazonEC2",
+    "EC2ContainerRegistry": "AmazonECR",
+    "ECR": "AmazonECR",
+    "ECS": "AmazonECS",
+    "ElasticContainerService": "AmazonECS",
+    "Fargate": "AmazonECS",
+    "EKS": "AmazonEKS",
+    "ElasticKubernetesService": "AmazonEKS",
+    "Lambda": "AWSLambda",
+    "S3": "AmazonS3",
+    "SimpleStorageServiceS3": "AmazonS3",
+    "S3Glacier": "AmazonGlacier",
+    "EFS": "AmazonEFS",
+    "ElasticFileSystemEFS": "AmazonEFS",
+    "RDS": "AmazonRDS",
+    "Aurora": "AmazonRDS",
+    "Dynamodb": "AmazonDynamoDB",
+    "DDB": "AmazonDynamoDB",
+    "ElastiCache": "AmazonElastiCache",
+    "Elasticache": "AmazonElastiCache",
+    "Redshift": "AmazonRedshift",
+    "CloudFront": "AmazonCloudFront",
+    "CF": "AmazonCloudFront",
+    "Route53": "AmazonRoute53",
+    "ELB": "AWSELB",
+    "ALB": "AWSELB",
+    "NLB": "AWSELB",
+    "CLB": "AWSELB",
+    "Elb": "AWSELB",
+    "ElasticLoadBalancing": "AWSELB",
+    "APIGateway": "AmazonApiGateway",
+    "SQS": "AWSQueueService",
+    "SimpleQueueServiceSqs": "AWSQueueService",
+    "SNS": "AmazonSNS",
+    "SimpleNotificationServiceSns": "AmazonSNS",
+    "Eventbridge": "AWSEvents",
+    "StepFunctions": "AmazonStates",
+    "Kinesis": "AmazonKinesis",
+    "Cloudwatch": "AmazonCloudWatch",
+    "Sagemaker": "AmazonSageMaker",
+    "Cognito": "AmazonCognito",
+    "SecretsManager": "AWSSecretsManager",
+    "Glue": "AWSGlue",
+    "Athena": "AmazonAthena",
+    "EMR": "ElasticMapReduce",
+}
 
-def get_price_for_service(service_code):
-    client = boto3.client('pricing', region_name='us-east-1')
+
+def service_code_for(node_name):
+    """The Price List service code for a diagrams node class name, or None."""
+    matches = [name for name in SERVICE_CODES if node_name == name or node_name.startswith(name)]
+    return SERVICE_CODES[max(matches, key=len)] if matches else None
+
+
+def service_codes_in_code(code):
+    """The service codes of every AWS node instantiated in generated diagram code, in order of appearance."""
+    codes = []
+    for node_name in re.findall(r"\b([A-Z][A-Za-z0-9]*)\(", code or ""):
+        service_code = service_code_for(node_name)
+        if service_code and service_code not in codes:
+            codes.append(service_code)
+    return codes
+
+
+
+def service_codes_in_text(text):
+    """The service codes of the AWS services named in free text ("S3", "CloudFront", ...), in order."""
+    codes = []
+    for word in re.findall(r"[A-Za-z0-9]+", text or ""):
+        service_code = SERVICE_CODES.get(word)
+        if service_code and service_code not in codes:
+            codes.append(service_code)
+    return codes
+
+
+def get_price_for_service(service_code, client=None):
+    client = client or boto3.client('pricing', region_name='us-east-1')
     response = client.get_products(
         ServiceCode=service_code,
         Filters=[
@@ -31,7 +109,7 @@ def get_price_for_service(service_code):
             unit = pd_value.get('unit', 'Unknown unit')
             price_usd = price_per_unit.get('USD', '0')
             # Return price info
-            {'service': service_code, 'price_usd': price_usd, 'unit': unit}
+            return {'service': service_code, 'price_usd': price_usd, 'unit': unit}
     return None
 
 def main():
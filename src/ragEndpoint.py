@@ -1,9 +1,11 @@
+import httpx
 import requests
 
-def call_rag_endpoint(user_query):
-    url = 'https://chubby-jeanie-ragformation-8a33f1cc.koyeb.app/api/chat/request'
-    headers = {'Content-Type': 'application/json'}
-    payload = {
+RAG_URL = 'https://chubby-jeanie-ragformation-8a33f1cc.koyeb.app/api/chat/request'
+
+
+def _payload(user_query):
+    return {
         "messages": [
             {
                 "role": "user",
@@ -12,9 +14,26 @@ def call_rag_endpoint(user_query):
         ]
     }
 
+
+def call_rag_endpoint(user_query):
+    url = RAG_URL
+    headers = {'Content-Type': 'application/json'}
+    payload = _payload(user_query)
+
     response = requests.post(url, headers=headers, json=payload)
 
     if response.status_code == 200:
         return response.json()
     else:
-        return {"error": f"Failed to reach RAG endpoint. Status code: {response.status_code}"}
\ No newline at end of file
+        return {"error": f"Failed to reach RAG endpoint. Status code: {response.status_code}"}
+
+
+async def acall_rag_endpoint(user_query, timeout=120):
+    """Async version of `call_rag_endpoint`."""
+    async with httpx.AsyncClient(timeout=timeout) as client:
+        response = await client.post(RAG_URL, json=_payload(user_query))
+
+    if response.status_code == 200:
+        return response.json()
+    else:
+        return {"error": f"Failed to reach RAG endpoint. Status code: {response.status_code}"}
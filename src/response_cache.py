@@ -0,0 +1,191 @@
+"""
+Cache of finished chat completions, keyed on the session and the normalized conversation.
+
+Requests of the same session that only differ in whitespace, letter case or message ids
+map to the same key, as long as the model and sampling settings match. Only requests
+that ask for a deterministic reply (temperature 0 and n 1, both set explicitly) are
+cached. A hit skips the workflow entirely, so it does not advance the session's
+conversation either; that is why the cache is off unless configured, and why replies
+are never shared between sessions.
+
+Settings:
+    RESPONSE_CACHE_SIZE: Most replies kept (default 0, which disables the cache).
+    RESPONSE_CACHE_TTL: Seconds a reply stays valid (default 0, until evicted).
+    RESPONSE_CACHE_DIR: Keep replies on disk here instead of in memory.
+"""
+import hashlib
+import json
+import logging
+import os
+import re
+import time
+from collections import OrderedDict
+from typing import Iterable, Optional
+
+logger = logging.getLogger(__name__)
+
+# request fields that change the answer, besides the messages
+KEY_FIELDS = ("model", "temperature", "top_p", "max_tokens", "stop", "presence_penalty", "frequency_penalty")
+
+
+def normalize_text(text: Optional[str]) -> str:
+    return re.sub(r"\s+", " ", (text or "").strip()).lower()
+
+
+def cache_key(messages: Iterable, session_id: Optional[str] = None, **settings) -> str:
+    """
+    Hash a session's conversation and the settings that affect its reply.
+
+    Args:
+        messages: (role, content) pairs, oldest first.
+        session_id (str): The session the request belongs to.
+        **settings: The request's model and sampling settings (`KEY_FIELDS`).
+
+    Returns:
+        str: A hex digest that identifies the request.
+    """
+    payload = {
+        "session": session_id,
+        "messages": [[role, normalize_text(content)] for role, content in messages],
+        **{field: settings.get(field) for field in KEY_FIELDS},
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+
+
+class MemoryBackend:
+    """An in-process LRU map."""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self.entries: "OrderedDict[str, dict]" = OrderedDict()
+
+    def get(self, key: str) -> Optional[dict]:
+        entry = self.entries.get(key)
+        if entry is not None:
+            self.entries.move_to_end(key)
+        return entry
+
+    def set(self, key: str, entry: dict) -> int:
+        self.entries[key] = entry
+        self.entries.move_to_end(key)
+        evicted = 0
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+            evicted += 1
+        return evicted
+
+    def delete(self, key: str):
+        self.entries.pop(key, None)
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+
+class DiskBackend(MemoryBackend):
+    """
+    One JSON file per entry under `directory`, so cached replies survive restarts.
+
+    The LRU order is kept in memory and rebuilt from file modification times on
+    start-up; reads touch the file.
+    """
+
+    def __init__(self, max_entries: int, directory: str):
+        super().__init__(max_entries)
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        files = [f for f in os.listdir(directory) if f.endswith(".json")]
+        files.sort(key=lambda f: os.path.getmtime(os.path.join(directory, f)))
+        for name in files:
+            self.entries[name[:-len(".json")]] = None
+        while len(self.entries) > self.max_entries:
+            self.delete(next(iter(self.entries)))
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.json")
+
+    def get(self, key: str) -> Optional[dict]:
+        # another process sharing the directory may have written it since start-up
+        if key not in self.entries and not os.path.exists(self._path(key)):
+            return None
+        try:
+            with open(self._path(key)) as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            self.entries.pop(key, None)
+            return None
+        os.utime(self._path(key))
+        self.entries[key] = None
+        self.entries.move_to_end(key)
+        return entry
+
+    def set(self, key: str, entry: dict) -> int:
+        with open(self._path(key), "w") as f:
+            json.dump(entry, f)
+        self.entries[key] = None
+        self.entries.move_to_end(key)
+        evicted = 0
+        while len(self.entries) > self.max_entries:
+            self.delete(next(iter(self.entries)))
+            evicted += 1
+        return evicted
+
+    def delete(self, key: str):
+        self.entries.pop(key, None)
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+
+class ResponseCache:
+    """
+    Size-bounded LRU cache of reply texts with an optional time to live.
+
+    Args:
+        max_entries (int): Most replies kept; 0 disables the cache.
+        ttl (float): Seconds an entry stays valid; None keeps it until evicted.
+        directory (str): Keep entries on disk here instead of in memory.
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl: Optional[float] = None, directory: Optional[str] = None):
+        self.enabled = max_entries > 0
+        self.ttl = ttl
+        self.backend = DiskBackend(max_entries, directory) if directory and self.enabled else MemoryBackend(max_entries)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @classmethod
+    def from_env(cls) -> "ResponseCache":
+        ttl = float(os.environ.get("RESPONSE_CACHE_TTL", "0"))
+        return cls(
+            max_entries=int(os.environ.get("RESPONSE_CACHE_SIZE", "0")),
+            ttl=ttl if ttl > 0 else None,
+            directory=os.environ.get("RESPONSE_CACHE_DIR") or None,
+        )
+
+    def get(self, key: str) -> Optional[str]:
+        entry = self.backend.get(key)
+        if entry is not None and self.ttl is not None and time.time() - entry["created"] > self.ttl:
+            self.backend.delete(key)
+            entry = None
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return entry["text"]
+
+    def set(self, key: str, text: str):
+        self.evictions += self.backend.set(key, {"text": text, "created": time.time()})
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "backend": type(self.backend).__name__,
+            "entries": len(self.backend),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else None,
+        }
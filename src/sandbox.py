@@ -0,0 +1,344 @@
+"""
+A pool of warm worker processes that run generated diagram code.
+
+Generated code used to run either with `exec` inside the workflow process, or in a fresh
+`python temp_generated_code.py` for every syntax check. A fresh interpreter pays
+interpreter startup and the `diagrams` import on every check. The pool keeps `size`
+workers (`python sandbox.py`) running instead, with `diagrams` and every `importall`
+node already imported. A job is sent over a pipe, in the framed format of `ipc`. The
+worker runs it in the job's working directory and answers with its exit code, stdout
+and stderr, and the files it wrote there (the diagram).
+
+The generated code never runs in the caller's process. Each worker runs under resource
+limits (address space, size of the files it writes). A job that runs past its timeout
+is interrupted; a worker that does not answer `KILL_GRACE` seconds after that is killed
+and replaced. Each worker is replaced after `max_jobs` jobs, so whatever state generated
+code leaves behind does not pile up. Replacements are started right away and warm up
+while the other workers serve.
+
+`run` blocks and may be called from any thread; `arun` awaits it in a thread.
+
+Settings:
+    SANDBOX_WORKERS: Worker processes (default 2; 1 in each workflow worker the API
+        wrapper starts, as every one of them has a pool of its own).
+    SANDBOX_MAX_JOBS: Jobs a worker runs before it is replaced (default 50).
+    SANDBOX_TIMEOUT: Seconds a job may run (default 30).
+    SANDBOX_MEMORY_MB: Address space limit of a worker (default 2048; 0 for none).
+    SANDBOX_FILE_MB: Largest file a job may write (default 100; 0 for none).
+"""
+import asyncio
+import atexit
+import contextlib
+import io
+import logging
+import os
+import queue
+import select
+import signal
+import subprocess
+import sys
+import threading
+import time
+import traceback
+from dataclasses import dataclass, field
+from typing import List, Optional
+
+import ipc
+
+logger = logging.getLogger(__name__)
+
+READY = 1
+JOB = 2
+RESULT = 3
+
+# seconds past a job's timeout after which its worker is killed
+KILL_GRACE = 5.0
+# seconds a new worker may take to import diagrams before its first job
+WARM_UP_TIMEOUT = 120.0
+
+
+class SandboxError(RuntimeError):
+    """Raised when a worker dies, or has to be killed, before it answers."""
+
+
+@dataclass
+class SandboxResult:
+    """What running a piece of code in a worker produced."""
+
+    returncode: int
+    stdout: str = ""
+    stderr: str = ""
+    files: List[str] = field(default_factory=list)
+    seconds: float = 0.0
+    timed_out: bool = False
+
+    @property
+    def ok(self) -> bool:
+        return self.returncode == 0
+
+
+class SandboxWorker:
+    """One warm `python sandbox.py` process, used by one job at a time."""
+
+    def __init__(self, memory_mb: int = 2048, file_mb: int = 100):
+        self.memory_mb = memory_mb
+        self.file_mb = file_mb
+        self.jobs = 0
+        self.ready = False
+        self.proc = subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__)],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+            env={**os.environ, "SANDBOX_MEMORY_MB": str(memory_mb), "SANDBOX_FILE_MB": str(file_mb)},
+        )
+        self._buffer = b""
+
+    def _read_frame(self, deadline: Optional[float]):
+        fd = self.proc.stdout.fileno()
+        while True:
+            if len(self._buffer) >= ipc.HEADER.size:
+                channel, length = ipc.HEADER.unpack(self._buffer[:ipc.HEADER.size])
+                end = ipc.HEADER.size + length
+                if len(self._buffer) >= end:
+                    body, self._buffer = self._buffer[ipc.HEADER.size:end], self._buffer[end:]
+                    return channel, ipc.decode_payload(body)
+            timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+            if not select.select([fd], [], [], timeout)[0]:
+                raise SandboxError("Sandbox worker did not answer in time")
+            chunk = os.read(fd, 65536)
+            if not chunk:
+                raise SandboxError(f"Sandbox worker exited with {self.proc.wait()}")
+            self._buffer += chunk
+
+    def run(self, code: str, workdir: str, timeout: float, filename: str) -> SandboxResult:
+        if not self.ready:
+            # a worker that was just started is still importing; that does not count
+            # against the job's timeout
+            self._read_frame(time.monotonic() + WARM_UP_TIMEOUT)
+            self.ready = True
+        deadline = time.monotonic() + timeout + KILL_GRACE
+        self.proc.stdin.write(ipc.encode_frame(JOB, code=code, workdir=workdir, timeout=timeout,
+                                               filename=filename))
+        self.proc.stdin.flush()
+        self.jobs += 1
+        _, result = self._read_frame(deadline)
+        return SandboxResult(**result)
+
+    def is_alive(self) -> bool:
+        return self.proc.poll() is None
+
+    def stop(self):
+        if self.is_alive():
+            self.proc.kill()
+        self.proc.wait()
+        for stream in (self.proc.stdin, self.proc.stdout):
+            with contextlib.suppress(OSError):
+                stream.close()
+
+
+class SandboxPool:
+    """
+    `size` warm workers; a job takes an idle one, or waits for one.
+
+    Args:
+        size (int): Worker processes.
+        max_jobs (int): Jobs a worker runs before it is replaced.
+        timeout (float): Default seconds a job may run.
+        memory_mb (int): Address space limit of a worker; 0 for none.
+        file_mb (int): Largest file a job may write; 0 for none.
+    """
+
+    def __init__(self, size: int = 2, max_jobs: int = 50, timeout: float = 30.0, memory_mb: int = 2048,
+                 file_mb: int = 100):
+        self.size = max(1, size)
+        self.max_jobs = max_jobs
+        self.timeout = timeout
+        self.memory_mb = memory_mb
+        self.file_mb = file_mb
+        self._idle: "queue.Queue[SandboxWorker]" = queue.Queue()
+        self._lock = threading.Lock()
+        self._stats = {"jobs": 0, "failed": 0, "timeouts": 0, "recycled": 0, "killed": 0}
+        self._closed = False
+        for _ in range(self.size):
+            self._idle.put(self._spawn())
+
+    @classmethod
+    def from_env(cls) -> "SandboxPool":
+        return cls(
+            size=int(os.environ.get("SANDBOX_WORKERS", "2")),
+            max_jobs=int(os.environ.get("SANDBOX_MAX_JOBS", "50")),
+            timeout=float(os.environ.get("SANDBOX_TIMEOUT", "30")),
+            memory_mb=int(os.environ.get("SANDBOX_MEMORY_MB", "2048")),
+            file_mb=int(os.environ.get("SANDBOX_FILE_MB", "100")),
+        )
+
+    def _spawn(self) -> SandboxWorker:
+        return SandboxWorker(memory_mb=self.memory_mb, file_mb=self.file_mb)
+
+    def run(self, code: str, workdir: Optional[str] = None, timeout: Optional[float] = None,
+            filename: str = "temp_generated_code.py") -> SandboxResult:
+        """
+        Run `code` in a worker, as if it were `python <filename>` run in `workdir`.
+
+        Args:
+            code (str): The code to run.
+            workdir (str): Its working directory; the current one by default.
+            timeout (float): Seconds it may run; the pool's timeout by default.
+            filename (str): The file name tracebacks show.
+
+        Returns:
+            SandboxResult: The exit code, output and the files written to `workdir`.
+
+        Raises:
+            SandboxError: The worker died, or stopped answering, during the job.
+        """
+        if self._closed:
+            raise SandboxError("The sandbox pool is shut down")
+        workdir = os.path.abspath(workdir or os.getcwd())
+        timeout = self.timeout if timeout is None else timeout
+        worker = self._idle.get()
+        replace = True
+        try:
+            result = worker.run(code, workdir, timeout, filename)
+            replace = worker.jobs >= self.max_jobs or not worker.is_alive()
+        except SandboxError as e:
+            logger.warning("Replacing sandbox worker %s: %s", worker.proc.pid, e)
+            self._count("killed")
+            raise
+        finally:
+            if replace:
+                worker.stop()
+                worker = self._spawn()
+                self._count("recycled")
+            self._idle.put(worker)
+        self._count("jobs")
+        if not result.ok:
+            self._count("failed")
+        if result.timed_out:
+            self._count("timeouts")
+        return result
+
+    async def arun(self, code: str, workdir: Optional[str] = None, timeout: Optional[float] = None,
+                   filename: str = "temp_generated_code.py") -> SandboxResult:
+        return await asyncio.to_thread(self.run, code, workdir, timeout, filename)
+
+    def _count(self, name: str):
+        with self._lock:
+            self._stats[name] += 1
+
+    def shutdown(self):
+        self._closed = True
+        while True:
+            try:
+                self._idle.get_nowait().stop()
+            except queue.Empty:
+                break
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"size": self.size, "idle": self._idle.qsize(), **self._stats}
+
+
+_pool: Optional[SandboxPool] = None
+_pool_lock = threading.Lock()
+
+
+def pool() -> SandboxPool:
+    """The process's pool, started on first use with the settings from the environment."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = SandboxPool.from_env()
+            atexit.register(_pool.shutdown)
+        return _pool
+
+
+def run(code: str, workdir: Optional[str] = None, timeout: Optional[float] = None,
+        filename: str = "temp_generated_code.py") -> SandboxResult:
+    return pool().run(code, workdir, timeout, filename)
+
+
+async def arun(code: str, workdir: Optional[str] = None, timeout: Optional[float] = None,
+               filename: str = "temp_generated_code.py") -> SandboxResult:
+    return await pool().arun(code, workdir, timeout, filename)
+
+
+def stats() -> Optional[dict]:
+    return _pool.stats() if _pool is not None else None
+
+
+# --- the worker process ---
+
+
+class JobTimeout(BaseException):
+    """Raised inside a job when its time is up; a BaseException, so `except Exception` in the job doesn't swallow it."""
+
+
+def _limit_resources():
+    import resource
+
+    memory_mb = int(os.environ.get("SANDBOX_MEMORY_MB", "0"))
+    file_mb = int(os.environ.get("SANDBOX_FILE_MB", "0"))
+    if memory_mb:
+        resource.setrlimit(resource.RLIMIT_AS, (memory_mb * 2 ** 20, memory_mb * 2 ** 20))
+    if file_mb:
+        resource.setrlimit(resource.RLIMIT_FSIZE, (file_mb * 2 ** 20, file_mb * 2 ** 20))
+
+
+def _on_timeout(signum, frame):
+    raise JobTimeout()
+
+
+def _run_job(job: dict, namespace: dict) -> dict:
+    start = time.perf_counter()
+    stdout, stderr = io.StringIO(), io.StringIO()
+    returncode, timed_out = 0, False
+    os.chdir(job["workdir"])
+    before = {entry.name: entry.stat().st_mtime_ns for entry in os.scandir(".") if entry.is_file()}
+    signal.setitimer(signal.ITIMER_REAL, job["timeout"])
+    try:
+        with contextlib.redirect_stdout(stdout), contextlib.redirect_stderr(stderr):
+            try:
+                exec(compile(job["code"], job["filename"], "exec"), {**namespace, "__file__": job["filename"]})
+            except SystemExit as e:
+                returncode = e.code if isinstance(e.code, int) else (0 if e.code is None else 1)
+            except JobTimeout:
+                returncode, timed_out = 1, True
+                stderr.write(f"TimeoutError: the code ran longer than {job['timeout']}s\n")
+            except BaseException:
+                returncode = 1
+                traceback.print_exc()
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+    files = sorted(entry.name for entry in os.scandir(".")
+                   if entry.is_file() and before.get(entry.name) != entry.stat().st_mtime_ns)
+    return {"returncode": returncode, "stdout": stdout.getvalue(), "stderr": stderr.getvalue(),
+            "files": files, "seconds": round(time.perf_counter() - start, 4), "timed_out": timed_out}
+
+
+def main():
+    # frames go over private copies of stdin/stdout; the job's own output, and that of
+    # the programs it starts (graphviz), must not end up in them
+    frames_in = os.fdopen(os.dup(0), "rb", buffering=0)
+    frames_out = os.fdopen(os.dup(1), "wb", buffering=0)
+    devnull = os.open(os.devnull, os.O_RDWR)
+    os.dup2(devnull, 0)
+    os.dup2(devnull, 1)
+
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    namespace = {"__name__": "__main__", "__builtins__": __builtins__}
+    exec("from diagrams import Diagram, Cluster, Edge\nfrom importall import *", namespace)
+    _limit_resources()
+    signal.signal(signal.SIGALRM, _on_timeout)
+    frames_out.write(ipc.encode_frame(READY, pid=os.getpid()))
+
+    while True:
+        frame = ipc.read_frame(frames_in)
+        if frame is None:
+            break
+        channel, body = frame
+        if channel == JOB:
+            frames_out.write(ipc.encode_frame(RESULT, **_run_job(ipc.decode_payload(body), namespace)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,188 @@
+"""
+Bounded per-session state for the in-process server mode.
+
+Each session id owns one workflow run and, through it, one workflow `Context`. The
+store keeps at most `max_sessions` of them resident. The least recently used session
+is evicted when a new one needs room, and sessions idle for longer than `idle_ttl` are
+evicted by a background sweep. An evicted session's conversation state
+(`SESSION_STATE_KEYS` of `ctx.data`) is written to `spill_dir`. It is loaded back the
+next time that session id shows up. Agents and LLM clients are rebuilt, not saved.
+
+Settings:
+    SESSION_MAX: Most sessions resident (default 256).
+    SESSION_IDLE_TTL: Seconds a session may stay idle before it is evicted (default 1800).
+    SESSION_SPILL_DIR: Where evicted sessions are written (default .sessions); "off"
+        drops their state instead.
+    SESSION_SWEEP_INTERVAL: Seconds between sweeps for idle sessions (default 60).
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# the parts of ctx.data that describe the conversation rather than live objects
+SESSION_STATE_KEYS = (
+    "user",
+    "success",
+    "redirecting",
+    "overall_request",
+    "history",
+    "requirements",
+    "flow_confirmed",
+    "estimate",
+    "diagram_syntax_error",
+    "diagram_node_arrangement_error",
+)
+
+
+def snapshot_state(data: dict) -> dict:
+    """Copy the conversation state out of a workflow's `ctx.data`."""
+    return {key: data[key] for key in SESSION_STATE_KEYS if key in data}
+
+
+class SessionStore:
+    """
+    An LRU/TTL-bounded map from session id to session objects.
+
+    Sessions are created with `factory(session_id, state)`, where `state` is what was
+    spilled for that id (or None). A session must provide `lock` (an asyncio.Lock held
+    while it serves a turn), `last_used`, `snapshot()` and an async `stop()`. Busy
+    sessions are never evicted, so the resident count can briefly go over
+    `max_sessions` when every session is mid-turn. An evicted session gets `closed`
+    set right away, before it is stopped, so a turn still waiting for its lock can
+    tell it has to look the session up again.
+    """
+
+    def __init__(self, factory: Callable, max_sessions: int = 256, idle_ttl: float = 1800.0,
+                 spill_dir: Optional[str] = None, sweep_interval: float = 60.0):
+        self.factory = factory
+        self.max_sessions = max(1, max_sessions)
+        self.idle_ttl = idle_ttl
+        self.spill_dir = spill_dir
+        self.sweep_interval = sweep_interval
+        self.sessions: "OrderedDict[str, object]" = OrderedDict()
+        self.evictions: Dict[str, int] = {"lru": 0, "ttl": 0}
+        self.spills = 0
+        self.restores = 0
+        self._sweep_task: Optional[asyncio.Task] = None
+        self._stop_tasks = set()
+        if spill_dir:
+            os.makedirs(spill_dir, exist_ok=True)
+
+    @classmethod
+    def from_env(cls, factory: Callable) -> "SessionStore":
+        spill_dir = os.environ.get("SESSION_SPILL_DIR") or ".sessions"
+        return cls(
+            factory,
+            max_sessions=int(os.environ.get("SESSION_MAX", "256")),
+            idle_ttl=float(os.environ.get("SESSION_IDLE_TTL", "1800")),
+            spill_dir=None if spill_dir.lower() == "off" else spill_dir,
+            sweep_interval=float(os.environ.get("SESSION_SWEEP_INTERVAL", "60")),
+        )
+
+    async def start(self):
+        self._sweep_task = asyncio.create_task(self._sweep_loop())
+
+    async def stop(self):
+        """Stop the sweep and every session, spilling their state so a restart can resume them."""
+        if self._sweep_task is not None:
+            self._sweep_task.cancel()
+            self._sweep_task = None
+        sessions = list(self.sessions.items())
+        self.sessions.clear()
+        for session_id, session in sessions:
+            session.closed = True
+            self._spill(session_id, session)
+        await asyncio.gather(*(session.stop() for _, session in sessions), *self._stop_tasks)
+
+    def get(self, session_id: str):
+        """Return the session for `session_id`, restoring or creating it, and mark it most recently used."""
+        session = self.sessions.get(session_id)
+        if session is not None:
+            self.sessions.move_to_end(session_id)
+            return session
+
+        session = self.factory(session_id, self._restore(session_id))
+        self.sessions[session_id] = session
+        self._evict_lru()
+        return session
+
+    def __len__(self) -> int:
+        return len(self.sessions)
+
+    def _evict_lru(self):
+        for session_id in list(self.sessions):
+            if len(self.sessions) <= self.max_sessions:
+                return
+            # the newest entry is the session that was just added
+            if session_id != next(reversed(self.sessions)) and not self.sessions[session_id].lock.locked():
+                self._evict(session_id, "lru")
+
+    def sweep(self, now: Optional[float] = None):
+        """Evict sessions idle for longer than `idle_ttl`."""
+        now = now if now is not None else time.time()
+        for session_id, session in list(self.sessions.items()):
+            if not session.lock.locked() and now - session.last_used > self.idle_ttl:
+                self._evict(session_id, "ttl")
+
+    async def _sweep_loop(self):
+        while True:
+            await asyncio.sleep(self.sweep_interval)
+            try:
+                self.sweep()
+            except Exception:
+                logger.exception("Session sweep failed")
+
+    def _evict(self, session_id: str, reason: str):
+        session = self.sessions.pop(session_id)
+        session.closed = True
+        self.evictions[reason] += 1
+        self._spill(session_id, session)
+        task = asyncio.ensure_future(session.stop())
+        self._stop_tasks.add(task)
+        task.add_done_callback(self._stop_tasks.discard)
+        logger.debug("Evicted session %s (%s)", session_id, reason)
+
+    def _path(self, session_id: str) -> str:
+        digest = hashlib.sha256(session_id.encode()).hexdigest()
+        return os.path.join(self.spill_dir, f"{digest}.json")
+
+    def _spill(self, session_id: str, session):
+        state = session.snapshot()
+        if not self.spill_dir or not state:
+            return
+        with open(self._path(session_id), "w") as f:
+            json.dump({"session_id": session_id, "saved_at": time.time(), "state": state}, f, default=str)
+        self.spills += 1
+
+    def _restore(self, session_id: str) -> Optional[dict]:
+        if not self.spill_dir:
+            return None
+        path = self._path(session_id)
+        try:
+            with open(path) as f:
+                saved = json.load(f)
+        except FileNotFoundError:
+            return None
+        except ValueError:
+            logger.warning("Discarding unreadable spilled session %s", path)
+            saved = {}
+        os.remove(path)
+        self.restores += 1
+        return saved.get("state")
+
+    def stats(self) -> dict:
+        return {
+            "resident": len(self.sessions),
+            "max_sessions": self.max_sessions,
+            "idle_ttl": self.idle_ttl,
+            "evictions": dict(self.evictions),
+            "spills": self.spills,
+            "restores": self.restores,
+        }
@@ -0,0 +1,82 @@
+import sys
+from typing import Callable, List, Optional
+
+from llama_index.core.agent import AgentRunner, FunctionCallingAgentWorker
+from llama_index.core.chat_engine import SimpleChatEngine
+from llama_index.core.memory.types import BaseMemory
+from llama_index.core.tools import BaseTool
+
+import ipc
+
+
+def _is_openai(llm) -> bool:
+    # an LLM can only be an OpenAI one once the integration is imported; checking this
+    # way spares the import to processes that use another provider
+    module = sys.modules.get("llama_index.llms.openai")
+    return module is not None and isinstance(llm, module.OpenAI)
+
+
+def build_agent(tools: List[BaseTool], llm, system_prompt: Optional[str] = None, memory: Optional[BaseMemory] = None):
+    """
+    Build the agent the workflow talks to, picking an implementation that can stream.
+
+    `FunctionCallingAgentWorker` only answers in one piece, so it is only used when
+    nothing else fits: agents without tools are plain chat engines, and OpenAI models
+    (including Azure) get an `OpenAIAgent`, which streams its final answer.
+
+    Args:
+        tools (list[BaseTool]): The tools the agent may call.
+        llm (LLM): The LLM behind the agent.
+        system_prompt (str): The agent's system prompt.
+        memory (BaseMemory): The agent's chat memory, e.g. a `BoundedMemory`; an
+            unbounded buffer by default.
+
+    Returns:
+        An agent or chat engine exposing `chat` and `stream_chat`.
+    """
+    if not tools:
+        return SimpleChatEngine.from_defaults(llm=llm, system_prompt=system_prompt, memory=memory)
+    if _is_openai(llm):
+        from llama_index.agent.openai import OpenAIAgent
+        return OpenAIAgent.from_tools(tools=tools, llm=llm, system_prompt=system_prompt, memory=memory)
+    return FunctionCallingAgentWorker.from_tools(
+        tools=tools,
+        llm=llm,
+        allow_parallel_tool_calls=False,
+        system_prompt=system_prompt
+    ).as_agent(memory=memory)
+
+
+def can_stream(agent) -> bool:
+    return not (isinstance(agent, AgentRunner) and isinstance(agent.agent_worker, FunctionCallingAgentWorker))
+
+
+async def stream_reply(agent, message: str, respond: Callable[[str], None] = ipc.respond) -> str:
+    """
+    Send `message` to `agent` and pass the reply on as it is generated.
+
+    Every delta goes to `respond` as soon as the LLM produces it, so the reader sees the
+    first token instead of waiting for the whole turn. The LLM call is awaited, so other
+    workflow runs on the same event loop keep going meanwhile.
+
+    Args:
+        agent: An agent or chat engine built by `build_agent`.
+        message (str): The message to send.
+        respond (Callable): Receives each piece of the reply, usually the `respond` of
+            the workflow's input provider.
+
+    Returns:
+        str: The full reply.
+    """
+    if not can_stream(agent):
+        response = str(await agent.achat(message))
+        respond(response + "\n")
+        return response
+
+    streaming_response = await agent.astream_chat(message)
+    deltas = []
+    async for delta in streaming_response.async_response_gen():
+        deltas.append(delta)
+        respond(delta)
+    respond("\n")
+    return "".join(deltas)
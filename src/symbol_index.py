@@ -0,0 +1,225 @@
+"""
+Offline index of the node classes in the installed `diagrams` package.
+
+It answers what the LlamaCloud "import-shema" index was queried for: which module a node
+class lives in. The answer comes from the package itself, for every provider (aws,
+azure, gcp, onprem, k8s, ...), without a network round trip, and always the same.
+`resolve` also takes names that are not quite right and returns the class meant:
+
+    ElasticLoadBalancer -> ELB (diagrams.aws.network)
+    Cloudfront          -> CloudFront (diagrams.aws.network)
+    ElastiCach          -> ElastiCache (diagrams.aws.database)
+
+The index is built by parsing the package's modules, not importing them (about 60ms).
+It is saved to a JSON file, which loads in about 5ms, and rebuilt only when `diagrams`
+is reinstalled. Build it ahead of time, e.g. in a Docker image, with
+`python symbol_index.py`.
+
+Settings:
+    SYMBOL_INDEX_PATH: Where the index is saved (default .symbol_index.json); "off" keeps
+        it in memory only.
+"""
+import ast
+import difflib
+import functools
+import json
+import os
+import re
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Set
+
+# what `diagrams` itself exports, besides the node classes of its provider modules
+CORE = {"Diagram", "Cluster", "Node", "Edge", "getdiagram", "setdiagram", "getcluster", "setcluster"}
+DEFAULT_PATH = ".symbol_index.json"
+
+
+@dataclass(frozen=True)
+class Symbol:
+    """A node class and the module to import it from."""
+
+    module: str
+    name: str
+
+    @property
+    def statement(self) -> str:
+        return f"from {self.module} import {self.name}"
+
+
+@dataclass
+class SymbolIndex:
+    """The modules of the installed `diagrams` package and the node classes each defines."""
+
+    modules: Dict[str, Set[str]]
+    # alias -> the class it names, e.g. ELB -> ElasticLoadBalancing
+    aliases: Dict[str, str]
+
+    def __post_init__(self):
+        # node class name -> the modules defining it
+        self.classes: Dict[str, List[str]] = {}
+        for module, names in sorted(self.modules.items()):
+            if module != "diagrams":
+                for name in names:
+                    self.classes.setdefault(name, []).append(module)
+        self._folded = {}
+        for name in sorted(self.classes):
+            self._folded.setdefault(name.casefold(), name)
+        self._provider_folded: Dict[str, Dict[str, str]] = {}
+
+    def home(self, name: str, provider: Optional[str] = None) -> Optional[str]:
+        """
+        The module to import the class `name` from.
+
+        A class several providers define comes from `provider` (e.g. "diagrams.gcp") if
+        it has one, else from the module `importall` takes it from, else from AWS.
+        """
+        modules = self.classes.get(name)
+        if not modules:
+            return None
+        if provider:
+            for module in modules:
+                if module.startswith(provider + "."):
+                    return module
+        import importall
+
+        return importall._TABLE.get(name) or min(modules, key=lambda m: (not m.startswith("diagrams.aws."), m))
+
+    def provides(self, provider: str, name: str) -> bool:
+        """Whether `provider` (e.g. "diagrams.aws") defines a node class `name`."""
+        return any(module.startswith(provider + ".") for module in self.classes.get(name, ()))
+
+    def _names(self, provider: Optional[str]) -> Dict[str, str]:
+        """Casefolded name -> node class, of one provider or of all of them."""
+        if provider is None:
+            return self._folded
+        if provider not in self._provider_folded:
+            self._provider_folded[provider] = {
+                folded: name for folded, name in self._folded.items() if self.provides(provider, name)
+            }
+        return self._provider_folded[provider]
+
+    def resolve(self, name: str, provider: Optional[str] = None, strict: bool = False) -> Optional[Symbol]:
+        """
+        The node class `name` means: itself if it exists, else the same name in another
+        case, its initials (`ElasticLoadBalancer` -> `ELB`), or the closest spelling.
+
+        Args:
+            name (str): The class name as written.
+            provider (str): Where a class several providers define comes from.
+            strict (bool): Only consider the classes `provider` defines.
+
+        Returns:
+            Symbol: The class and its module, or None if nothing is close enough.
+        """
+        names = self._names(provider if strict else None)
+        exact = name in self.classes and (not strict or self.provides(provider, name))
+        found = name if exact else names.get(name.casefold())
+        if found is None:
+            initials = "".join(re.findall(r"[A-Z]", name))
+            if len(initials) > 1 and names.get(initials.casefold()) == initials and len(initials) < len(name):
+                found = initials
+        if found is None:
+            close = self.suggest(name, n=1, cutoff=0.8, provider=provider if strict else None)
+            found = close[0] if close else None
+        return Symbol(self.home(found, provider), found) if found else None
+
+    def suggest(self, name: str, n: int = 3, cutoff: float = 0.75, provider: Optional[str] = None) -> List[str]:
+        """The node classes spelled most like `name`, best first; only `provider`'s if given."""
+        names = self._names(provider)
+        close = difflib.get_close_matches(name.casefold(), names, n=n, cutoff=cutoff)
+        return [names[c] for c in close]
+
+    def to_json(self) -> dict:
+        return {"modules": {m: sorted(names) for m, names in sorted(self.modules.items())}, "aliases": self.aliases}
+
+    @classmethod
+    def from_json(cls, data: dict) -> "SymbolIndex":
+        return cls({m: set(names) for m, names in data["modules"].items()}, data["aliases"])
+
+
+def _package_root() -> str:
+    import importlib.util
+
+    return os.path.dirname(importlib.util.find_spec("diagrams").origin)
+
+
+def _version_key() -> str:
+    # reinstalling or upgrading rewrites the package, so its mtime is enough (and much
+    # faster to get than the version from the package metadata)
+    root = _package_root()
+    return f"{root}:{os.stat(os.path.join(root, '__init__.py')).st_mtime_ns}"
+
+
+def build() -> SymbolIndex:
+    """Parse the installed `diagrams` package into a `SymbolIndex`."""
+    root = _package_root()
+    modules: Dict[str, Set[str]] = {"diagrams": set(CORE)}
+    aliases: Dict[str, str] = {}
+    for directory, _, files in os.walk(root):
+        for file in files:
+            if not file.endswith(".py") or file == "cli.py":
+                continue
+            path = os.path.join(directory, file)
+            parts = os.path.relpath(path, root)[:-3].split(os.sep)
+            if parts[-1] == "__init__":
+                parts = parts[:-1]
+            if not parts:
+                continue
+            with open(path) as f:
+                tree = ast.parse(f.read())
+            names = set()
+            for node in tree.body:
+                if isinstance(node, ast.ClassDef):
+                    names.add(node.name)
+                elif isinstance(node, ast.Assign) and isinstance(node.value, ast.Name):
+                    # aliases, e.g. ECS = ElasticContainerService
+                    for target in node.targets:
+                        if isinstance(target, ast.Name):
+                            names.add(target.id)
+                            aliases[target.id] = node.value.id
+            modules[".".join(["diagrams", *parts])] = {name for name in names if not name.startswith("_")}
+    return SymbolIndex(modules, {a: c for a, c in aliases.items() if not a.startswith("_")})
+
+
+@functools.lru_cache(maxsize=1)
+def load() -> SymbolIndex:
+    """The index for the installed `diagrams`, from `SYMBOL_INDEX_PATH` if it is current; cached for the process."""
+    path = os.environ.get("SYMBOL_INDEX_PATH", DEFAULT_PATH)
+    if path == "off":
+        return build()
+    key = _version_key()
+    try:
+        with open(path) as f:
+            data = json.load(f)
+        if data.get("key") == key:
+            return SymbolIndex.from_json(data)
+    except (OSError, ValueError, KeyError):
+        pass
+    index = build()
+    try:
+        with open(path + ".tmp", "w") as f:
+            json.dump({"key": key, **index.to_json()}, f)
+        os.replace(path + ".tmp", path)
+    except OSError as e:
+        print(f"Could not save the symbol index to {path}: {e}")
+    return index
+
+
+def resolve(name: str, provider: Optional[str] = None) -> Optional[Symbol]:
+    return load().resolve(name, provider)
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Build the diagrams symbol index, or look names up in it.")
+    parser.add_argument("names", nargs="*", help="node class names to resolve")
+    args = parser.parse_args()
+    index = load()
+    print(f"{len(index.classes)} classes in {len(index.modules)} modules")
+    for name in args.names:
+        symbol = index.resolve(name)
+        print(f"{name}: {symbol.statement if symbol else 'not found'}")
+
+
+if __name__ == "__main__":
+    main()
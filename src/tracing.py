@@ -0,0 +1,328 @@
+"""
+Span tracing of workflow runs, written to a rotating JSONL file.
+
+With `TRACE_FILE` set, `install_from_env` records one span per:
+
+- workflow step, and the agent and chat engine calls llama-index opens spans for;
+- LLM request, with its token usage (from llama-index's LLM end events);
+- agent tool call (`traced`, wrapped around `ConciergeAgent` tools);
+- subprocess run, e.g. `run_and_check_syntax` (`span`).
+
+Spans share llama-index's `active_span_id`, so a tool call is the child of the agent
+step that made it, and the LLM requests inside it are its children. Each line is one
+finished span:
+
+    {"id": ..., "parent": ..., "name": "ConciergeWorkflow.orchestrator", "kind": "step",
+     "start": 1718000000.12, "end": 1718000001.43, "ms": 1310.2, "pid": 4242,
+     "status": "ok", "in_bytes": 112, "out_bytes": 64, "tokens": {"prompt": 0, "completion": 0}}
+
+Lines are handed to a background thread (`logging.handlers.QueueListener`), so a step
+never waits on the disk. `python tracing.py chrome trace.jsonl > trace.json` converts a
+trace to the Chrome trace event format, which Perfetto, speedscope and chrome://tracing
+show as a flame graph.
+
+Settings:
+    TRACE_FILE: Where spans are written; "{pid}" is replaced by the process id, so each
+        worker writes its own file. Unset disables tracing.
+    TRACE_MAX_BYTES: Size at which the file is rotated (default 50 MB).
+    TRACE_BACKUPS: Rotated files kept (default 5).
+"""
+import argparse
+import atexit
+import contextlib
+import functools
+import inspect
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import time
+import uuid
+from typing import Any, Callable, Dict, Iterable, Optional
+
+from llama_index.core.base.llms.base import BaseLLM
+from llama_index.core.instrumentation import get_dispatcher
+from llama_index.core.instrumentation.event_handlers import BaseEventHandler
+from llama_index.core.instrumentation.events.llm import (
+    LLMChatEndEvent,
+    LLMChatStartEvent,
+    LLMCompletionEndEvent,
+    LLMCompletionStartEvent,
+)
+from llama_index.core.instrumentation.span import active_span_id
+from llama_index.core.instrumentation.span.simple import SimpleSpan
+from llama_index.core.instrumentation.span_handlers import BaseSpanHandler
+from llama_index.core.workflow import Workflow
+from llama_index.core.workflow.errors import WorkflowDone
+
+import metrics
+
+# a logger of its own, so traces never end up in the application log
+_trace_log = logging.getLogger("ragformation.trace")
+_trace_log.propagate = False
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+def enabled() -> bool:
+    return _listener is not None
+
+
+def payload_size(value: Any) -> int:
+    """Rough size in bytes of a step's event, a tool's arguments or an LLM's messages or reply."""
+    if value is None or inspect.isgenerator(value) or inspect.isasyncgen(value):
+        return 0
+    if isinstance(value, (list, tuple)):
+        return sum(payload_size(getattr(item, "content", item)) for item in value)
+    return len(str(value).encode())
+
+
+def emit(record: Dict[str, Any]):
+    """Queue one finished span for writing."""
+    if _listener is not None:
+        _trace_log.info(json.dumps(record, separators=(",", ":"), default=str))
+
+
+def _record(id_: str, parent: Optional[str], name: str, kind: str, start: float, end: float, **fields) -> dict:
+    return {
+        "id": id_,
+        "parent": parent,
+        "name": name,
+        "kind": kind,
+        "start": round(start, 6),
+        "end": round(end, 6),
+        "ms": round((end - start) * 1000, 3),
+        "pid": os.getpid(),
+        **fields,
+    }
+
+
+@contextlib.contextmanager
+def span(name: str, kind: str = "span", **fields):
+    """
+    Record the enclosed block as a span; spans opened inside it are its children.
+
+    Yields:
+        dict: Extra fields for the record, e.g. `out_bytes`; None when tracing is off.
+    """
+    if not enabled():
+        yield None
+        return
+    id_ = f"{name}-{uuid.uuid4()}"
+    token = active_span_id.set(id_)
+    parent = None if token.old_value is token.MISSING else token.old_value
+    start = time.time()
+    status = {"status": "ok"}
+    try:
+        yield fields
+    except BaseException as e:
+        status = {"status": "error", "error": repr(e)[:500]}
+        raise
+    finally:
+        active_span_id.reset(token)
+        emit(_record(id_, parent, name, kind, start, time.time(), **status, **fields))
+
+
+def traced(fn: Callable, kind: str = "tool", **fields) -> Callable:
+    """Wrap `fn` (sync or async) so every call is a span; the signature is kept for FunctionTool."""
+    if inspect.iscoroutinefunction(fn):
+        @functools.wraps(fn)
+        async def async_wrapper(*args, **kwargs):
+            with span(fn.__name__, kind, in_bytes=payload_size(kwargs or args), **fields) as extra:
+                result = await fn(*args, **kwargs)
+                if extra is not None:
+                    extra["out_bytes"] = payload_size(result)
+                return result
+        return async_wrapper
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        with span(fn.__name__, kind, in_bytes=payload_size(kwargs or args), **fields) as extra:
+            result = fn(*args, **kwargs)
+            if extra is not None:
+                extra["out_bytes"] = payload_size(result)
+            return result
+    return wrapper
+
+
+def _span_name(id_: str) -> str:
+    """'ConciergeWorkflow.orchestrator-<uuid>' -> 'ConciergeWorkflow.orchestrator'."""
+    return id_.rsplit("-", 5)[0]
+
+
+def _span_kind(id_: str, instance: Any) -> str:
+    if isinstance(instance, Workflow):
+        return "step" if metrics.StepSpanHandler._step_name(id_, instance) else "workflow"
+    if isinstance(instance, BaseLLM):
+        return "llm"
+    name = type(instance).__name__ if instance is not None else ""
+    return "agent" if name.endswith(("Agent", "Runner", "Engine", "Worker")) else "span"
+
+
+# open LLM spans by id; the LLM end event adds the token usage to them
+_llm_spans: Dict[str, SimpleSpan] = {}
+
+# where the input of a span is, by argument name
+_PAYLOAD_ARGS = ("ev", "message", "messages", "prompt")
+
+
+class TraceSpanHandler(BaseSpanHandler[SimpleSpan]):
+    """Writes every span llama-index opens (workflow steps, agent and LLM calls) to the trace."""
+
+    def class_name(cls) -> str:
+        return "TraceSpanHandler"
+
+    def new_span(self, id_: str, bound_args: inspect.BoundArguments, instance: Optional[Any] = None,
+                 parent_span_id: Optional[str] = None, tags: Optional[Dict[str, Any]] = None,
+                 **kwargs: Any) -> Optional[SimpleSpan]:
+        if not enabled():
+            return None
+        payload = next((bound_args.arguments[name] for name in _PAYLOAD_ARGS if name in bound_args.arguments), None)
+        kind = _span_kind(id_, instance)
+        span_ = SimpleSpan(id_=id_, parent_id=parent_span_id,
+                           tags={"start": time.time(), "kind": kind, "in_bytes": payload_size(payload)})
+        if kind == "llm":
+            span_.tags["model"] = getattr(instance, "model", None)
+            _llm_spans[id_] = span_
+        return span_
+
+    def _finish(self, id_: str, **fields) -> Optional[SimpleSpan]:
+        span_ = self.open_spans.get(id_)
+        if span_ is not None:
+            _llm_spans.pop(id_, None)
+            tags = dict(span_.tags)
+            start, kind = tags.pop("start"), tags.pop("kind")
+            emit(_record(id_, span_.parent_id, _span_name(id_), kind, start, time.time(), **tags, **fields))
+        return span_
+
+    def prepare_to_exit_span(self, id_: str, bound_args: inspect.BoundArguments, instance: Optional[Any] = None,
+                             result: Optional[Any] = None, **kwargs: Any) -> Optional[SimpleSpan]:
+        return self._finish(id_, status="ok", out_bytes=payload_size(result))
+
+    def prepare_to_drop_span(self, id_: str, bound_args: inspect.BoundArguments, instance: Optional[Any] = None,
+                             err: Optional[BaseException] = None, **kwargs: Any) -> Optional[SimpleSpan]:
+        if isinstance(err, WorkflowDone):
+            # how the workflow's own `_done` step ends a run
+            return self._finish(id_, status="ok")
+        return self._finish(id_, status="error", error=repr(err)[:500])
+
+
+class TraceLLMHandler(BaseEventHandler):
+    """
+    Adds token usage to LLM spans.
+
+    A streamed reply ends after the span that started it has closed; it is written as
+    a span of its own, a child of that one.
+    """
+
+    started: Dict[str, tuple] = {}
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "TraceLLMHandler"
+
+    def handle(self, event, **kwargs) -> Any:
+        if not enabled():
+            return
+        if isinstance(event, (LLMChatStartEvent, LLMCompletionStartEvent)):
+            payload = event.messages if isinstance(event, LLMChatStartEvent) else event.prompt
+            self.started[event.span_id] = (event.id_, time.time(), payload_size(payload))
+            # don't let starts without an end (failed calls) pile up
+            while len(self.started) > 1000:
+                self.started.pop(next(iter(self.started)))
+        elif isinstance(event, (LLMChatEndEvent, LLMCompletionEndEvent)):
+            started = self.started.pop(event.span_id, None)
+            prompt, completion = metrics.token_usage(event.response)
+            tokens = {"prompt": prompt, "completion": completion}
+            span_ = _llm_spans.get(event.span_id)
+            if span_ is not None:
+                span_.tags["tokens"] = tokens
+            elif started is not None:
+                id_, start, in_bytes = started
+                emit(_record(f"stream-{id_}", event.span_id, f"{_span_name(event.span_id)}.stream", "llm",
+                             start, time.time(), status="ok", in_bytes=in_bytes,
+                             out_bytes=payload_size(event.response), tokens=tokens))
+
+
+def install(path: str, max_bytes: int = 50_000_000, backups: int = 5):
+    """Start writing spans to `path`; safe to call more than once (the first path wins)."""
+    global _listener
+    if _listener is not None:
+        return
+    path = os.path.abspath(path.replace("{pid}", str(os.getpid())))
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    handler = logging.handlers.RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backups)
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    records = queue.SimpleQueue()
+    _trace_log.addHandler(logging.handlers.QueueHandler(records))
+    _trace_log.setLevel(logging.INFO)
+    _listener = logging.handlers.QueueListener(records, handler)
+    _listener.start()
+    atexit.register(shutdown)
+    dispatcher = get_dispatcher()
+    dispatcher.add_span_handler(TraceSpanHandler())
+    dispatcher.add_event_handler(TraceLLMHandler())
+
+
+def install_from_env():
+    path = os.environ.get("TRACE_FILE")
+    if path:
+        install(path, max_bytes=int(os.environ.get("TRACE_MAX_BYTES", "50000000")),
+                backups=int(os.environ.get("TRACE_BACKUPS", "5")))
+
+
+def shutdown():
+    """Write out the queued spans and stop the writer thread."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        _listener = None
+        _trace_log.handlers.clear()
+
+
+def to_chrome(lines: Iterable[str]) -> dict:
+    """
+    Convert trace lines to the Chrome trace event format.
+
+    Each span becomes a complete ("X") event. Spans are grouped into one track per
+    top-level span, so a workflow run and everything under it share a track.
+    """
+    spans = [json.loads(line) for line in lines if line.strip()]
+    parents = {s["id"]: s["parent"] for s in spans}
+    tracks: Dict[str, int] = {}
+
+    def root(span_id: str) -> str:
+        seen = set()
+        while parents.get(span_id) in parents and span_id not in seen:
+            seen.add(span_id)
+            span_id = parents[span_id]
+        return span_id
+
+    events = []
+    for s in spans:
+        track = tracks.setdefault(root(s["id"]), len(tracks) + 1)
+        args = {k: v for k, v in s.items() if k not in ("name", "kind", "start", "end", "pid")}
+        events.append({"name": s["name"], "cat": s["kind"], "ph": "X", "ts": s["start"] * 1e6,
+                       "dur": (s["end"] - s["start"]) * 1e6, "pid": s["pid"], "tid": track, "args": args})
+    return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Convert JSONL traces for a flame-graph viewer.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    chrome = sub.add_parser("chrome", help="Write the Chrome trace event format to stdout")
+    chrome.add_argument("files", nargs="+", help="Trace files, e.g. trace.jsonl trace.jsonl.1")
+    args = parser.parse_args(argv)
+
+    lines = []
+    for name in args.files:
+        with open(name) as f:
+            lines.extend(f)
+    json.dump(to_chrome(lines), sys.stdout)
+
+
+if __name__ == "__main__":
+    main()
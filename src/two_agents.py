@@ -1,21 +1,14 @@
 from llama_index.core.agent import FunctionCallingAgentWorker
 from llama_index.core.tools import FunctionTool
-from llama_index.utils.workflow import draw_all_possible_flows
 from typing import Optional, List, Callable
 from colorama import Fore, Style
-from llama_index.llms.azure_openai import AzureOpenAI
-from llama_index.llms.openai import OpenAI
-from llama_index.llms.ollama import Ollama
-from llama_index.llms.anthropic import Anthropic
-from llama_index.llms.groq import Groq
-from llama_index.agent.openai import OpenAIAgent
-from llama_index.core.agent.legacy.react.base import ReActAgent
 from llama_index.core.agent import AgentRunner
-from llama_index.indices.managed.llama_cloud import LlamaCloudIndex
-from prompts import txt_2_diagram_prompt_template, fix_import_prompt_template, fix_and_write_code_template
-import subprocess
+from prompts import txt_2_diagram_prompt_template, fix_and_write_code_template
+import sandbox
+import diagram_validator
 
 from agent_scripts import text_to_diagram
+from llm_registry import get_llm
 
 from events import InitializeEvent, ConciergeEvent, OrchestratorEvent, PriceLookupEvent, ImageToTextEvent, TextToDiagramEvent, TextToRAGEvent, ReporterEvent, FixImportEvent, ArchitectureCheckEvent
 
@@ -34,11 +27,11 @@ from llama_index.core.workflow import (
 # Centralize LLM initialization
 def initialize_llm(llm_type: str):
     llm_map = {
-        "AzureOpenAI": lambda: AzureOpenAI(engine="testing-first-gbu-doc", model="gpt-4o", temperature=0.4),
-        "Ollama": lambda: Ollama(model="llama3.1:8b", request_timeout=120.0),
-        "OpenAI": lambda:  OpenAI(model="gpt-4o",temperature=0.8),
-        "Anthropic": lambda: Anthropic(model="claude-3-opus-20240229", temperature=0.4),
-        "Groq": lambda: Groq(model="llama3-70b-8192", temperature=0.8),
+        "AzureOpenAI": lambda: get_llm("AzureOpenAI", engine="testing-first-gbu-doc", model="gpt-4o", temperature=0.4),
+        "Ollama": lambda: get_llm("Ollama", model="llama3.1:8b", request_timeout=120.0),
+        "OpenAI": lambda: get_llm("OpenAI", model="gpt-4o", temperature=0.8),
+        "Anthropic": lambda: get_llm("Anthropic", model="claude-3-opus-20240229", temperature=0.4),
+        "Groq": lambda: get_llm("Groq", model="llama3-70b-8192", temperature=0.8),
     }
     return llm_map.get(llm_type, lambda: None)()
 
@@ -134,8 +127,14 @@ class ConciergeWorkflow(Workflow):
         def run_and_check_syntax() -> str:
             """Run the file `temp_generated_code.py` if it runs successfully, the syntax is correct otherwise return the error."""
             try:
-                result = subprocess.run(['/Users/bread/Documents/RAGformation/.venv/bin/python', 'temp_generated_code.py'], capture_output=True, text=True)
-                if result.returncode == 0:
+                with open('temp_generated_code.py') as f:
+                    code = f.read()
+                problems = diagram_validator.validate(code)
+                if problems:
+                    ctx['diagram_syntax_error'] = f"Error encountered: {diagram_validator.format_problems(problems)}"
+                    return ctx['diagram_syntax_error']
+                result = sandbox.run(code)
+                if result.ok:
                     ctx['diagram_syntax_error'] = None
                     return "Syntax is correct."
                 else:
@@ -148,16 +147,10 @@ class ConciergeWorkflow(Workflow):
             """If the diagram generation throws an error, use this tool to fix the imports"""
             print(f"Checking syntax for the provided code")
             if ctx['diagram_syntax_error'] is not None:
-                index = LlamaCloudIndex(
-                name="import-shema", 
-                project_name="Default",
-                organization_id="ORGANIZATION_ID",
-                api_key="API_KEY"
-                )
-
-                query = fix_import_prompt_template.format(error_txt = code)
-                response = index.as_query_engine().query(query)
-                return f"The correct import should be {response}"
+                fixed, fixes = diagram_validator.fix_imports(code)
+                if not fixes:
+                    return "No import could be fixed: the imported classes exist, or nothing like them does"
+                return f"The correct imports are:\n{diagram_validator.format_problems(fixes)}\n\nThe code with them:\n{fixed}"
             else:
                 return f"There are no import errors"
 
@@ -178,7 +171,7 @@ class ConciergeWorkflow(Workflow):
 
                 error_message = ctx.get('diagram_syntax_error', 'No errors.')
                 
-                llm = Anthropic(model="claude-3-opus-20240229")
+                llm = get_llm("Anthropic", model="claude-3-opus-20240229")
                 prompt = fix_and_write_code_template.format(original_code=original_code, error_message=error_message)
                 resp = str(llm.complete(prompt))
 
@@ -314,7 +307,6 @@ class ConciergeAgent:
         user_msg_str = input("> ").strip()
         return self.trigger_event(request=user_msg_str)
 
-draw_all_possible_flows(ConciergeWorkflow, filename="concierge_flows.html")
 
 
 
@@ -1,25 +1,26 @@
 from llama_index.core.agent import ReActAgent
 from llama_index.llms.openai import OpenAI
-from llama_index.llms.anthropic import Anthropic
 # from llama_index.llms.mistralai import MistralAI
 from llama_index.core.llms import ChatMessage
 from llama_index.core.tools import BaseTool, FunctionTool
 from llama_index.core.tools import QueryEngineTool
-from llama_index.indices.managed.llama_cloud import LlamaCloudIndex
 import sys
 import os
 import re
-import subprocess
+
+from llm_registry import get_llm
+import diagram_validator
+import sandbox
 
 # from agent_scripts import text_to_diagram
-from prompts import fix_import_prompt_template, txt_2_diagram_prompt_template
+from prompts import txt_2_diagram_prompt_template
 
 
 def run_script():
     """
     Run a the temp_generated_code.py script and capture its output or error message.
 
-    This function executes the specified Python script using subprocess.
+    The script runs in a warm `sandbox` worker, in the current directory.
     If the script runs successfully, it returns "No errors".
     If the script raises an exception, it returns the error message.
 
@@ -29,18 +30,16 @@ def run_script():
     Returns:
         str: "No errors" if the script runs successfully, or the error message if it fails.
     """
-    try:
-        filename = "../temp_generated_code.py"
-        python_executable = os.path.join(os.environ['CONDA_PREFIX'], 'bin', 'python')
-        python_executable = "/Users/kevintran/Downloads/RAGformation-main/myenv/bin/python"
-
-        result = subprocess.run([python_executable, filename], 
-                                capture_output=True, 
-                                text=True, 
-                                check=True)
+    filename = "../temp_generated_code.py"
+    with open(filename) as f:
+        code = f.read()
+    problems = diagram_validator.validate(code)
+    if problems:
+        return f"Error: {diagram_validator.format_problems(problems)}"
+    result = sandbox.run(code, filename=filename)
+    if result.ok:
         return "No errors"
-    except subprocess.CalledProcessError as e:
-        return f"Error: {e.stderr.strip()}"
+    return f"Error: {result.stderr.strip()}"
 
 def extract_code(text):
     # Pattern to match code blocks with or without language specification
@@ -64,7 +63,7 @@ def text_to_diagram(requirements_plan: str) -> str:
     # llm = TogetherLLM(
     #     model="mistralai/Mixtral-8x7B-Instruct-v0.1"
     # )
-    llm = Anthropic(model="claude-3-opus-20240229")
+    llm = get_llm("Anthropic", model="claude-3-opus-20240229")
     prompt = txt_2_diagram_prompt_template.format(architecture_plan=requirements_plan)
     resp = str(llm.complete(prompt))
     print(resp)
@@ -116,33 +115,32 @@ def text_to_diagram(requirements_plan: str) -> str:
     
 def fix_query(error_str: str):
     """
-    Fix import errors in the generated code using a query engine.
+    Fix import errors in the generated code with the local `symbol_index`.
 
-    This function takes an error string as input, formats it using a predefined
-    prompt template, and queries an index to get a fix for the import error.
+    Imports of classes that do not exist where the script imports them from, and node
+    classes it uses without importing, are corrected in temp_generated_code.py itself
+    (`diagram_validator.fix_imports`), without a query to a remote index.
 
     Args:
         error_str (str): The error message string from the failed script execution.
 
     Returns:
-        response (str): The response from the query engine, which should contain the fix for the import error.
+        response (str): The imports fixed, or why none were.
     """
-    index = LlamaCloudIndex(
-    name="import-shema", 
-    project_name="Default",
-    organization_id="ORGANIZATION_ID",
-    api_key="API_KEY"
-    )
-
-    query = fix_import_prompt_template.format(error_txt = error_str)
-    response = index.as_query_engine().query(query)
-    return response
+    filename = "../temp_generated_code.py"
+    with open(filename) as f:
+        code, fixes = diagram_validator.fix_imports(f.read())
+    if not fixes:
+        return f"No import could be fixed for: {error_str}"
+    with open(filename, "w") as f:
+        f.write(code)
+    return f"Fixed imports:\n{diagram_validator.format_problems(fixes)}"
 
 text_to_diagram_tool = FunctionTool.from_defaults(fn=text_to_diagram)
 temp_script_tool = FunctionTool.from_defaults(fn=run_script)
 import_fixer_tool = FunctionTool.from_defaults(fn=fix_query)
 
-llm  = llm = Anthropic(model="claude-3-opus-20240229")
+llm  = llm = get_llm("Anthropic", model="claude-3-opus-20240229")
 agent = ReActAgent.from_tools([text_to_diagram_tool, temp_script_tool], llm=llm, verbose=True)
 
 raw_text = """
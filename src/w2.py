@@ -1,25 +1,34 @@
 from llama_index.core.agent import FunctionCallingAgentWorker
 from llama_index.core.tools import FunctionTool
-from llama_index.utils.workflow import draw_all_possible_flows
 from typing import Optional, List, Callable
-from colorama import Fore, Style
-from llama_index.llms.azure_openai import AzureOpenAI
-from llama_index.llms.openai import OpenAI
-from llama_index.llms.ollama import Ollama
-from llama_index.llms.anthropic import Anthropic
-from llama_index.llms.groq import Groq
-from llama_index.agent.openai import OpenAIAgent
-from llama_index.core.agent.legacy.react.base import ReActAgent
-from llama_index.core.agent import AgentRunner
-from llama_index.indices.managed.llama_cloud import LlamaCloudIndex
-from prompts import fix_import_prompt_template, fix_and_write_code_template
-
-
-from agent_scripts import text_to_diagram as draw_text_to_diagram
-
+from prompts import fix_and_write_code_template
+
+
+from agent_scripts import atext_to_diagram as draw_text_to_diagram
+
+from streaming import build_agent, stream_reply
+from agent_memory import BoundedMemory
+from input_provider import ConsoleInputProvider
+from llm_registry import get_llm
+from intent_router import IntentRouter
+import cassette
+import checkpoint
+import diagram_validator
+import ipc
+import metrics
+import sandbox
+import tracing
 from events import InitializeEvent, ConciergeEvent, OrchestratorEvent, PriceLookupEvent, ImageToTextEvent, TextToDiagramEvent, TextToRAGEvent, ReporterEvent, FixImportEvent, ArchitectureCheckEvent
+from events import EstimateEvent, RAGSearchEvent, DiagramDraftEvent, PriceEstimateEvent, RAGResultEvent, DiagramResultEvent, PriceResultEvent
+from pricingAgent import get_price_for_service, service_codes_in_text
+from ragEndpoint import acall_rag_endpoint
 
+import asyncio
 import dotenv
+import inspect
+import json
+import os
+import time
 dotenv.load_dotenv()
 
 from llama_index.core.workflow import (
@@ -34,11 +43,11 @@ from llama_index.core.workflow import (
 # Centralize LLM initialization
 def initialize_llm(llm_type: str):
     llm_map = {
-        "AzureOpenAI": lambda: AzureOpenAI(engine="testing-first-gbu-doc", model="gpt-4o", temperature=0.4),
-        "Ollama": lambda: Ollama(model="llama3.1:8b", request_timeout=120.0),
-        "OpenAI": lambda:  OpenAI(model="gpt-4o",temperature=0.8),
-        "Anthropic": lambda: Anthropic(model="claude-3-opus-20240229", temperature=0.4),
-        "Groq": lambda: Groq(model="llama3-70b-8192", temperature=0.8),
+        "AzureOpenAI": lambda: get_llm("AzureOpenAI", engine="testing-first-gbu-doc", model="gpt-4o", temperature=0.4),
+        "Ollama": lambda: get_llm("Ollama", model="llama3.1:8b", request_timeout=120.0),
+        "OpenAI": lambda: get_llm("OpenAI", model="gpt-4o", temperature=0.8),
+        "Anthropic": lambda: get_llm("Anthropic", model="claude-3-opus-20240229", temperature=0.4),
+        "Groq": lambda: get_llm("Groq", model="llama3-70b-8192", temperature=0.8),
     }
     return llm_map.get(llm_type, lambda: None)()
 
@@ -68,10 +77,20 @@ class ConciergeWorkflow(Workflow):
             "flow_confirmed": False,
             "llm": initialize_llm("OpenAI")
         })
+        if ctx.data.get("restored_state"):
+            ctx.data.update(ctx.data.pop("restored_state"))
         return ConciergeEvent()
 
     @step(pass_context=True)
     async def concierge(self, ctx: Context, ev: ConciergeEvent | StartEvent) -> InitializeEvent | StopEvent | OrchestratorEvent:
+        # talk to the console unless the caller passed run(input_provider=...)
+        if "input_provider" not in ctx.data:
+            ctx.data["input_provider"] = ev.get("input_provider") or ConsoleInputProvider()
+            # conversation state saved by the session store when this session was evicted,
+            # or else by the last step of an earlier run with the same checkpoint id
+            ctx.data["checkpoint_id"] = ev.get("checkpoint_id")
+            ctx.data["restored_state"] = ev.get("session_state") or checkpoint.resume(ev.get("checkpoint_id"))
+
         if "user" not in ctx.data:
             return InitializeEvent()
 
@@ -98,12 +117,12 @@ class ConciergeWorkflow(Workflow):
             # )
             
             
-            ctx.data["concierge"] = FunctionCallingAgentWorker.from_tools(
-                tools=[],  # <-- This is likely the cause of the error
+            ctx.data["concierge"] = build_agent(
+                tools=[],
                 llm=ctx.data["llm"],
-                allow_parallel_tool_calls=False,
-                system_prompt=system_prompt
-            ).as_agent()
+                system_prompt=system_prompt,
+                memory=BoundedMemory.from_env(llm=ctx.data["llm"], pinned=lambda: ctx.data.get("requirements"))
+            )
             
             # agent = ReActAgent.from_tools(
             #     [], 
@@ -113,70 +132,88 @@ class ConciergeWorkflow(Workflow):
             # ctx.data["concierge"] = agent
 
         concierge = ctx.data["concierge"]
+        input_provider = ctx.data["input_provider"]
         if ctx.data["overall_request"]:
             last_request = ctx.data["overall_request"]
             ctx.data["overall_request"] = None
             return OrchestratorEvent(request=last_request)
         elif ev.just_completed:
-            response = concierge.chat(f"FYI, the user has just completed the task: {ev.just_completed}")
+            await stream_reply(concierge, f"FYI, the user has just completed the task: {ev.just_completed}", input_provider.respond)
         elif ev.need_help:
             return OrchestratorEvent(request=ev.request)
         else:
-            response = concierge.chat("Hello!")
+            await stream_reply(concierge, "Hello!", input_provider.respond)
 
-        print(Fore.MAGENTA + str(response) + Style.RESET_ALL)
-        user_msg_str = input("> ").strip()
+        user_msg_str = (await input_provider.ask("> ")).strip()
+        # under the API wrapper, keep this session's checkpoint (and restore it after a restart)
+        checkpoint.follow_session(ctx.data, input_provider.session_id)
         return OrchestratorEvent(request=user_msg_str)
 
     @step(pass_context=True)
-    async def orchestrator(self, ctx: Context, ev: OrchestratorEvent) -> ConciergeEvent  | PriceLookupEvent | ImageToTextEvent | TextToDiagramEvent | TextToRAGEvent | ArchitectureCheckEvent| FixImportEvent| ReporterEvent | StopEvent:
+    async def orchestrator(self, ctx: Context, ev: OrchestratorEvent) -> ConciergeEvent  | PriceLookupEvent | ImageToTextEvent | TextToDiagramEvent | TextToRAGEvent | ArchitectureCheckEvent| FixImportEvent| ReporterEvent | EstimateEvent | StopEvent:
         
         print(f"Orchestrator received request: {ev.request}")
         
-        def emit_text_to_diagram() -> bool:
+        async def emit_text_to_diagram() -> bool:
             """Call this if the user wants to text to diagram"""
             print("__emitted: text to diagram")
-            self.send_event(TextToDiagramEvent(request=ev.request))
+            ctx.send_event(TextToDiagramEvent(request=ev.request))
             return True
 
-        def emit_concierge() -> bool:
+        async def emit_concierge() -> bool:
             """Call this if the user wishes to perform another action, or if you’re unsure of their intent. You can also call this to prompt a response from the user.​"""
             print("__emitted: concierge")
-            self.send_event(ConciergeEvent(request=ev.request))
+            ctx.send_event(ConciergeEvent(request=ev.request))
             return True
 
-        def emit_stop() -> bool:
+        async def emit_stop() -> bool:
             """Call this if the user wants to stop or exit the system."""
             print("__emitted: stop")
-            self.send_event(StopEvent())
+            ctx.send_event(StopEvent())
             return True
 
-        def emit_price_lookup() -> bool:
+        async def emit_price_lookup() -> bool:
             """Call this if the user wants to look up a price"""
             print("__emitted: price lookup")
-            self.send_event(PriceLookupEvent(request=ev.request))
+            ctx.send_event(PriceLookupEvent(request=ev.request))
             return True
 
-        def emit_text_to_rag() -> bool:
+        async def emit_text_to_rag() -> bool:
             """Call this if the user wants to perform a text to RAG search"""
             print("__emitted: text to rag")
-            self.send_event(TextToRAGEvent(request=ev.request))
+            ctx.send_event(TextToRAGEvent(request=ev.request))
             return True
 
-        def emit_report() -> bool:
+        async def emit_report() -> bool:
             """Call this if the user wants to generate a report"""
             print("__emitted: report")
-            self.send_event(ReporterEvent(request=ev.request))
+            ctx.send_event(ReporterEvent(request=ev.request))
+            return True
+
+        async def emit_estimate(requirements: Optional[str] = None) -> bool:
+            """Call this once the user has confirmed their requirements and wants the full estimate (diagram, recommended services and prices) in one go. Pass the confirmed requirements."""
+            print("__emitted: estimate")
+            ctx.send_event(EstimateEvent(requirements=requirements or ctx.data.get("requirements") or ev.request))
             return True
 
         tools = [
-            FunctionTool.from_defaults(fn=emit_concierge),
-            FunctionTool.from_defaults(fn=emit_text_to_diagram),
-            FunctionTool.from_defaults(fn=emit_stop),
-            FunctionTool.from_defaults(fn=emit_price_lookup),
-            FunctionTool.from_defaults(fn=emit_text_to_rag),
-            FunctionTool.from_defaults(fn=emit_report)
+            FunctionTool.from_defaults(async_fn=emit_concierge),
+            FunctionTool.from_defaults(async_fn=emit_text_to_diagram),
+            FunctionTool.from_defaults(async_fn=emit_stop),
+            FunctionTool.from_defaults(async_fn=emit_price_lookup),
+            FunctionTool.from_defaults(async_fn=emit_text_to_rag),
+            FunctionTool.from_defaults(async_fn=emit_report),
+            FunctionTool.from_defaults(async_fn=emit_estimate)
         ]
+        emitters = {
+            "text_to_diagram": emit_text_to_diagram,
+            "concierge": emit_concierge,
+            "stop": emit_stop,
+            "price_lookup": emit_price_lookup,
+            "text_to_rag": emit_text_to_rag,
+            "report": emit_report,
+            "estimate": emit_estimate,
+        }
         
         
         # ! ToDo does not work
@@ -214,6 +251,7 @@ class ConciergeWorkflow(Workflow):
         - If the tool indicates that the requirements are complete, proceed directly to generating the architecture diagram
         - Otherwise, present the enhanced requirements to users for approval or further refinement
         - Iterate on the requirements gathering process until user approval is obtained
+        - Once the user has approved the requirements and wants the full estimate, call the `estimate` tool instead of the individual tools; it searches the knowledge base, draws the diagram and looks up the prices in parallel, then writes the report
 
         ## 2. Diagram Generation
         - Forward approved requirements to the `text_to_diagram` tool
@@ -243,15 +281,32 @@ class ConciergeWorkflow(Workflow):
 
         """
 
+        # obvious requests are routed locally; only the rest costs an LLM round trip
+        if "intent_router" not in ctx.data:
+            ctx.data["intent_router"] = IntentRouter.from_tools(tools, exclude=["concierge"])
+        router = ctx.data["intent_router"]
+        # "yes, go ahead" after the requirements were gathered confirms them
+        if ctx.data.get("requirements") and router.confirms(ev.request):
+            ctx.data["flow_confirmed"] = True
+        route = router.route(ev.request, confirmed=bool(ctx.data.get("flow_confirmed")))
+        if route is not None:
+            print(f"Routed locally to {route.intent} ({route.source}, confidence {route.confidence})")
+            await emitters[route.intent]()
+            return None
+
         if "orchestrator" not in ctx.data:
             ctx.data["orchestrator"] = FunctionCallingAgentWorker.from_tools(
                 tools=tools,
                 llm=ctx.data["llm"],
                 allow_parallel_tool_calls=False,
                 system_prompt=system_prompt
-            ).as_agent()
+            ).as_agent(memory=BoundedMemory.from_env(llm=ctx.data["llm"]))
 
-        response = str(ctx.data["orchestrator"].chat(ev.request))
+        start = time.perf_counter()
+        with metrics.agent_turn("orchestrator"):
+            response = str(await ctx.data["orchestrator"].achat(ev.request))
+        ctx.data["intent_router"].record_llm(time.perf_counter() - start)
+        await ctx.data["orchestrator"].memory.acompact()
         
         print(response)
 
@@ -309,7 +364,7 @@ class ConciergeWorkflow(Workflow):
                 trigger_event=PriceLookupEvent
             )
 
-        return ctx.data["price_lookup_agent"].handle_event(ev)
+        return await ctx.data["price_lookup_agent"].handle_event(ev)
 
     @step(pass_context=True)
     async def image_to_text(self, ctx: Context, ev: ImageToTextEvent) -> ConciergeEvent:
@@ -339,7 +394,7 @@ class ConciergeWorkflow(Workflow):
                 trigger_event=ImageToTextEvent
             )
 
-        return ctx.data["image_to_text_agent"].handle_event(ev)
+        return await ctx.data["image_to_text_agent"].handle_event(ev)
     
     
 
@@ -350,15 +405,15 @@ class ConciergeWorkflow(Workflow):
         self.log_history(ctx, "text_to_diagram", "user", ev.request)
 
         if "text_to_diagram_agent" not in ctx.data:
-            def generate_diagram(text: str) -> str:
+            async def generate_diagram(text: str) -> str:
                 """Useful for describing a diagram using text."""
-                resp = draw_text_to_diagram(text)
+                resp = await draw_text_to_diagram(text)
                 
                 if "successfully" in resp.lower():
-                    ctx['diagram_syntax_error'] = None
+                    ctx.data['diagram_syntax_error'] = None
                     return "Output diagram saved to output_diagram.png"
                 else:
-                    ctx['diagram_syntax_error'] = f"Error encountered: {resp}"
+                    ctx.data['diagram_syntax_error'] = f"Error encountered: {resp}"
                     return f"Error encountered: {resp}"
 
 
@@ -388,7 +443,7 @@ class ConciergeWorkflow(Workflow):
                 trigger_event=TextToDiagramEvent
             )
 
-        return ctx.data["text_to_diagram_agent"].handle_event(ev)
+        return await ctx.data["text_to_diagram_agent"].handle_event(ev)
 
     @step(pass_context=True)
     async def text_to_rag(self, ctx: Context, ev: TextToRAGEvent) -> ConciergeEvent:
@@ -400,6 +455,8 @@ class ConciergeWorkflow(Workflow):
             def search_rag(text: str) -> str:
                 """Useful for requesting a RAG search using text."""
                 print(f"Performing a search from text {text}")
+                # the requirements as gathered; the user confirms them next
+                ctx.data["requirements"] = text
                 return f"No RAG search required, the solution is 100% good, proceed to draw the architecture."
 
             system_prompt = (f"""
@@ -420,7 +477,7 @@ class ConciergeWorkflow(Workflow):
                 trigger_event=TextToRAGEvent
             )
 
-        return ctx.data["text_to_rag_agent"].handle_event(ev)
+        return await ctx.data["text_to_rag_agent"].handle_event(ev)
 
     @step(pass_context=True)
     async def report(self, ctx: Context, ev: ReporterEvent) -> ConciergeEvent:
@@ -450,7 +507,7 @@ class ConciergeWorkflow(Workflow):
                 trigger_event=ReporterEvent
             )
 
-        return ctx.data["report_agent"].handle_event(ev)
+        return await ctx.data["report_agent"].handle_event(ev)
 
 
     @step(pass_context=True)
@@ -459,33 +516,38 @@ class ConciergeWorkflow(Workflow):
         self.log_history(ctx, "fix_import", "user", ev.request)
 
         if "fix_import_agent" not in ctx.data:
-            def run_and_check_syntax() -> str:
+            async def run_and_check_syntax() -> str:
                 """Run the file `temp_generated_code.py` if it runs successfully, the syntax is correct otherwise return the error."""
                 try:
-                    result = subprocess.run(['/Users/bread/Documents/RAGformation/.venv/bin/python', 'temp_generated_code.py'], capture_output=True, text=True)
-                    if result.returncode == 0:
-                        ctx['diagram_syntax_error'] = None
+                    with open("temp_generated_code.py") as f:
+                        code = f.read()
+                    problems = diagram_validator.validate(code)
+                    if problems:
+                        error = f"Error encountered: {diagram_validator.format_problems(problems)}"
+                        ctx.data['diagram_syntax_error'] = error
+                        return error
+                    with tracing.span("run_and_check_syntax", kind="subprocess") as trace:
+                        result = await sandbox.arun(code)
+                        if trace is not None:
+                            trace.update(returncode=result.returncode, out_bytes=len(result.stderr))
+                    stderr = result.stderr
+                    if result.ok:
+                        ctx.data['diagram_syntax_error'] = None
                         return "Syntax is correct."
                     else:
-                        ctx['diagram_syntax_error'] = f"Error encountered: {result.stderr}"
-                        return f"Error encountered: {result.stderr}"
+                        ctx.data['diagram_syntax_error'] = f"Error encountered: {stderr}"
+                        return f"Error encountered: {stderr}"
                 except Exception as e:
                     return f"Exception occurred: {str(e)}"
 
-            def suggest_imports(code: str) -> str:
+            async def suggest_imports(code: str) -> str:
                 """If the diagram generation throws an error, use this tool to fix the imports"""
                 print(f"Checking syntax for the provided code")
-                if ctx['diagram_syntax_error'] is not None:
-                    index = LlamaCloudIndex(
-                    name="import-shema", 
-                    project_name="Default",
-                    organization_id="ORGANIZATION_ID",
-                    api_key="API_KEY"
-                    )
-
-                    query = fix_import_prompt_template.format(error_txt = code)
-                    response = index.as_query_engine().query(query)
-                    return f"The correct import should be {response}"
+                if ctx.data.get('diagram_syntax_error') is not None:
+                    fixed, fixes = diagram_validator.fix_imports(code)
+                    if not fixes:
+                        return "No import could be fixed: the imported classes exist, or nothing like them does"
+                    return f"The correct imports are:\n{diagram_validator.format_problems(fixes)}\n\nThe code with them:\n{fixed}"
                 else:
                     return f"There are no import errors"
 
@@ -498,17 +560,17 @@ class ConciergeWorkflow(Workflow):
                 except Exception as e:
                     return f"Failed to write to file: {str(e)}"
 
-            def fix_and_write_code(input_filename: str = "temp_generated_code.py", output_filename: str = "temp_generated_code.py") -> str:
+            async def fix_and_write_code(input_filename: str = "temp_generated_code.py", output_filename: str = "temp_generated_code.py") -> str:
                 """Read code from a file, fix it using LLM, and write the fixed code to another file."""
                 try:
                     with open(input_filename, 'r') as file:
                         original_code = file.read()
 
-                    error_message = ctx.get('diagram_syntax_error', 'No errors.')
+                    error_message = ctx.data.get('diagram_syntax_error') or 'No errors.'
                     
-                    llm = Anthropic(model="claude-3-opus-20240229")
+                    llm = get_llm("Anthropic", model="claude-3-opus-20240229")
                     prompt = fix_and_write_code_template.format(original_code=original_code, error_message=error_message)
-                    resp = str(llm.complete(prompt))
+                    resp = str(await llm.acomplete(prompt))
 
                     # Write the fixed code to the output file
                     write_result = write_to_file(str(resp), output_filename)
@@ -547,7 +609,7 @@ class ConciergeWorkflow(Workflow):
                 trigger_event=FixImportEvent
             )
 
-        return ctx.data["fix_import_agent"].handle_event(ev)
+        return await ctx.data["fix_import_agent"].handle_event(ev)
 
     @step(pass_context=True)
     async def architecture_check(self, ctx: Context, ev: ArchitectureCheckEvent) -> ConciergeEvent:
@@ -577,7 +639,65 @@ class ConciergeWorkflow(Workflow):
                 trigger_event=ArchitectureCheckEvent
             )
 
-        return ctx.data["architecture_check_agent"].handle_event(ev)
+        return await ctx.data["architecture_check_agent"].handle_event(ev)
+
+    @step(pass_context=True)
+    async def estimate(self, ctx: Context, ev: EstimateEvent) -> RAGSearchEvent | DiagramDraftEvent | PriceEstimateEvent:
+        """Fan out: the RAG search, the diagram and the prices only need the confirmed requirements."""
+        print(f"Estimate received requirements: {ev.requirements}")
+        ctx.data["requirements"] = ev.requirements
+        ctx.data["flow_confirmed"] = True
+        ctx.data["estimate_started"] = time.perf_counter()
+        ctx.data["input_provider"].respond("Searching the knowledge base, drawing the diagram and looking up prices...\n")
+        ctx.send_event(RAGSearchEvent(requirements=ev.requirements))
+        ctx.send_event(DiagramDraftEvent(requirements=ev.requirements))
+        ctx.send_event(PriceEstimateEvent(requirements=ev.requirements))
+
+    @step(pass_context=True)
+    async def rag_branch(self, ctx: Context, ev: RAGSearchEvent) -> RAGResultEvent:
+        try:
+            response = await acall_rag_endpoint(ev.requirements)
+        except Exception as e:
+            return RAGResultEvent(branch="text_to_rag", result=f"RAG search failed: {e}", ok=False)
+        return RAGResultEvent(branch="text_to_rag", result=json.dumps(response), ok="error" not in response)
+
+    @step(pass_context=True)
+    async def diagram_branch(self, ctx: Context, ev: DiagramDraftEvent) -> DiagramResultEvent:
+        try:
+            resp = await draw_text_to_diagram(ev.requirements)
+        except Exception as e:
+            resp = f"Error generating diagram: {e}"
+        ok = "successfully" in resp.lower()
+        ctx.data["diagram_syntax_error"] = None if ok else f"Error encountered: {resp}"
+        return DiagramResultEvent(branch="text_to_diagram", result=resp, ok=ok)
+
+    @step(pass_context=True)
+    async def pricing_branch(self, ctx: Context, ev: PriceEstimateEvent) -> PriceResultEvent:
+        services = service_codes_in_text(ev.requirements)
+        prices = await asyncio.gather(
+            *(asyncio.to_thread(get_price_for_service, service) for service in services),
+            return_exceptions=True
+        )
+        found = {}
+        for service, price in zip(services, prices):
+            found[service] = f"lookup failed: {price}" if isinstance(price, Exception) else price
+        ok = bool(found) and not any(isinstance(price, Exception) for price in prices)
+        return PriceResultEvent(branch="price_lookup", result=json.dumps(found), ok=ok)
+
+    @step(pass_context=True)
+    async def join_estimate(self, ctx: Context, ev: RAGResultEvent | DiagramResultEvent | PriceResultEvent) -> ReporterEvent | None:
+        """Fan in: wait for all three branches, then hand the results to the report agent."""
+        results = ctx.collect_events(ev, [RAGResultEvent, DiagramResultEvent, PriceResultEvent])
+        if results is None:
+            return None
+
+        ctx.data["estimate"] = {result.branch: {"ok": result.ok, "result": result.result} for result in results}
+        for result in results:
+            self.log_history(ctx, result.branch, "assistant", result.result)
+        seconds = time.perf_counter() - ctx.data.pop("estimate_started", time.perf_counter())
+        print(f"Estimate branches finished in {seconds:.1f}s")
+        summary = "\n".join(f"- {result.branch}: {result.result}" for result in results)
+        return ReporterEvent(request=f"Generate the report for these requirements:\n{ctx.data['requirements']}\n\nResults:\n{summary}")
 
 class ConciergeAgent:
     name: str
@@ -604,39 +724,53 @@ class ConciergeAgent:
         self.context.data["redirecting"] = False
         self.trigger_event = trigger_event
 
-        # set up the tools including the ones everybody gets
-        def done() -> None:
+        # set up the tools including the ones everybody gets; these two run on the
+        # event loop because they send events through the context
+        async def done() -> None:
             """When you complete your task, call this tool."""
             print(f"{self.name} is complete")
             self.context.data["redirecting"] = True
-            parent.send_event(ConciergeEvent(just_completed=self.name))
+            self.context.send_event(ConciergeEvent(just_completed=self.name))
 
-        def need_help() -> None:
+        async def need_help() -> None:
             """If the user asks to do something you don't know how to do, call this."""
             print(f"{self.name} needs help")
             self.context.data["redirecting"] = True
-            parent.send_event(ConciergeEvent(request=self.current_event.request,need_help=True))
+            self.context.send_event(ConciergeEvent(request=self.current_event.request,need_help=True))
 
         self.tools = [
-            FunctionTool.from_defaults(fn=done),
-            FunctionTool.from_defaults(fn=need_help)
+            FunctionTool.from_defaults(async_fn=done),
+            FunctionTool.from_defaults(async_fn=need_help)
         ]
+        # tools that do I/O are coroutines and are awaited on the loop; plain functions
+        # are run in a thread by the agent
         for t in tools:
-            self.tools.append(FunctionTool.from_defaults(fn=t))
-
-        agent_worker = FunctionCallingAgentWorker.from_tools(
+            timed = tracing.traced(metrics.timed_tool(t, agent=self.name), agent=self.name)
+            if inspect.iscoroutinefunction(t):
+                self.tools.append(FunctionTool.from_defaults(async_fn=timed))
+            else:
+                self.tools.append(FunctionTool.from_defaults(fn=timed))
+
+        # recent turns verbatim, older ones summarized, the requirements always included
+        self.memory = BoundedMemory.from_env(
+            llm=self.context.data["llm"],
+            pinned=lambda: self.context.data.get("requirements")
+        )
+        self.agent = build_agent(
             self.tools,
             llm=self.context.data["llm"],
-            allow_parallel_tool_calls=False,
-            system_prompt=self.system_prompt
+            system_prompt=self.system_prompt,
+            memory=self.memory
         )
-        self.agent = agent_worker.as_agent()
 
-    def handle_event(self, ev: Event):
+    async def handle_event(self, ev: Event):
         self.current_event = ev
+        input_provider = self.context.data["input_provider"]
 
-        response = str(self.agent.chat(ev.request))
-        print(Fore.MAGENTA + str(response) + Style.RESET_ALL)
+        with metrics.agent_turn(self.name):
+            await stream_reply(self.agent, ev.request, input_provider.respond)
+        metrics.MEMORY_TOKENS.observe(self.memory.token_count(), agent=self.name)
+        await self.memory.acompact()
 
         # if they're sending us elsewhere we're done here
         if self.context.data["redirecting"]:
@@ -644,21 +778,27 @@ class ConciergeAgent:
             return None
 
         # otherwise, get some user input and then loop
-        user_msg_str = input("> ").strip()
+        user_msg_str = (await input_provider.ask("> ")).strip()
+        checkpoint.follow_session(self.context.data, input_provider.session_id)
         return self.trigger_event(request=user_msg_str)
 
-draw_all_possible_flows(ConciergeWorkflow, filename="concierge_flows.html")
 
 
 
 async def main():
+    ipc.install_from_env()
+    metrics.install()
+    checkpoint.install_from_env()
+    tracing.install_from_env()
+    # warm the diagram sandbox while the user types
+    sandbox.pool()
     c = ConciergeWorkflow(timeout=1200, verbose=True)
-    result = await c.run()
+    result = await c.run(checkpoint_id=os.environ.get("WORKFLOW_CHECKPOINT_ID"),
+                         input_provider=cassette.input_provider())
     print(result)
 
 # Check if an event loop is already running
 if __name__ == "__main__":
-    import asyncio
     try:
         # If there's no running event loop, use asyncio.run()
         if not asyncio.get_event_loop().is_running():
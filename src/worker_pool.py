@@ -0,0 +1,394 @@
+import asyncio
+import logging
+import os
+import sys
+import time
+from collections import OrderedDict
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+import ipc
+import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class WorkerCrashedError(RuntimeError):
+    """Raised when a workflow worker exits in the middle of a turn."""
+
+
+class SessionMovedError(RuntimeError):
+    """
+    Raised by a turn whose worker or session was retired, or handed to another session,
+    while the turn waited for it.
+
+    Nothing was sent; look the session up again (`worker_for`) and retry.
+    """
+
+
+class WorkflowWorker:
+    """
+    A single `python workflows.py` child process.
+
+    The child is started with RAGFORMATION_IPC=1 and speaks the framed protocol from
+    `ipc`: it streams RESPONSE frames and sends a TURN frame when it waits for input.
+    A worker owns one such process and serializes the turns sent to it, so only one
+    request at a time talks to its stdin/stdout. The process runs one conversation, so
+    the pool hands a worker to one session at a time (`session_id`).
+    All pipe I/O goes through asyncio streams, so a worker waiting on a slow turn
+    never blocks the event loop.
+    """
+
+    def __init__(self, worker_id: int, script: str, cwd: Optional[str] = None):
+        self.worker_id = worker_id
+        self.script = script
+        self.cwd = cwd
+        self.proc: Optional[asyncio.subprocess.Process] = None
+        self.lock = asyncio.Lock()
+        self.restarts = 0
+        self.turns = 0
+        self.started_at: Optional[float] = None
+        self._greeted = False
+        self._metrics = None
+        # the child's `sandbox.stats()`, as of its last METRICS frame
+        self.sandbox: Optional[dict] = None
+        # set when the pool retires this worker; turns still waiting for it must move
+        self.closed = False
+        # the session this worker serves; turns of any other session must move
+        self.session_id: Optional[str] = None
+        # set when the worker is handed to another session: the next turn starts a fresh process
+        self.stale = False
+
+    async def start(self):
+        # checkpoints follow the session_id of each INPUT frame, not a fixed id
+        env = {k: v for k, v in os.environ.items() if k != "WORKFLOW_CHECKPOINT_ID"}
+        # every worker runs a sandbox pool of its own; one warm sandbox each unless configured
+        env.setdefault("SANDBOX_WORKERS", "1")
+        env[ipc.ENV_FLAG] = "1"
+        self.proc = await asyncio.create_subprocess_exec(
+            sys.executable, '-u', self.script,
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            cwd=self.cwd,
+            env=env,
+        )
+        self.started_at = time.time()
+        self._greeted = False
+        self._metrics = None
+        logger.info("Started workflow worker %s (pid %s)", self.worker_id, self.proc.pid)
+
+    async def stop(self, timeout: float = 5.0):
+        if self.proc is None:
+            return
+        if self.proc.returncode is None:
+            self.proc.terminate()
+            try:
+                await asyncio.wait_for(self.proc.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                self.proc.kill()
+                await self.proc.wait()
+        self.proc = None
+
+    async def restart(self):
+        await self.stop()
+        self.restarts += 1
+        await self.start()
+
+    def is_alive(self) -> bool:
+        return self.proc is not None and self.proc.returncode is None
+
+    async def _read_turn(self, debug: Optional[List[str]] = None) -> AsyncIterator[str]:
+        """
+        Yield the reply as it arrives until the workflow asks for the next input.
+
+        DEBUG frames are decoded into `debug` when a list is given and skipped unread
+        otherwise. METRICS frames are merged into this process's `metrics.REGISTRY`, and
+        the sandbox stats they carry are kept in `sandbox`.
+        """
+        while True:
+            try:
+                channel, body = await ipc.read_frame_async(self.proc.stdout)
+            except asyncio.IncompleteReadError as e:
+                raise WorkerCrashedError(f"Worker {self.worker_id} exited during a turn") from e
+            if channel == ipc.RESPONSE:
+                yield ipc.decode_payload(body)["text"]
+            elif channel == ipc.TURN:
+                return
+            elif channel == ipc.DEBUG and debug is not None:
+                debug.append(ipc.decode_payload(body)["text"])
+            elif channel == ipc.METRICS:
+                # the child sends running totals; add what changed since its last snapshot
+                payload = ipc.decode_payload(body)
+                metrics.REGISTRY.merge(payload["metrics"], self._metrics)
+                self._metrics = payload["metrics"]
+                self.sandbox = payload.get("sandbox")
+
+    async def warm_up(self):
+        """Consume the greeting printed before the first prompt."""
+        async with self.lock:
+            await self._ensure_ready()
+
+    async def _ensure_ready(self):
+        if self.stale:
+            # the previous session's conversation must not leak into the next one
+            await self.stop()
+            self.stale = False
+            await self.start()
+        elif not self.is_alive():
+            await self.restart()
+        if not self._greeted:
+            greeting = "".join([text async for text in self._read_turn()])
+            logger.debug("Worker %s greeting: %s", self.worker_id, greeting)
+            self._greeted = True
+
+    def _check_session(self, session_id: Optional[str]):
+        if self.closed:
+            raise SessionMovedError(f"Worker {self.worker_id} was removed from the pool")
+        if session_id is not None and self.session_id != session_id:
+            raise SessionMovedError(f"Worker {self.worker_id} no longer serves session {session_id}")
+
+    async def _write(self, text: str, session_id: Optional[str] = None):
+        try:
+            self.proc.stdin.write(ipc.encode_frame(ipc.INPUT, text=text, session_id=session_id))
+            await self.proc.stdin.drain()
+        except (BrokenPipeError, ConnectionResetError) as e:
+            raise WorkerCrashedError(f"Worker {self.worker_id} is not accepting input") from e
+
+    async def send_turn(self, text: str, session_id: Optional[str] = None) -> Tuple[str, str]:
+        """
+        Send one user message to the workflow and wait for the whole reply.
+
+        Args:
+            text (str): The user message.
+            session_id (str): The session it belongs to; the workflow keys its checkpoints by it.
+
+        Returns:
+            tuple[str, str]: The reply and everything the workflow printed meanwhile.
+
+        Raises:
+            SessionMovedError: The pool removed this worker, or gave it to another session,
+                while the turn waited for it.
+        """
+        async with self.lock:
+            self._check_session(session_id)
+            await self._ensure_ready()
+            await self._write(text, session_id)
+            debug = []
+            response = "".join([chunk async for chunk in self._read_turn(debug)])
+            self.turns += 1
+            return response, "".join(debug)
+
+    async def stream_turn(self, text: str, session_id: Optional[str] = None) -> AsyncIterator[str]:
+        """
+        Send one user message to the workflow and yield the reply as it is generated.
+
+        If the consumer stops early (e.g. the client disconnected), the rest of the turn
+        is still drained so the next turn starts in sync.
+
+        Args:
+            text (str): The user message.
+            session_id (str): The session it belongs to; the workflow keys its checkpoints by it.
+
+        Yields:
+            str: Pieces of the reply, in order.
+
+        Raises:
+            SessionMovedError: The pool removed this worker, or gave it to another session,
+                while the turn waited for it.
+        """
+        async with self.lock:
+            self._check_session(session_id)
+            await self._ensure_ready()
+            await self._write(text, session_id)
+            turn = self._read_turn()
+            try:
+                async for chunk in turn:
+                    yield chunk
+            finally:
+                async for _ in turn:
+                    pass
+                self.turns += 1
+
+    def status(self) -> dict:
+        return {
+            "id": self.worker_id,
+            "pid": self.proc.pid if self.proc else None,
+            "alive": self.is_alive(),
+            "busy": self.lock.locked(),
+            "session": self.session_id,
+            "turns": self.turns,
+            "restarts": self.restarts,
+            "uptime": round(time.time() - self.started_at, 1) if self.started_at else None,
+        }
+
+
+class WorkerPool:
+    """
+    A resizable pool of workflow workers with session-affine routing.
+
+    Every session id is pinned to a worker of its own, because the conversation state
+    lives inside that worker's process and the process runs one conversation. A new
+    session takes a free worker; when every worker is pinned, the least recently used
+    session is evicted (preferring idle ones), and its worker is restarted before it
+    serves the new session. An evicted session starts over on its next turn, or picks
+    up its checkpoint when WORKFLOW_CHECKPOINT_DIR is set. A background task restarts
+    workers that have died; the sessions pinned to them have ended.
+    """
+
+    def __init__(self, size: int, script: str = "workflows.py", cwd: Optional[str] = None,
+                 health_interval: float = 5.0):
+        self.size = max(1, size)
+        self.script = script
+        self.cwd = cwd
+        self.health_interval = health_interval
+        self.workers: Dict[int, WorkflowWorker] = {}
+        # session id -> worker id, least recently used first
+        self.sessions: "OrderedDict[str, int]" = OrderedDict()
+        self.evictions = 0
+        self._next_id = 0
+        self._health_task: Optional[asyncio.Task] = None
+        self._warm_tasks = set()
+
+    @classmethod
+    def from_env(cls) -> "WorkerPool":
+        return cls(
+            size=int(os.environ.get("WORKFLOW_WORKERS", os.cpu_count() or 1)),
+            script=os.environ.get("WORKFLOW_SCRIPT", "workflows.py"),
+            health_interval=float(os.environ.get("WORKFLOW_HEALTH_INTERVAL", "5")),
+        )
+
+    async def start(self):
+        while len(self.workers) < self.size:
+            await self._spawn()
+        self._health_task = asyncio.create_task(self._health_loop())
+
+    async def stop(self):
+        if self._health_task is not None:
+            self._health_task.cancel()
+            self._health_task = None
+        workers = list(self.workers.values())
+        self.workers.clear()
+        self.sessions.clear()
+        for worker in workers:
+            worker.closed = True
+        await asyncio.gather(*(worker.stop() for worker in workers))
+
+    async def _spawn(self) -> WorkflowWorker:
+        worker = WorkflowWorker(self._next_id, self.script, self.cwd)
+        self._next_id += 1
+        await worker.start()
+        self.workers[worker.worker_id] = worker
+        # read the greeting in the background so the first turn doesn't pay for it
+        task = asyncio.create_task(worker.warm_up())
+        self._warm_tasks.add(task)
+        task.add_done_callback(self._warm_tasks.discard)
+        return worker
+
+    def worker_for(self, session_id: str) -> WorkflowWorker:
+        """Return the worker pinned to `session_id`, pinning a free or evicted worker to it if new."""
+        worker_id = self.sessions.get(session_id)
+        if worker_id in self.workers:
+            self.sessions.move_to_end(session_id)
+            return self.workers[worker_id]
+
+        pinned = set(self.sessions.values())
+        free = [wid for wid in self.workers if wid not in pinned]
+        if free:
+            worker = self.workers[min(free)]
+        else:
+            worker = self.workers[self._evict()]
+            worker.stale = True
+        worker.session_id = session_id
+        self.sessions[session_id] = worker.worker_id
+        return worker
+
+    def _evict(self) -> int:
+        """Unpin the least recently used session, idle if possible; returns its worker id."""
+        idle = [sid for sid, wid in self.sessions.items() if not self.workers[wid].lock.locked()]
+        session_id = idle[0] if idle else next(iter(self.sessions))
+        worker_id = self.sessions.pop(session_id)
+        self.evictions += 1
+        logger.info("Evicting session %s from worker %s", session_id, worker_id)
+        return worker_id
+
+    def _unpin(self, worker: WorkflowWorker):
+        if self.sessions.get(worker.session_id) == worker.worker_id:
+            del self.sessions[worker.session_id]
+        worker.session_id = None
+
+    async def open_session(self, session_id: str) -> WorkflowWorker:
+        """
+        Start a worker of its own for `session_id`, outside the pool.
+
+        For conversations that must not share a worker's conversation with the chat
+        sessions pinned to it, such as background jobs. Stop it with `close_session`.
+        """
+        worker = WorkflowWorker(self._next_id, self.script, self.cwd)
+        self._next_id += 1
+        worker.session_id = session_id
+        await worker.start()
+        logger.info("Worker %s serves session %s alone", worker.worker_id, session_id)
+        return worker
+
+    async def close_session(self, worker: WorkflowWorker):
+        worker.closed = True
+        async with worker.lock:
+            await worker.stop()
+
+    async def resize(self, size: int):
+        """
+        Grow or shrink the pool to `size` workers.
+
+        Shrinking stops the newest workers; sessions pinned to them are re-routed on their
+        next turn like evicted ones.
+        """
+        self.size = max(1, size)
+        removed = []
+        while len(self.workers) < self.size:
+            await self._spawn()
+        while len(self.workers) > self.size:
+            worker_id = max(self.workers)
+            removed.append(self.workers.pop(worker_id))
+            removed[-1].closed = True
+            self._unpin(removed[-1])
+        for worker in removed:
+            # wait for an in-flight turn to finish before stopping the process
+            async with worker.lock:
+                await worker.stop()
+
+    async def check_health(self):
+        for worker in list(self.workers.values()):
+            if worker.is_alive() or worker.lock.locked():
+                continue
+            async with worker.lock:
+                if not worker.is_alive():
+                    # its conversation ended (or crashed); the session starts over elsewhere
+                    logger.warning("Workflow worker %s died, restarting", worker.worker_id)
+                    self._unpin(worker)
+                    await worker.restart()
+
+    async def _health_loop(self):
+        while True:
+            await asyncio.sleep(self.health_interval)
+            try:
+                await self.check_health()
+            except Exception:
+                logger.exception("Worker health check failed")
+
+    def sandbox_stats(self) -> Optional[dict]:
+        """The workers' `sandbox.stats()` added up, or None before any worker reported one."""
+        reported = [worker.sandbox for worker in self.workers.values() if worker.sandbox]
+        if not reported:
+            return None
+        totals: Dict[str, float] = {}
+        for stats in reported:
+            for name, value in stats.items():
+                totals[name] = totals.get(name, 0) + value
+        return totals
+
+    def status(self) -> dict:
+        return {
+            "size": self.size,
+            "sessions": len(self.sessions),
+            "evictions": self.evictions,
+            "workers": [w.status() for w in self.workers.values()],
+        }
@@ -1,19 +1,22 @@
 from llama_index.core.agent import FunctionCallingAgentWorker
 from llama_index.core.tools import FunctionTool
-from llama_index.utils.workflow import draw_all_possible_flows
 from typing import Optional, List, Callable
-from colorama import Fore, Style
-from llama_index.llms.azure_openai import AzureOpenAI
-from llama_index.llms.openai import OpenAI
-from llama_index.llms.ollama import Ollama
-from llama_index.llms.anthropic import Anthropic
-from llama_index.llms.groq import Groq
 from llama_index.core.llms import ChatMessage
-from llama_index.agent.openai import OpenAIAgent
 
-from agent_scripts import text_to_diagram as draw_text_to_diagram
+from agent_scripts import atext_to_diagram as draw_text_to_diagram
+from streaming import build_agent, stream_reply
+from agent_memory import BoundedMemory
+from input_provider import ConsoleInputProvider
+from llm_registry import get_llm
+import cassette
+import checkpoint
+import ipc
+import metrics
+import sandbox
+import tracing
 from events import InitializeEvent, ConciergeEvent, OrchestratorEvent, PriceLookupEvent, ImageToTextEvent, TextToDiagramEvent, TextToRAGEvent, ReporterEvent
 
+import inspect
 import os
 
 def load_env_file(file_path=".env"):
@@ -52,11 +55,11 @@ class Message:
 # Centralize LLM initialization
 def initialize_llm(llm_type: str):
     llm_map = {
-        "AzureOpenAI": lambda: AzureOpenAI(engine="testing-first-gbu-doc", model="gpt-4o", temperature=0.4),
-        "Ollama": lambda: Ollama(model="llama3.1:8b", request_timeout=120.0),
-        "OpenAI": lambda:  OpenAI(model="gpt-4o",temperature=0.8),
-        "Anthropic": lambda: Anthropic(model="claude-3-opus-20240229", temperature=0.4),
-        "Groq": lambda: Groq(model="llama-3.1-70b-versatile", temperature=0.4),
+        "AzureOpenAI": lambda: get_llm("AzureOpenAI", engine="testing-first-gbu-doc", model="gpt-4o", temperature=0.4),
+        "Ollama": lambda: get_llm("Ollama", model="llama3.1:8b", request_timeout=120.0),
+        "OpenAI": lambda: get_llm("OpenAI", model="gpt-4o", temperature=0.8),
+        "Anthropic": lambda: get_llm("Anthropic", model="claude-3-opus-20240229", temperature=0.4),
+        "Groq": lambda: get_llm("Groq", model="llama-3.1-70b-versatile", temperature=0.4),
     }
     return llm_map.get(llm_type, lambda: None)()
 
@@ -106,10 +109,20 @@ class ConciergeWorkflow(Workflow):
             "llm": initialize_llm("OpenAI")
             # "llm" : OpenAI(model="gpt-4o",temperature=0.8)
         })
+        if ctx.data.get("restored_state"):
+            ctx.data.update(ctx.data.pop("restored_state"))
         return ConciergeEvent()
 
     @step(pass_context=True)
     async def concierge(self, ctx: Context, ev: ConciergeEvent | StartEvent) -> InitializeEvent | StopEvent | OrchestratorEvent:
+        # talk to the console unless the caller passed run(input_provider=...)
+        if "input_provider" not in ctx.data:
+            ctx.data["input_provider"] = ev.get("input_provider") or ConsoleInputProvider()
+            # conversation state saved by the session store when this session was evicted,
+            # or else by the last step of an earlier run with the same checkpoint id
+            ctx.data["checkpoint_id"] = ev.get("checkpoint_id")
+            ctx.data["restored_state"] = ev.get("session_state") or checkpoint.resume(ev.get("checkpoint_id"))
+
         # initialize user if not already done
         if "user" not in ctx.data:
             return InitializeEvent()
@@ -140,29 +153,31 @@ class ConciergeWorkflow(Workflow):
 
                 Then use the respective tool to fulfill the user's request.            
             """)
-            ctx.data["concierge"] = FunctionCallingAgentWorker.from_tools(
-                tools=[],  # <-- This is likely the cause of the error
+            ctx.data["concierge"] = build_agent(
+                tools=[],
                 llm=ctx.data["llm"],
-                allow_parallel_tool_calls=False,
-                system_prompt=system_prompt
-            ).as_agent()
+                system_prompt=system_prompt,
+                memory=BoundedMemory.from_env(llm=ctx.data["llm"], pinned=lambda: ctx.data.get("requirements"))
+            )
 
         concierge = ctx.data["concierge"]
+        input_provider = ctx.data["input_provider"]
         if ctx.data["overall_request"]:
             last_request = ctx.data["overall_request"]
             ctx.data["overall_request"] = None
             return OrchestratorEvent(request=last_request)
         elif ev.just_completed:
-            response = concierge.chat(f"FYI, the user has just completed the task: {ev.just_completed}")
+            await stream_reply(concierge, f"FYI, the user has just completed the task: {ev.just_completed}", input_provider.respond)
         elif ev.need_help:
             print("The previous process needs help with ", ev.request)
             return OrchestratorEvent(request=ev.request)
         else:
             # first time experience
-            response = concierge.chat("Hello!")
+            await stream_reply(concierge, "Hello!", input_provider.respond)
 
-        print(Fore.MAGENTA + str(response) + Style.RESET_ALL)
-        user_msg_str = input("> ").strip()
+        user_msg_str = (await input_provider.ask("> ")).strip()
+        # under the API wrapper, keep this session's checkpoint (and restore it after a restart)
+        checkpoint.follow_session(ctx.data, input_provider.session_id)
         return OrchestratorEvent(request=user_msg_str)
 
     @step(pass_context=True)
@@ -183,56 +198,56 @@ class ConciergeWorkflow(Workflow):
 
         print(f"Orchestrator received request: {ev.request}")
 
-        def emit_stock_lookup() -> bool:
+        async def emit_stock_lookup() -> bool:
             """Call this if the user wants to look up a stock price."""
             print("__emitted: stock lookup")
-            self.send_event(StockLookupEvent(request=ev.request))
+            ctx.send_event(StockLookupEvent(request=ev.request))
             return True
 
-        def emit_authenticate() -> bool:
+        async def emit_authenticate() -> bool:
             """Call this if the user wants to authenticate"""
             print("__emitted: authenticate")
-            self.send_event(TextToDiagramEvent(request=ev.request))
+            ctx.send_event(TextToDiagramEvent(request=ev.request))
             return True
 
-        def emit_text_to_diagram() -> bool:
+        async def emit_text_to_diagram() -> bool:
             """Call this if the user wants to authenticate"""
             print("__emitted: authenticate")
-            self.send_event(TextToDiagramEvent(request=ev.request))
+            ctx.send_event(TextToDiagramEvent(request=ev.request))
             return True
 
-        def emit_account_balance() -> bool:
+        async def emit_account_balance() -> bool:
             """Call this if the user wants to check an account balance."""
             print("__emitted: account balance")
-            self.send_event(AccountBalanceEvent(request=ev.request))
+            ctx.send_event(AccountBalanceEvent(request=ev.request))
             return True
 
-        def emit_transfer_money() -> bool:
+        async def emit_transfer_money() -> bool:
             """Call this if the user wants to transfer money."""
             print("__emitted: transfer money")
-            self.send_event(TransferMoneyEvent(request=ev.request))
+            ctx.send_event(TransferMoneyEvent(request=ev.request))
             return True
 
-        def emit_concierge() -> bool:
+        async def emit_concierge() -> bool:
             """Call this if the user wants to do something else or you can't figure out what they want to do."""
             print("__emitted: concierge")
-            self.send_event(ConciergeEvent(request=ev.request))
+            ctx.send_event(ConciergeEvent(request=ev.request))
             return True
 
-        def emit_stop() -> bool:
+        async def emit_stop() -> bool:
             """Call this if the user wants to stop or exit the system."""
             print("__emitted: stop")
-            self.send_event(StopEvent())
+            ctx.send_event(StopEvent())
             return True
 
         tools = [
-            FunctionTool.from_defaults(fn=emit_stock_lookup),
-            FunctionTool.from_defaults(fn=emit_authenticate),
-            FunctionTool.from_defaults(fn=emit_account_balance),
-            FunctionTool.from_defaults(fn=emit_transfer_money),
-            FunctionTool.from_defaults(fn=emit_concierge),
-            FunctionTool.from_defaults(fn=emit_text_to_diagram),
-            FunctionTool.from_defaults(fn=emit_stop)
+            FunctionTool.from_defaults(async_fn=emit_stock_lookup),
+            FunctionTool.from_defaults(async_fn=emit_authenticate),
+            FunctionTool.from_defaults(async_fn=emit_account_balance),
+            FunctionTool.from_defaults(async_fn=emit_transfer_money),
+            FunctionTool.from_defaults(async_fn=emit_concierge),
+            FunctionTool.from_defaults(async_fn=emit_text_to_diagram),
+            FunctionTool.from_defaults(async_fn=emit_stop)
         ]
 
         system_prompt = (f"""
@@ -276,7 +291,7 @@ class ConciergeWorkflow(Workflow):
                 system_prompt=system_prompt
             ).as_agent()
 
-        response = str(ctx.data["orchestrator"].chat(ev.request))
+        response = str(await ctx.data["orchestrator"].achat(ev.request))
 
         print(response)
 
@@ -326,7 +341,7 @@ class ConciergeWorkflow(Workflow):
                 trigger_event=AuthenticateEvent
             )
 
-        return ctx.data["authentication_agent"].handle_event(ev)
+        return await ctx.data["authentication_agent"].handle_event(ev)
 
     @step(pass_context=True)
     async def price_lookup(self, ctx: Context, ev: PriceLookupEvent) -> ConciergeEvent:
@@ -382,7 +397,7 @@ class ConciergeWorkflow(Workflow):
                 trigger_event=PriceLookupEvent
             )
 
-        return ctx.data["price_lookup_agent"].handle_event(ev)
+        return await ctx.data["price_lookup_agent"].handle_event(ev)
 
     @step(pass_context=True)
     async def image_to_text(self, ctx: Context, ev: ImageToTextEvent) -> ConciergeEvent:
@@ -414,7 +429,7 @@ class ConciergeWorkflow(Workflow):
                 trigger_event=ImageToTextEvent
             )
 
-        return ctx.data["image_to_text_agent"].handle_event(ev)
+        return await ctx.data["image_to_text_agent"].handle_event(ev)
 
     @step(pass_context=True)
     async def text_to_diagram(self, ctx: Context, ev: TextToDiagramEvent) -> ConciergeEvent:
@@ -423,9 +438,9 @@ class ConciergeWorkflow(Workflow):
         self.log_history(ctx, "text_to_diagram", "user", ev.request)
 
         if "text_to_diagram_agent" not in ctx.data:
-            def generate_diagram(text: str) -> str:
+            async def generate_diagram(text: str) -> str:
                 """Useful for describing a diagram using text."""
-                draw_text_to_diagram(text)
+                await draw_text_to_diagram(text)
 
                 return "Output diagram saved to output_diagram.png"
 
@@ -445,7 +460,7 @@ class ConciergeWorkflow(Workflow):
                 trigger_event=TextToDiagramEvent
             )
 
-        return ctx.data["text_to_diagram_agent"].handle_event(ev)
+        return await ctx.data["text_to_diagram_agent"].handle_event(ev)
 
     @step(pass_context=True)
     async def text_to_rag(self, ctx: Context, ev: TextToRAGEvent) -> ConciergeEvent:
@@ -478,7 +493,7 @@ class ConciergeWorkflow(Workflow):
                 trigger_event=TextToRAGEvent
             )
 
-        return ctx.data["text_to_rag_agent"].handle_event(ev)
+        return await ctx.data["text_to_rag_agent"].handle_event(ev)
 
     @step(pass_context=True)
     async def report(self, ctx: Context, ev: ReporterEvent) -> ConciergeEvent:
@@ -508,7 +523,7 @@ class ConciergeWorkflow(Workflow):
                 trigger_event=ReporterEvent
             )
 
-        return ctx.data["report_agent"].handle_event(ev)
+        return await ctx.data["report_agent"].handle_event(ev)
 
 class ConciergeAgent:
     name: str
@@ -535,39 +550,53 @@ class ConciergeAgent:
         self.context.data["redirecting"] = False
         self.trigger_event = trigger_event
 
-        # set up the tools including the ones everybody gets
-        def done() -> None:
+        # set up the tools including the ones everybody gets; these two run on the
+        # event loop because they send events through the context
+        async def done() -> None:
             """When you complete your task, call this tool."""
             print(f"{self.name} is complete")
             self.context.data["redirecting"] = True
-            parent.send_event(ConciergeEvent(just_completed=self.name))
+            self.context.send_event(ConciergeEvent(just_completed=self.name))
 
-        def need_help() -> None:
+        async def need_help() -> None:
             """If the user asks to do something you don't know how to do, call this."""
             print(f"{self.name} needs help")
             self.context.data["redirecting"] = True
-            parent.send_event(ConciergeEvent(request=self.current_event.request,need_help=True))
+            self.context.send_event(ConciergeEvent(request=self.current_event.request,need_help=True))
 
         self.tools = [
-            FunctionTool.from_defaults(fn=done),
-            FunctionTool.from_defaults(fn=need_help)
+            FunctionTool.from_defaults(async_fn=done),
+            FunctionTool.from_defaults(async_fn=need_help)
         ]
+        # tools that do I/O are coroutines and are awaited on the loop; plain functions
+        # are run in a thread by the agent
         for t in tools:
-            self.tools.append(FunctionTool.from_defaults(fn=t))
-
-        agent_worker = FunctionCallingAgentWorker.from_tools(
+            timed = tracing.traced(metrics.timed_tool(t, agent=self.name), agent=self.name)
+            if inspect.iscoroutinefunction(t):
+                self.tools.append(FunctionTool.from_defaults(async_fn=timed))
+            else:
+                self.tools.append(FunctionTool.from_defaults(fn=timed))
+
+        # recent turns verbatim, older ones summarized, the requirements always included
+        self.memory = BoundedMemory.from_env(
+            llm=self.context.data["llm"],
+            pinned=lambda: self.context.data.get("requirements")
+        )
+        self.agent = build_agent(
             self.tools,
             llm=self.context.data["llm"],
-            allow_parallel_tool_calls=False,
-            system_prompt=self.system_prompt
+            system_prompt=self.system_prompt,
+            memory=self.memory
         )
-        self.agent = agent_worker.as_agent()
 
-    def handle_event(self, ev: Event):
+    async def handle_event(self, ev: Event):
         self.current_event = ev
+        input_provider = self.context.data["input_provider"]
 
-        response = str(self.agent.chat(ev.request))
-        print(Fore.MAGENTA + str(response) + Style.RESET_ALL)
+        with metrics.agent_turn(self.name):
+            await stream_reply(self.agent, ev.request, input_provider.respond)
+        metrics.MEMORY_TOKENS.observe(self.memory.token_count(), agent=self.name)
+        await self.memory.acompact()
 
         # if they're sending us elsewhere we're done here
         if self.context.data["redirecting"]:
@@ -575,14 +604,21 @@ class ConciergeAgent:
             return None
 
         # otherwise, get some user input and then loop
-        user_msg_str = input("> ").strip()
+        user_msg_str = (await input_provider.ask("> ")).strip()
+        checkpoint.follow_session(self.context.data, input_provider.session_id)
         return self.trigger_event(request=user_msg_str)
 
-draw_all_possible_flows(ConciergeWorkflow, filename="concierge_flows.html")
 
 async def main():
+    ipc.install_from_env()
+    metrics.install()
+    checkpoint.install_from_env()
+    tracing.install_from_env()
+    # warm the diagram sandbox while the user types
+    sandbox.pool()
     c = ConciergeWorkflow(timeout=1200, verbose=True)
-    result = await c.run()
+    result = await c.run(checkpoint_id=os.environ.get("WORKFLOW_CHECKPOINT_ID"),
+                         input_provider=cassette.input_provider())
     print(result)
 
 # Check if an event loop is already running
@@ -0,0 +1,56 @@
+import asyncio
+
+import pytest
+
+from admission import AdmissionController, DeadlineExceededError, QueueFullError
+
+
+def test_full_queue_rejects_with_retry_after():
+    async def run():
+        admission = AdmissionController(max_inflight=1, max_queue=1)
+        ticket = await admission.acquire()
+        queued = asyncio.create_task(admission.acquire())
+        await asyncio.sleep(0)
+        with pytest.raises(QueueFullError) as e:
+            await admission.acquire()
+        admission.release(ticket)
+        admission.release(await queued)
+        return admission, e.value
+
+    admission, error = asyncio.run(run())
+    assert error.retry_after >= 1
+    stats = admission.stats()
+    assert (stats["admitted"], stats["rejected"], stats["inflight"], stats["depth"]) == (2, 1, 0, 0)
+
+
+def test_queued_request_expires_at_deadline():
+    async def run():
+        admission = AdmissionController(max_inflight=1, max_queue=4)
+        async with admission.slot():
+            with pytest.raises(DeadlineExceededError):
+                await admission.acquire(timeout=0.01)
+        # the expired request must not hold on to a slot
+        async with admission.slot(timeout=0.01):
+            pass
+        return admission
+
+    admission = asyncio.run(run())
+    assert admission.stats()["expired"] == 1
+    assert admission.stats()["admitted"] == 2
+
+
+def test_simultaneous_arrivals_respect_the_bound():
+    async def run():
+        admission = AdmissionController(max_inflight=1, max_queue=1)
+
+        async def turn():
+            try:
+                async with admission.slot():
+                    await asyncio.sleep(0.01)
+                return "ok"
+            except QueueFullError:
+                return "rejected"
+
+        return await asyncio.gather(*(turn() for _ in range(4)))
+
+    assert sorted(asyncio.run(run())) == ["ok", "ok", "rejected", "rejected"]
@@ -0,0 +1,40 @@
+import asyncio
+
+from llama_index.core.llms import ChatMessage, MessageRole
+
+from agent_memory import BoundedMemory
+
+
+def add_turns(memory, count, start=0):
+    for i in range(start, start + count):
+        memory.put(ChatMessage(role=MessageRole.USER, content=f"question {i}"))
+        memory.put(ChatMessage(role=MessageRole.ASSISTANT, content=f"answer {i}"))
+
+
+def test_get_sends_pinned_text_and_the_last_turns():
+    memory = BoundedMemory(max_turns=2, token_limit=1000, pinned=lambda: "A Streamlit app on ECS")
+    add_turns(memory, 5)
+
+    messages = memory.get()
+    assert messages[0].role == MessageRole.SYSTEM
+    assert "A Streamlit app on ECS" in messages[0].content
+    assert [m.content for m in messages[1:]] == ["question 3", "answer 3", "question 4", "answer 4"]
+
+
+def test_get_drops_old_turns_to_fit_the_token_budget():
+    memory = BoundedMemory(max_turns=10, token_limit=60)
+    memory.put(ChatMessage(role=MessageRole.USER, content="plan " * 100))
+    memory.put(ChatMessage(role=MessageRole.ASSISTANT, content="ok"))
+    add_turns(memory, 1)
+
+    assert [m.content for m in memory.get()] == ["question 0", "answer 0"]
+
+
+def test_compact_folds_old_turns_into_the_summary():
+    memory = BoundedMemory(max_turns=2, token_limit=1000)
+    add_turns(memory, 4)
+    asyncio.run(memory.acompact())
+
+    assert [m.content for m in memory.get_all()] == ["question 2", "answer 2", "question 3", "answer 3"]
+    assert memory.summary == "- question 0\n- question 1"
+    assert "question 0" in memory.get()[0].content
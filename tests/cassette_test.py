@@ -0,0 +1,77 @@
+import asyncio
+
+import pytest
+from llama_index.core.llms import ChatMessage, MockLLM
+
+import cassette
+
+
+class CountingLLM(MockLLM):
+    calls: int = 0
+
+    def complete(self, prompt, formatted=False, **kwargs):
+        self.calls += 1
+        return super().complete(prompt, formatted=formatted, **kwargs)
+
+
+class ScriptedInput(cassette.InputProvider):
+    def __init__(self, messages):
+        self.messages = list(messages)
+
+    def respond(self, text):
+        pass
+
+    async def ask(self, prompt="> "):
+        return self.messages.pop(0)
+
+
+@pytest.fixture(autouse=True)
+def cassette_file(tmp_path, monkeypatch):
+    path = tmp_path / "session.jsonl"
+    monkeypatch.setenv("LLM_CASSETTE", str(path))
+    cassette.reset()
+    yield path
+    cassette.reset()
+
+
+def use(mode, monkeypatch):
+    monkeypatch.setenv("LLM_CASSETTE_MODE", mode)
+    cassette.reset()
+    return cassette.cassette_class(CountingLLM)()
+
+
+def test_replay_serves_the_recording(monkeypatch):
+    llm = use("record", monkeypatch)
+    messages = [ChatMessage(role="user", content="Hello!")]
+    reply = asyncio.run(llm.achat(messages))
+    plan = llm.complete("draw the plan")
+    provider = cassette.input_provider(ScriptedInput(["a Streamlit app on S3", "exit"]))
+    assert asyncio.run(provider.ask()) == "a Streamlit app on S3"
+    assert llm.calls == 2
+
+    replayed = use("replay", monkeypatch)
+    # the same call gets its own recording, whatever the order
+    assert replayed.complete("draw the plan").text == plan.text
+    assert replayed.chat(messages).message.content == reply.message.content
+    assert replayed.calls == 0
+    assert asyncio.run(cassette.input_provider().ask()) == "a Streamlit app on S3"
+    with pytest.raises(cassette.CassetteExhaustedError):
+        replayed.complete("draw the plan")
+
+
+def test_unmatched_calls_replay_in_order_with_sdk_objects(monkeypatch):
+    from llama_index.core.llms import ChatResponse, MessageRole
+    from openai.types.chat import ChatCompletionMessageToolCall
+
+    tool_call = ChatCompletionMessageToolCall(id="call_1", type="function",
+                                              function={"name": "lookup_price", "arguments": "{}"})
+    response = ChatResponse(message=ChatMessage(role=MessageRole.ASSISTANT, content=None,
+                                                additional_kwargs={"tool_calls": [tool_call]}))
+    use("record", monkeypatch)
+    cassette.active().record_call("some-key", "chat", 0.25, response=response)
+
+    replayed = use("replay", monkeypatch)
+    message = replayed.chat([ChatMessage(role="user", content="generated at 10:42")]).message
+    assert message.role == MessageRole.ASSISTANT
+    assert message.additional_kwargs["tool_calls"][0] == tool_call
+    assert cassette.active().stats()["unmatched"] == 1
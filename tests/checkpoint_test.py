@@ -0,0 +1,101 @@
+import asyncio
+
+from llama_index.core.workflow import Context, Event, StartEvent, StopEvent, Workflow, step
+
+import checkpoint
+from checkpoint import CheckpointStore
+
+
+class AskEvent(Event):
+    request: str
+
+
+class TwoStepWorkflow(Workflow):
+    @step(pass_context=True)
+    async def start(self, ctx: Context, ev: StartEvent) -> AskEvent:
+        ctx.data["checkpoint_id"] = ev.get("checkpoint_id")
+        ctx.data["user"] = {"username": "ana"}
+        ctx.data["requirements"] = "A serverless API"
+        return AskEvent(request="draw the diagram")
+
+    @step(pass_context=True)
+    async def answer(self, ctx: Context, ev: AskEvent) -> StopEvent:
+        return StopEvent(result="done")
+
+
+class ToolStopWorkflow(TwoStepWorkflow):
+    """Stops the way the orchestrator's `emit_stop` tool does: sends the StopEvent, returns nothing."""
+
+    @step(pass_context=True)
+    async def answer(self, ctx: Context, ev: AskEvent) -> StopEvent:
+        ctx.send_event(StopEvent(result="done"))
+        return None
+
+
+def test_checkpoint_keeps_state_and_the_request_in_flight(tmp_path):
+    store = CheckpointStore(str(tmp_path), max_resumes=1)
+    store.save("s1", "orchestrator", {"requirements": "A serverless API", "overall_request": None},
+               {"event": "TextToDiagramEvent", "request": "draw the diagram"})
+
+    state = store.resume("s1")
+    assert state == {"requirements": "A serverless API", "overall_request": "draw the diagram"}
+    # the replayed request crashed again: it is dropped on the next resume
+    assert store.resume("s1")["overall_request"] is None
+    assert store.stats()["dropped"] == 1
+
+
+def test_steps_write_checkpoints_and_a_finished_run_removes_it(tmp_path, monkeypatch):
+    monkeypatch.setattr(checkpoint, "_store", None)
+    store = checkpoint.install(CheckpointStore(str(tmp_path)))
+
+    async def run():
+        return await TwoStepWorkflow(timeout=10).run(checkpoint_id="s2")
+
+    asyncio.run(run())
+
+    assert store.saves == 1
+    assert store.load("s2") is None
+    assert store.resume("missing") is None
+
+
+def test_a_stop_sent_by_a_tool_removes_the_checkpoint(tmp_path, monkeypatch):
+    monkeypatch.setattr(checkpoint, "_store", None)
+    store = checkpoint.install(CheckpointStore(str(tmp_path)))
+
+    async def run():
+        return await ToolStopWorkflow(timeout=10).run(checkpoint_id="s3")
+
+    assert asyncio.run(run()) == "done"
+    # the steps saved their state when they returned; the sent StopEvent then removed it
+    assert store.saves
+    assert store.load("s3") is None
+
+
+def test_follow_session_restores_the_session_after_a_restart(tmp_path, monkeypatch):
+    store = CheckpointStore(str(tmp_path))
+    monkeypatch.setattr(checkpoint, "_store", store)
+    store.save("alice", "orchestrator", {"requirements": "A serverless API", "overall_request": None},
+               {"event": "TextToDiagramEvent", "request": "draw the diagram"})
+
+    # a restarted worker: no checkpoint id until the first message says whose it is
+    data = {"user": {"username": "ana"}, "checkpoint_id": None, "overall_request": None}
+    checkpoint.follow_session(data, "alice")
+    assert data["checkpoint_id"] == "alice"
+    assert data["requirements"] == "A serverless API"
+    assert data["overall_request"] is None
+
+    # another session on the same worker starts fresh, and never sees alice's state
+    data["requirements"] = "edited"
+    data["concierge"] = object()
+    checkpoint.follow_session(data, "bob")
+    assert data["checkpoint_id"] == "bob"
+    assert "requirements" not in data and "concierge" not in data
+    assert data["user"] == {"username": "ana"}
+    data["requirements"] = "A data lake"
+    checkpoint.follow_session(data, None)
+    assert data["checkpoint_id"] == "bob"
+
+    # switching back saves bob and restores alice as she left it
+    checkpoint.follow_session(data, "alice")
+    assert data["requirements"] == "edited"
+    assert store.load("bob")["state"]["requirements"] == "A data lake"
@@ -0,0 +1,81 @@
+from diagram_validator import fix_imports, format_problems, validate
+
+GOOD = """\
+from diagrams import Diagram, Cluster, Edge
+from diagrams.aws.compute import ECS, Lambda
+from importall import *
+
+def bucket(name):
+    return S3(name)
+
+with Diagram("App", show=False, direction="LR"):
+    users = Users("users")
+    with Cluster("Service"):
+        web = [ECS(f"web{i}") for i in range(2)]
+    users >> Edge(label="https") >> web >> bucket("output")
+    web - Lambda("worker")
+"""
+
+BAD = """\
+from diagrams import Diagram, Cluster, Edge
+from diagrams.aws.storage import Lambda
+from diagrams.aws.computer import EC2
+
+db = RDS("outside")
+with Diagram("App", direction="left"):
+    cache = ElastiCach("cache")
+    Lambda("a") >> Edge("writes") >> Cluster("c")
+    [Lambda("a")] >> [Lambda("b")]
+    Lambda("a") >> "queue"
+"""
+
+
+def test_valid_code_has_no_problems():
+    assert validate(GOOD) == []
+    # names from a star import it cannot follow are left to the run
+    assert validate("from somewhere import *\nwith Diagram('x'):\n    Thing('y')") == []
+
+
+def test_problems_point_at_the_line_and_the_fix():
+    problems = validate(BAD)
+    found = {(p.line, p.kind) for p in problems}
+    assert found == {(2, "import"), (3, "import"), (5, "name"), (5, "diagram"), (6, "diagram"), (7, "name"),
+                     (8, "edge"), (8, "cluster"), (9, "connection"), (10, "connection")}
+    text = format_problems(problems)
+    assert "line 2: diagrams.aws.storage has no Lambda (use: from diagrams.aws.compute import Lambda)" in text
+    assert "did you mean diagrams.aws.compute?" in text
+    assert "add: from diagrams.aws.database import RDS" in text
+    assert "use Edge(label='writes')" in text
+    assert len(problems) == len(set(map(str, problems)))
+
+    [problem] = validate("with Diagram('x'):\n    a >> (b\n")
+    assert problem.kind == "syntax" and problem.line == 2
+
+
+def test_fix_imports_points_imports_at_the_classes_meant():
+    code, fixes = fix_imports(BAD)
+    lines = code.splitlines()
+    assert len(lines) == len(BAD.splitlines())
+    assert lines[1] == "from diagrams.aws.compute import Lambda"
+    assert lines[2] == ("from diagrams.aws.compute import EC2; "
+                        "from diagrams.aws.database import RDS, ElastiCache as ElastiCach")
+    assert [p.line for p in fixes] == [2, 3, 5, 7]
+    assert {p.kind for p in validate(code)} == {"diagram", "edge", "cluster", "connection"}
+
+    assert fix_imports(GOOD) == (GOOD, [])
+
+
+def test_missing_names_are_only_imported_from_the_scripts_provider():
+    code = ("from diagrams import Diagram\nfrom importall import *\n\nwith Diagram('x'):\n"
+            "    Queue('jobs') >> Cache('hot') >> ElastiCach('warm')\n")
+    fixed, fixes = fix_imports(code)
+    # importall is AWS: the OCI Queue and the Azure Cache are reported, not imported
+    assert [p.message for p in fixes] == ["ElastiCach is not imported"]
+    assert "diagrams.oci" not in fixed and "diagrams.azure" not in fixed
+    problems = {p.message: p.hint for p in validate(fixed)}
+    assert problems["Queue is not imported"].startswith("diagrams.aws has no Queue")
+    assert problems["Cache is not imported"].endswith("diagrams.azure.general has one")
+
+    onprem = "from diagrams import Diagram\nfrom diagrams.onprem.queue import Kafka\n\nwith Diagram('x'):\n    Kafka('k') >> Redis('r')\n"
+    fixed, _ = fix_imports(onprem)
+    assert "from diagrams.onprem.inmemory import Redis" in fixed
@@ -0,0 +1,34 @@
+from llama_index.core.workflow import Event, StartEvent, StopEvent, Workflow, step
+
+import flow_graph
+
+
+class PingEvent(Event):
+    pass
+
+
+class PingWorkflow(Workflow):
+    @step
+    async def start(self, ev: StartEvent) -> PingEvent:
+        return PingEvent()
+
+    @step
+    async def ping(self, ev: PingEvent) -> StopEvent:
+        return StopEvent()
+
+
+class PingPongWorkflow(PingWorkflow):
+    @step
+    async def ping(self, ev: PingEvent) -> PingEvent | StopEvent:
+        return StopEvent()
+
+
+def test_drawn_once_per_step_signatures(tmp_path):
+    out = tmp_path / "docs" / "flows.html"
+    assert flow_graph.draw(PingWorkflow, str(out))
+    assert (tmp_path / "docs" / "lib").is_dir()
+    assert not flow_graph.draw(PingWorkflow, str(out))
+
+    assert flow_graph.steps_hash(PingPongWorkflow) != flow_graph.steps_hash(PingWorkflow)
+    assert flow_graph.draw(PingPongWorkflow, str(out))
+    assert flow_graph.rendered_hash(str(out)) == flow_graph.steps_hash(PingPongWorkflow)
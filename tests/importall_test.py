@@ -0,0 +1,56 @@
+import importlib
+import subprocess
+import sys
+
+import importall
+
+SCRIPT = """\
+from diagrams import Diagram, Cluster
+from importall import *
+
+def bucket(name):
+    return S3(name)
+
+with Diagram("App", show=False):
+    users = Users("users")
+    with Cluster("Service"):
+        web = [EC2(f"web{i}") for i in range(2)]
+    users >> web >> bucket("output")
+"""
+
+
+def test_names_resolve_to_the_classes_the_star_imports_gave():
+    for name, module in importall._TABLE.items():
+        assert getattr(importall, name) is getattr(importlib.import_module(module), name)
+    assert "EC2" in dir(importall)
+
+
+def test_only_used_modules_are_imported():
+    code = ("import sys, importall; importall.EC2; "
+            "print(sorted(m for m in sys.modules if m.startswith('diagrams.aws.')))")
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True,
+                            cwd=importall.__file__.rsplit("/", 1)[0])
+    assert result.stdout.strip() == "['diagrams.aws.compute']"
+
+
+def test_explicit_imports_import_what_the_script_uses():
+    code = importall.explicit_imports(SCRIPT)
+    assert "import *" not in code
+    assert "from diagrams.aws.compute import EC2; from diagrams.aws.general import Users; " \
+           "from diagrams.aws.storage import S3" in code
+    assert len(code.splitlines()) == len(SCRIPT.splitlines())
+
+    namespace = {}
+    exec("".join(code.splitlines(keepends=True)[:2]), namespace)
+    assert {"Diagram", "Cluster", "EC2", "Users", "S3"} <= set(namespace)
+    assert importall.explicit_imports("from importall import *\nwith (") == "from importall import *\nwith ("
+
+
+def test_explicit_imports_keep_statements_sharing_the_line():
+    code = importall.explicit_imports("from diagrams import Diagram; from importall import *\n"
+                                      "with Diagram('x'):\n    EC2('web')\n")
+    assert code.splitlines()[0] == "from diagrams import Diagram; from diagrams.aws.compute import EC2"
+
+    code = importall.explicit_imports("from importall import *; import os\nfrom importall import *; x = S3\n")
+    assert code.splitlines() == ["from diagrams.aws.storage import S3; import os", "pass; x = S3"]
+    compile(code, "script", "exec")
@@ -0,0 +1,62 @@
+import metrics
+from intent_router import IntentRouter, router_stats
+
+DESCRIPTIONS = {
+    "text_to_diagram": "Call this if the user wants to text to diagram",
+    "stop": "Call this if the user wants to stop or exit the system.",
+    "price_lookup": "Call this if the user wants to look up a price",
+    "text_to_rag": "Call this if the user wants to perform a text to RAG search",
+    "report": "Call this if the user wants to generate a report",
+    "estimate": "Call this once the user has confirmed their requirements and wants the full estimate",
+}
+
+
+def test_rules_and_classifier_route_obvious_requests():
+    router = IntentRouter(DESCRIPTIONS)
+    assert router.route("Draw the architecture diagram for these requirements.", confirmed=True).intent == "text_to_diagram"
+    assert router.route("quit").intent == "stop"
+    route = router.route("what will the monthly bill be for this")
+    assert (route.intent, route.source) == ("price_lookup", "classifier")
+
+
+def test_unclear_requests_go_to_the_llm():
+    router = IntentRouter(DESCRIPTIONS)
+    assert router.route("I want a Streamlit app writing to S3 with 500k users") is None
+    assert router.route("draw the diagram and tell me the price") is None
+    assert router.route("Check the generated diagram code and fix any import errors.") is None
+    assert IntentRouter(DESCRIPTIONS, enabled=False).route("quit") is None
+
+
+def test_ordinary_turns_are_not_misrouted():
+    router = IntentRouter(DESCRIPTIONS)
+    # only the exact rule stops the conversation, never the classifier
+    assert router.route("no, stop using DynamoDB") is None
+    assert router.route("I am done, close the session") is None
+    # talking about costs or searching is part of the requirements, not a lookup
+    assert router.route("keep costs low") is None
+    assert router.route("cost-effective storage for the logs") is None
+    assert router.route("search for a cheaper database") is None
+    # requirements that only mention what a route deals with are not requests for it
+    assert router.route("How much memory does it need? about 80GB") is None
+    assert router.route("how much traffic can ALB handle") is None
+    assert router.route("I need to process images from a knowledge base of PDFs") is None
+    assert router.route("make the report later") is None
+    # nothing is drawn or estimated before the requirements are confirmed
+    assert router.route("go ahead") is None
+    assert router.route("Draw the architecture diagram for these requirements.") is None
+    assert router.route("go ahead", confirmed=True).intent == "estimate"
+    assert router.confirms("yes, go ahead")
+    assert not router.confirms("ok, but do not draw it yet") and not router.confirms("draw it")
+
+
+def test_stats_estimate_the_llm_time_saved():
+    registry = metrics.Registry()
+    decisions = registry.counter("intent_router_decisions_total", "", ["source", "route"])
+    seconds = registry.histogram("intent_router_seconds", "", ["source"])
+    decisions.inc(3, source="rule", route="stop")
+    decisions.inc(source="llm", route="")
+    seconds.observe(2.0, source="llm")
+
+    stats = router_stats(registry)
+    assert stats["hit_rate"] == 0.75
+    assert stats["seconds_saved"] == 6.0
@@ -0,0 +1,88 @@
+import asyncio
+import io
+
+import ipc
+import metrics
+from worker_pool import WorkerPool, WorkflowWorker
+
+
+def test_frame_round_trip():
+    stream = io.BytesIO(
+        ipc.encode_frame(ipc.RESPONSE, text="Hello")
+        + ipc.encode_frame(ipc.DEBUG, text="Orchestrator received request: hi\n")
+        + ipc.encode_frame(ipc.TURN, prompt="> ")
+    )
+
+    frames = []
+    while (frame := ipc.read_frame(stream)) is not None:
+        channel, body = frame
+        frames.append((channel, ipc.decode_payload(body)))
+
+    assert frames == [
+        (ipc.RESPONSE, {"text": "Hello"}),
+        (ipc.DEBUG, {"text": "Orchestrator received request: hi\n"}),
+        (ipc.TURN, {"prompt": "> "}),
+    ]
+
+
+def test_truncated_frame_is_end_of_stream():
+    frame = ipc.encode_frame(ipc.RESPONSE, text="cut short")
+    assert ipc.read_frame(io.BytesIO(frame[:-3])) is None
+
+
+def test_read_frame_async_handles_split_writes():
+    async def run():
+        reader = asyncio.StreamReader()
+        frame = ipc.encode_frame(ipc.RESPONSE, text="ünïcode")
+        # feed the frame one byte at a time, as a pipe may deliver it
+        for i in range(len(frame)):
+            reader.feed_data(frame[i:i + 1])
+        reader.feed_eof()
+        return await ipc.read_frame_async(reader)
+
+    channel, body = asyncio.run(run())
+    assert channel == ipc.RESPONSE
+    assert ipc.decode_payload(body) == {"text": "ünïcode"}
+
+
+def test_channel_ask_sends_turn_and_reads_input():
+    out = io.BytesIO()
+    channel = ipc.IPCChannel(out, io.BytesIO(ipc.encode_frame(ipc.INPUT, text="draw it", session_id="s1")))
+
+    assert channel.ask("> ") == "draw it"
+    assert channel.session_id == "s1"
+    out.seek(0)
+    channel_id, body = ipc.read_frame(out)
+    assert channel_id == ipc.TURN
+    assert ipc.decode_payload(body) == {"prompt": "> "}
+
+
+def test_debug_writer_frames_prints():
+    out = io.BytesIO()
+    print("Looking up price", file=ipc.DebugWriter(ipc.IPCChannel(out, io.BytesIO())))
+
+    out.seek(0)
+    texts = []
+    while (frame := ipc.read_frame(out)) is not None:
+        assert frame[0] == ipc.DEBUG
+        texts.append(ipc.decode_payload(frame[1])["text"])
+    assert "".join(texts) == "Looking up price\n"
+
+
+def test_workers_report_their_sandbox_stats_with_the_metrics():
+    async def run():
+        pool = WorkerPool(size=2, script="workflow.py")
+        for worker_id in range(2):
+            worker = WorkflowWorker(worker_id, "workflow.py")
+            worker.proc = type("Proc", (), {"stdout": asyncio.StreamReader()})()
+            worker.proc.stdout.feed_data(
+                ipc.encode_frame(ipc.METRICS, metrics=metrics.Registry().snapshot(),
+                                 sandbox={"size": 1, "idle": 1, "jobs": worker_id + 2})
+                + ipc.encode_frame(ipc.TURN, prompt="> "))
+            assert [text async for text in worker._read_turn()] == []
+            pool.workers[worker_id] = worker
+        return pool
+
+    pool = asyncio.run(run())
+    assert pool.sandbox_stats() == {"size": 2, "idle": 2, "jobs": 5}
+    assert WorkerPool(size=1).sandbox_stats() is None
@@ -0,0 +1,90 @@
+import asyncio
+import os
+
+from jobs import ESTIMATION_STEPS, FAILED, SUCCEEDED, JobManager, estimation_steps
+from worker_pool import WorkerCrashedError
+
+SRC = os.path.join(os.path.dirname(__file__), "..", "src")
+
+
+class FakeWorker:
+    def __init__(self, workdir, fail_on=None):
+        self.workdir = workdir
+        self.fail_on = fail_on
+        self.turns = []
+
+    async def send_turn(self, text, session_id=None):
+        if text == self.fail_on:
+            raise WorkerCrashedError("worker exited")
+        if text == "Raise":
+            raise KeyError("agent")
+        self.turns.append(text)
+        if text.startswith("Draw"):
+            with open(os.path.join(self.workdir, "aws_architecture.png"), "wb") as f:
+                f.write(b"png")
+        return f"ok: {text}", ""
+
+
+class FakePool:
+    def __init__(self, worker):
+        self.worker = worker
+        self.opened = []
+        self.open = 0
+
+    async def open_session(self, session_id):
+        self.opened.append(session_id)
+        self.open += 1
+        return self.worker
+
+    async def close_session(self, worker):
+        self.open -= 1
+
+
+def run_job(tmp_path, worker, **submit):
+    async def run():
+        manager = JobManager(FakePool(worker), jobs_dir=str(tmp_path / "jobs"), workdir=str(tmp_path))
+        await manager.start()
+        job = manager.submit("A Streamlit app writing to S3", **submit)
+        await manager.queue.join()
+        await manager.stop()
+        return manager, job
+
+    return asyncio.run(run())
+
+
+def test_job_runs_every_step_and_keeps_artifacts(tmp_path):
+    worker = FakeWorker(str(tmp_path))
+    manager, job = run_job(tmp_path, worker)
+
+    assert job.status == SUCCEEDED
+    assert worker.turns == ["A Streamlit app writing to S3", *ESTIMATION_STEPS.values()]
+    assert [r["response"] for r in job.results][0] == "ok: A Streamlit app writing to S3"
+    assert [a["name"] for a in job.artifacts] == ["aws_architecture.png"]
+    with open(manager.artifact_path(job, "aws_architecture.png"), "rb") as f:
+        assert f.read() == b"png"
+    assert manager.artifact_path(job, "other.png") is None
+    # the job had a session of its own, closed when it finished
+    assert (manager.pool.opened, manager.pool.open) == ([job.session_id], 0)
+
+
+def test_failed_job_keeps_partial_results(tmp_path):
+    worker = FakeWorker(str(tmp_path), fail_on="Generate the report.")
+    _, job = run_job(tmp_path, worker, messages=["Look up the price of S3", "Generate the report."])
+
+    assert job.status == FAILED
+    assert job.error == "worker exited"
+    assert job.to_dict()["progress"] == {"completed": 2, "total": 3}
+
+
+def test_any_error_fails_the_job_and_closes_its_session(tmp_path):
+    manager, job = run_job(tmp_path, FakeWorker(str(tmp_path)), messages=["Raise"])
+
+    assert job.status == FAILED
+    assert job.error == "KeyError('agent')"
+    assert job.finished_at is not None
+    assert manager.pool.open == 0
+
+
+def test_steps_follow_the_orchestrator_tools():
+    assert estimation_steps(os.path.join(SRC, "w2.py")) == list(ESTIMATION_STEPS.values())
+    assert estimation_steps(os.path.join(SRC, "workflows.py")) == [ESTIMATION_STEPS["emit_text_to_diagram"]]
@@ -0,0 +1,84 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from llama_index.core.llms import ChatMessage, MockLLM
+
+import llm_cache
+
+
+class CountingLLM(MockLLM):
+    calls: int = 0
+
+    def complete(self, prompt, formatted=False, **kwargs):
+        self.calls += 1
+        return super().complete(prompt, formatted=formatted, **kwargs)
+
+
+@pytest.fixture(autouse=True)
+def cache_dir(tmp_path, monkeypatch):
+    monkeypatch.setenv("LLM_CACHE_DIR", str(tmp_path))
+    monkeypatch.setenv("LLM_CACHE", "exact")
+    llm_cache.reset()
+    yield tmp_path
+    llm_cache.reset()
+
+
+def test_repeated_calls_hit_the_cache():
+    llm = llm_cache.cached_class(CountingLLM)()
+    assert isinstance(llm, CountingLLM)
+
+    first = llm.complete("draw the plan")
+    assert llm.complete("draw the plan").text == first.text
+    llm.complete("draw another plan")
+    messages = [ChatMessage(role="user", content="Hello!")]
+    reply = llm.chat(messages)
+    assert asyncio.run(llm.achat(messages)).message.content == reply.message.content
+
+    assert llm.calls == 3
+    assert llm_cache.stats()["hits"] == 2
+
+
+def test_entries_survive_a_restart_and_are_bounded(cache_dir, monkeypatch):
+    monkeypatch.setenv("LLM_CACHE_SIZE", "2")
+    llm = llm_cache.cached_class(CountingLLM)()
+    for prompt in ("a", "b", "c"):
+        llm.complete(prompt)
+    assert len(list(cache_dir.iterdir())) == 2
+
+    llm_cache.reset()
+    restarted = llm_cache.cached_class(CountingLLM)()
+    restarted.complete("c")
+    restarted.complete("a")
+    assert restarted.calls == 1
+    assert llm_cache.stats()["hit_rate"] == 0.5
+
+
+def test_temperature0_mode_skips_sampled_calls(monkeypatch):
+    monkeypatch.setenv("LLM_CACHE", "temperature0")
+    llm = llm_cache.cached_class(CountingLLM)()
+    llm.complete("x", temperature=0.7)
+    llm.complete("x", temperature=0.7)
+    llm.complete("x", temperature=0)
+    llm.complete("x", temperature=0)
+    llm.complete("x", temperature=0, n=3)
+    assert llm.calls == 4
+
+    # MockLLM has no temperature of its own, so nothing says the call is deterministic
+    llm.complete("y")
+    llm.complete("y")
+    assert llm.calls == 6
+
+    assert llm_cache.deterministic(SimpleNamespace(temperature=0, additional_kwargs={}), {})
+    assert not llm_cache.deterministic(SimpleNamespace(temperature=0, additional_kwargs={"temperature": 0.7}), {})
+    assert llm_cache.deterministic(SimpleNamespace(temperature=0.7, additional_kwargs={}), {"temperature": 0})
+
+
+def test_cache_is_off_by_default(monkeypatch):
+    monkeypatch.delenv("LLM_CACHE")
+    llm_cache.reset()
+    llm = llm_cache.cached_class(CountingLLM)()
+    llm.complete("x", temperature=0)
+    llm.complete("x", temperature=0)
+    assert llm.calls == 2
+    assert not llm_cache.enabled()
@@ -0,0 +1,33 @@
+import pytest
+
+import llm_registry
+
+
+@pytest.fixture(autouse=True)
+def fresh_registry():
+    llm_registry.reset()
+    yield
+    llm_registry.reset()
+
+
+def test_same_settings_share_one_llm():
+    first = llm_registry.get_llm("OpenAI", model="gpt-4o", temperature=0.8, api_key="test")
+    assert llm_registry.get_llm("OpenAI", model="gpt-4o", temperature=0.8, api_key="test") is first
+    assert llm_registry.get_llm("OpenAI", model="gpt-4o", temperature=0.2, api_key="test") is not first
+    assert llm_registry.stats() == {"llms": 2, "pools": 1, "hits": 1, "builds": 2}
+
+
+def test_llms_of_a_provider_share_the_connection_pool(monkeypatch):
+    monkeypatch.setenv("LLM_MAX_CONNECTIONS_ANTHROPIC", "3")
+    opus = llm_registry.get_llm("Anthropic", model="claude-3-opus-20240229", api_key="test")
+    haiku = llm_registry.get_llm("Anthropic", model="claude-3-haiku-20240307", api_key="test")
+    sync_pool, async_pool = llm_registry.http_clients("Anthropic")
+
+    assert opus._client._client is sync_pool is haiku._client._client
+    assert opus._aclient._client is async_pool
+    assert sync_pool._transport._pool._max_connections == 3
+
+
+def test_unknown_provider():
+    with pytest.raises(ValueError):
+        llm_registry.get_llm("Nope", model="x")
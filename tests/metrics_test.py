@@ -0,0 +1,62 @@
+from llama_index.core.tools import FunctionTool
+
+import metrics
+
+
+def test_histogram_renders_cumulative_buckets():
+    registry = metrics.Registry()
+    histogram = registry.histogram("step_seconds", "Step time", ["step"], buckets=(1, 5))
+    histogram.observe(0.5, step="orchestrator")
+    histogram.observe(3, step="orchestrator")
+    histogram.observe(30, step="orchestrator")
+
+    lines = registry.render().splitlines()
+    assert 'step_seconds_bucket{step="orchestrator",le="1"} 1' in lines
+    assert 'step_seconds_bucket{step="orchestrator",le="5"} 2' in lines
+    assert 'step_seconds_bucket{step="orchestrator",le="+Inf"} 3' in lines
+    assert 'step_seconds_count{step="orchestrator"} 3' in lines
+    assert 'step_seconds_sum{step="orchestrator"} 33.5' in lines
+
+
+def test_merge_adds_only_the_change_since_the_last_snapshot():
+    worker, parent = metrics.Registry(), metrics.Registry()
+    for registry in (worker, parent):
+        registry.counter("llm_calls_total", "calls", ["provider"])
+    calls = worker.metrics["llm_calls_total"]
+
+    calls.inc(2, provider="openai")
+    first = worker.snapshot()
+    parent.merge(first)
+    calls.inc(provider="openai")
+    parent.merge(worker.snapshot(), first)
+
+    assert parent.metrics["llm_calls_total"].get(provider="openai") == 3
+
+
+def test_token_usage_reads_openai_and_anthropic_shapes():
+    class Usage:
+        prompt_tokens = 12
+        completion_tokens = 30
+
+    class OpenAIRaw:
+        usage = Usage()
+
+    class Response:
+        def __init__(self, raw):
+            self.raw = raw
+
+    assert metrics.token_usage(Response(OpenAIRaw())) == (12, 30)
+    assert metrics.token_usage(Response({"usage": {"input_tokens": 7, "output_tokens": 9}})) == (7, 9)
+    assert metrics.token_usage(Response(None)) == (0, 0)
+
+
+def test_timed_tool_keeps_the_tool_schema():
+    def lookup_price(service: str, region: str = "us-east-1") -> str:
+        """Look up the price of an AWS service."""
+        return f"{service} in {region}"
+
+    tool = FunctionTool.from_defaults(fn=metrics.timed_tool(lookup_price, agent="price_lookup"))
+    assert tool.metadata.name == "lookup_price"
+    assert set(tool.metadata.get_parameters_dict()["properties"]) == {"service", "region"}
+    assert tool(service="S3").content == "S3 in us-east-1"
+    assert metrics.TOOL_SECONDS.count(agent="price_lookup", tool="lookup_price") == 1
@@ -0,0 +1,21 @@
+from pricingAgent import service_code_for, service_codes_in_code
+
+
+def test_service_code_uses_the_longest_matching_node_name():
+    assert service_code_for("EC2ContainerRegistry") == "AmazonECR"
+    assert service_code_for("EC2Instance") == "AmazonEC2"
+    assert service_code_for("Diagram") is None
+
+
+def test_service_codes_in_code_lists_each_service_once():
+    code = '''
+from diagrams import Cluster, Diagram
+from diagrams.aws.compute import EC2
+from diagrams.aws.storage import S3
+
+with Diagram("web", show=False):
+    with Cluster("app"):
+        web = [EC2("a"), EC2("b")]
+    web >> S3("assets")
+'''
+    assert service_codes_in_code(code) == ["AmazonEC2", "AmazonS3"]
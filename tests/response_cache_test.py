@@ -0,0 +1,57 @@
+import os
+
+from response_cache import ResponseCache, cache_key
+
+
+def test_key_ignores_whitespace_and_case_but_not_settings():
+    key = cache_key([("user", "Build me an AWS app")], model="gpt-4", temperature=0)
+    assert key == cache_key([("user", "  build me  an aws APP\n")], model="gpt-4", temperature=0)
+    assert key != cache_key([("user", "Build me an AWS app")], model="gpt-4o", temperature=0)
+    assert key != cache_key([("system", "Build me an AWS app")], model="gpt-4", temperature=0)
+
+
+def test_replies_are_not_shared_between_sessions():
+    messages = [("user", "Build me an AWS app")]
+    key = cache_key(messages, session_id="alice", model="gpt-4", temperature=0)
+    assert key == cache_key(messages, session_id="alice", model="gpt-4", temperature=0)
+    assert key != cache_key(messages, session_id="bob", model="gpt-4", temperature=0)
+
+
+def test_cache_is_off_unless_configured(monkeypatch):
+    monkeypatch.delenv("RESPONSE_CACHE_SIZE", raising=False)
+    assert not ResponseCache.from_env().enabled
+    monkeypatch.setenv("RESPONSE_CACHE_SIZE", "16")
+    assert ResponseCache.from_env().enabled
+
+
+def test_memory_cache_evicts_least_recently_used():
+    cache = ResponseCache(max_entries=2)
+    cache.set("a", "A")
+    cache.set("b", "B")
+    assert cache.get("a") == "A"
+    cache.set("c", "C")
+
+    assert cache.get("b") is None
+    assert cache.get("a") == "A"
+    assert cache.stats()["evictions"] == 1
+    assert (cache.stats()["hits"], cache.stats()["misses"]) == (2, 1)
+
+
+def test_disk_cache_survives_restart(tmp_path):
+    cache = ResponseCache(max_entries=2, directory=str(tmp_path))
+    cache.set("a", "A")
+    cache.set("b", "B")
+    cache.set("c", "C")
+    assert sorted(os.listdir(tmp_path)) == ["b.json", "c.json"]
+
+    reopened = ResponseCache(max_entries=2, directory=str(tmp_path))
+    assert reopened.get("c") == "C"
+    assert reopened.get("a") is None
+
+
+def test_expired_entries_are_misses():
+    cache = ResponseCache(max_entries=2, ttl=60)
+    cache.set("a", "A")
+    cache.backend.entries["a"]["created"] -= 120
+    assert cache.get("a") is None
+    assert len(cache.backend) == 0
@@ -0,0 +1,36 @@
+import pytest
+
+import sandbox
+
+
+@pytest.fixture(scope="module")
+def pool():
+    pool = sandbox.SandboxPool(size=1, max_jobs=3, timeout=5, memory_mb=0)
+    yield pool
+    pool.shutdown()
+
+
+def test_runs_code_in_a_warm_worker(pool, tmp_path):
+    result = pool.run("import os\nprint(EC2.__name__, os.getpid())\nopen('out.txt', 'w').write('x')", tmp_path)
+    assert result.ok
+    name, pid = result.stdout.split()
+    assert name == "EC2" and int(pid) != __import__("os").getpid()
+    assert result.files == ["out.txt"]
+    assert (tmp_path / "out.txt").read_text() == "x"
+
+    failed = pool.run("raise ImportError('No module named diagrams.aws.nope')", tmp_path)
+    assert failed.returncode == 1
+    assert failed.stderr.strip().endswith("ImportError: No module named diagrams.aws.nope")
+
+
+def test_timeouts_and_recycling(pool, tmp_path):
+    stuck = pool.run("while True:\n    try:\n        pass\n    except Exception:\n        pass", tmp_path, timeout=0.2)
+    assert stuck.timed_out and not stuck.ok
+
+    with pytest.raises(sandbox.SandboxError):
+        pool.run("import os, signal\nos.kill(os.getpid(), signal.SIGKILL)", tmp_path)
+    assert pool.run("print('replaced')", tmp_path).stdout == "replaced\n"
+    for _ in range(3):
+        pool.run("pass", tmp_path)
+    stats = pool.stats()
+    assert stats["killed"] == 1 and stats["recycled"] >= 2 and stats["timeouts"] == 1
@@ -0,0 +1,89 @@
+import asyncio
+import time
+
+import pytest
+
+from inprocess import WorkflowSession
+from session_store import SessionStore, snapshot_state
+from worker_pool import SessionMovedError
+
+
+class FakeSession:
+    def __init__(self, session_id, state):
+        self.session_id = session_id
+        self.data = dict(state or {"history": []})
+        self.lock = asyncio.Lock()
+        self.last_used = time.time()
+        self.stopped = False
+
+    def snapshot(self):
+        return snapshot_state(self.data)
+
+    async def stop(self):
+        self.stopped = True
+
+
+def test_lru_eviction_spills_and_restores(tmp_path):
+    async def run():
+        store = SessionStore(FakeSession, max_sessions=2, spill_dir=str(tmp_path))
+        a = store.get("a")
+        a.data["history"].append("draw a web app")
+        store.get("b")
+        store.get("a")
+        store.get("c")  # evicts b, the least recently used
+        assert set(store.sessions) == {"a", "c"}
+
+        store.get("d")  # evicts a
+        await asyncio.sleep(0)
+        assert a.stopped
+        restored = store.get("a")
+        return store, restored
+
+    store, restored = asyncio.run(run())
+    assert restored.data["history"] == ["draw a web app"]
+    assert store.stats()["evictions"]["lru"] == 3
+    assert store.stats()["restores"] == 1
+    assert len(store) == 2
+
+
+def test_busy_sessions_are_not_evicted():
+    async def run():
+        store = SessionStore(FakeSession, max_sessions=1, idle_ttl=10)
+        busy = store.get("busy")
+        async with busy.lock:
+            store.get("other")
+            store.sweep(now=time.time() + 60)
+            return store
+
+    store = asyncio.run(run())
+    assert list(store.sessions) == ["busy"]
+    assert store.stats()["evictions"] == {"lru": 0, "ttl": 1}
+
+
+def test_a_turn_waiting_on_an_evicted_session_moves():
+    async def run():
+        store = SessionStore(lambda session_id, state: WorkflowSession(session_id, None, state), max_sessions=1)
+        session = store.get("a")
+        await session.lock.acquire()  # a turn in progress
+        waiting = asyncio.create_task(session.send_turn("hello"))
+        await asyncio.sleep(0)
+        session.lock.release()
+        store.get("b")  # evicts a before the waiting turn gets the lock
+        with pytest.raises(SessionMovedError):
+            await waiting
+        return session
+
+    assert asyncio.run(run()).closed
+
+
+def test_spill_dir_defaults_to_a_state_dir(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.delenv("SESSION_SPILL_DIR", raising=False)
+    assert SessionStore.from_env(FakeSession).spill_dir == ".sessions"
+    monkeypatch.setenv("SESSION_SPILL_DIR", "off")
+    assert SessionStore.from_env(FakeSession).spill_dir is None
+
+
+def test_snapshot_state_skips_live_objects():
+    data = {"history": {"report": []}, "requirements": "S3", "llm": object(), "concierge": object()}
+    assert snapshot_state(data) == {"history": {"report": []}, "requirements": "S3"}
@@ -0,0 +1,36 @@
+import json
+
+import symbol_index
+
+
+def test_resolves_classes_aliases_and_misspellings_across_providers():
+    index = symbol_index.load()
+    assert index.resolve("ECS").statement == "from diagrams.aws.compute import ECS"
+    assert index.resolve("ElasticLoadBalancer") == symbol_index.Symbol("diagrams.aws.network", "ELB")
+    assert index.resolve("Cloudfront") == symbol_index.Symbol("diagrams.aws.network", "CloudFront")
+    assert index.resolve("ElastiCach").name == "ElastiCache"
+    assert index.resolve("GKE").module == "diagrams.gcp.compute"
+    assert index.resolve("Pod").module == "diagrams.k8s.compute"
+    assert index.resolve("Functions", provider="diagrams.gcp").module == "diagrams.gcp.compute"
+    assert index.aliases["ELB"] == "ElasticLoadBalancing"
+    assert index.resolve("NothingLikeAnyNode") is None
+
+
+def test_index_is_saved_and_rebuilt_when_the_package_changes(tmp_path, monkeypatch):
+    path = tmp_path / "index.json"
+    monkeypatch.setenv("SYMBOL_INDEX_PATH", str(path))
+    symbol_index.load.cache_clear()
+    try:
+        built = symbol_index.load()
+        saved = json.loads(path.read_text())
+        assert saved["key"] == symbol_index._version_key()
+
+        symbol_index.load.cache_clear()
+        assert symbol_index.load().modules == built.modules
+
+        path.write_text(json.dumps({**saved, "key": "older", "modules": {"diagrams": []}}))
+        symbol_index.load.cache_clear()
+        assert symbol_index.load().modules == built.modules
+        assert json.loads(path.read_text())["key"] == saved["key"]
+    finally:
+        symbol_index.load.cache_clear()
@@ -0,0 +1,41 @@
+import asyncio
+import json
+
+from llama_index.core.llms import MockLLM
+from llama_index.core.workflow import Context, StartEvent, StopEvent, Workflow, step
+
+import tracing
+
+
+class ToolWorkflow(Workflow):
+    @step(pass_context=True)
+    async def answer(self, ctx: Context, ev: StartEvent) -> StopEvent:
+        async def lookup_price(name: str) -> str:
+            return str(await MockLLM().acomplete(f"price of {name}"))
+
+        tool = tracing.traced(lookup_price, agent="price_lookup")
+        return StopEvent(result=await tool(name="EC2"))
+
+
+def test_spans_nest_and_convert_to_chrome_format(tmp_path):
+    path = tmp_path / "trace.jsonl"
+    tracing.install(str(path))
+    try:
+        async def run():
+            return await ToolWorkflow(timeout=10).run()
+
+        asyncio.run(run())
+    finally:
+        tracing.shutdown()
+
+    spans = {s["name"]: s for s in map(json.loads, path.read_text().splitlines())}
+    run, step_, tool, llm = (spans[name] for name in
+                             ("Workflow.run", "ToolWorkflow.answer", "lookup_price", "CustomLLM.acomplete"))
+    assert [s["kind"] for s in (run, step_, tool, llm)] == ["workflow", "step", "tool", "llm"]
+    assert all(s["status"] == "ok" for s in spans.values())
+    assert (step_["parent"], tool["parent"], llm["parent"]) == (run["id"], step_["id"], tool["id"])
+    assert tool["in_bytes"] > 0 and llm["out_bytes"] > 0 and "tokens" in llm
+    assert step_["start"] <= tool["start"] <= tool["end"] <= step_["end"]
+
+    chrome = tracing.to_chrome(path.read_text().splitlines())
+    assert {event["tid"] for event in chrome["traceEvents"]} == {1}
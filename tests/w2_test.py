@@ -0,0 +1,79 @@
+import asyncio
+
+import pytest
+
+from input_provider import InputProvider
+
+
+class ScriptedInputProvider(InputProvider):
+    """Types `messages` one per prompt and keeps the replies."""
+
+    def __init__(self, messages):
+        self.messages = list(messages)
+        self.replies = []
+
+    def respond(self, text):
+        self.replies.append(text)
+
+    async def ask(self, prompt="> "):
+        if not self.messages:
+            raise EOFError("no more messages")
+        return self.messages.pop(0)
+
+
+@pytest.fixture
+def w2(monkeypatch, tmp_path):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("OPENAI_API_KEY", "test")
+    for name in ("WORKFLOW_CHECKPOINT_ID", "LLM_CASSETTE", "RAGFORMATION_IPC"):
+        monkeypatch.delenv(name, raising=False)
+    import w2
+    import sandbox
+
+    async def greet(agent, message, respond):
+        respond("Hello")
+
+    # no LLM for the concierge's greetings and no sandbox workers to warm
+    monkeypatch.setattr(w2, "stream_reply", greet)
+    monkeypatch.setattr(sandbox, "pool", lambda: None)
+    return w2
+
+
+def test_main_runs_until_the_user_exits(w2, monkeypatch):
+    provider = ScriptedInputProvider(["exit"])
+    monkeypatch.setattr(w2.cassette, "input_provider", lambda: provider)
+
+    asyncio.run(asyncio.wait_for(w2.main(), 30))
+    assert provider.messages == []
+    assert provider.replies == ["Hello"]
+
+
+def test_go_ahead_after_the_requirements_are_gathered_skips_the_llm(w2, monkeypatch, capsys):
+    provider = ScriptedInputProvider(["yes, go ahead"])
+
+    async def search(requirements):
+        return {}
+
+    async def draw(requirements):
+        return "Diagram generated successfully"
+
+    class NoOrchestrator:
+        @staticmethod
+        def from_tools(**kwargs):
+            raise AssertionError("the orchestrator LLM was asked")
+
+    monkeypatch.setattr(w2, "acall_rag_endpoint", search)
+    monkeypatch.setattr(w2, "draw_text_to_diagram", draw)
+    monkeypatch.setattr(w2, "service_codes_in_text", lambda text: [])
+    monkeypatch.setattr(w2, "FunctionCallingAgentWorker", NoOrchestrator)
+
+    async def run():
+        workflow = w2.ConciergeWorkflow(timeout=30)
+        # the RAG agent gathered the requirements; the run stops at the report's question
+        with pytest.raises(EOFError):
+            await workflow.run(input_provider=provider, session_state={"requirements": "A Streamlit app on S3"})
+
+    asyncio.run(run())
+    out = capsys.readouterr().out
+    assert "Routed locally to estimate (classifier" in out
+    assert "Estimate received requirements: A Streamlit app on S3" in out
@@ -0,0 +1,49 @@
+import asyncio
+
+import pytest
+
+from worker_pool import SessionMovedError, WorkerPool, WorkflowWorker
+
+
+def make_pool(size):
+    pool = WorkerPool(size=size, script="workflow.py")
+    for worker_id in range(size):
+        pool.workers[worker_id] = WorkflowWorker(worker_id, "workflow.py")
+    return pool
+
+
+def test_every_session_gets_a_worker_of_its_own():
+    async def run():
+        pool = make_pool(2)
+        assert [pool.worker_for(sid).worker_id for sid in ("a", "b", "a")] == [0, 1, 0]
+
+        # no free worker: b is the least recently used, so its worker is restarted for c
+        worker = pool.worker_for("c")
+        assert (worker.worker_id, worker.session_id, worker.stale) == (1, "c", True)
+        assert dict(pool.sessions) == {"a": 0, "c": 1}
+        with pytest.raises(SessionMovedError):
+            await worker.send_turn("hello", "b")
+
+        # a busy session is passed over for an idle one
+        async with pool.workers[0].lock:
+            assert pool.worker_for("d").worker_id == 1
+        assert dict(pool.sessions) == {"a": 0, "d": 1}
+        assert pool.status()["evictions"] == 2
+
+    asyncio.run(run())
+
+
+def test_the_session_of_a_dead_worker_ends():
+    async def run():
+        pool = make_pool(1)
+        worker = pool.worker_for("a")
+
+        async def restart():
+            worker.restarts += 1
+
+        worker.restart = restart
+        await pool.check_health()
+        assert (dict(pool.sessions), worker.session_id, worker.restarts) == ({}, None, 1)
+        assert pool.worker_for("b") is worker and not worker.stale
+
+    asyncio.run(run())